@@ -0,0 +1,272 @@
+#!/usr/bin/env python
+# Licensed under a 3-clause BSD style license - see LICENSE.rst
+"""
+Run the ARC ingest and render tasks from a single long-running process.
+
+The ``arc`` task in ``task_schedule.cfg`` starts a new interpreter for each of the
+Python scripts every few minutes, so each run pays to import astropy, tables,
+matplotlib and kadi before doing a second or two of work.  This daemon reads the same
+task definition and runs the steps on the same schedule, but calls ``main()`` of each
+Python script in this process so the imported modules stay loaded between cycles.
+Perl scripts are run as subprocesses exactly as before.
+
+Before the steps of each cycle run, a single fetch stage downloads the external
+sources of all the Python steps due in that cycle concurrently (see ``arc_fetch``).
+A script declares its sources with an optional ``get_fetchers(sys_args)`` function and then
+gets the prefetched payloads from ``arc_fetch`` in place of downloading them itself.
+
+Each step is isolated: an exception, ``sys.exit()`` or timeout in one step is
+reported and the remaining steps still run.  The task ``timeout`` (or the default
+``timeout`` of the config file) is applied to each step.
+
+Example::
+
+  arc_daemon.py --config $SKA_SHARE/arc3/task_schedule.cfg >> $SKA_DATA/arc3/Logs/arc.log
+"""
+
+import argparse
+import importlib
+import os
+import re
+import shlex
+import signal
+import subprocess
+import sys
+import time
+import traceback
+from dataclasses import dataclass
+from pathlib import Path
+
+import arc_fetch
+
+ARC_SHARE = Path(__file__).parent
+
+
+class TaskTimeoutError(Exception):
+    pass
+
+
+@dataclass
+class Step:
+    """One ``exec <every> : <cmd>`` line of a task definition."""
+
+    every: int
+    cmd: str
+
+    @property
+    def args(self):
+        return shlex.split(self.cmd)
+
+    @property
+    def name(self):
+        return Path(self.args[0]).name
+
+    @property
+    def module_name(self):
+        """Module name if this is one of the ARC Python scripts, else None"""
+        path = Path(self.args[0])
+        if path.suffix == ".py" and (ARC_SHARE / path.name).exists():
+            return path.stem
+        return None
+
+
+def get_options(sys_args=None):
+    parser = argparse.ArgumentParser(
+        description="Run ARC tasks in a single long-running process"
+    )
+    parser.add_argument(
+        "--config",
+        default=str(ARC_SHARE / "task_schedule.cfg"),
+        help="Task schedule config file (default=task_schedule.cfg in install dir)",
+    )
+    parser.add_argument(
+        "--task", default="arc", help="Task name in config file (default=arc)"
+    )
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=60.0,
+        help="Seconds between task executions (default=60, i.e. cron '* * * * *')",
+    )
+    parser.add_argument(
+        "--max-cycles",
+        type=int,
+        help=(
+            "Exit after this many task executions, e.g. to have a supervisor restart "
+            "the daemon daily to pick up code updates (default=run forever)"
+        ),
+    )
+    return parser.parse_args(sys_args)
+
+
+def interpolate_env(text):
+    """Replace $ENV{VAR} in ``text`` with the value of environment variable VAR."""
+    return re.sub(r"\$ENV\{(\w+)\}", lambda match: os.environ[match.group(1)], text)
+
+
+def read_task_config(filename, task_name):
+    """
+    Read the steps and timeout for ``task_name`` from a task_schedule config file.
+
+    Parameters
+    ----------
+    filename : str or Path
+        task_schedule.cfg file
+    task_name : str
+        Name of the task, e.g. "arc"
+
+    Returns
+    -------
+    steps : list of Step
+        Steps of the task in order
+    timeout : float
+        Maximum time (secs) for each step
+    """
+    timeout = None
+    task_timeout = None
+    steps = []
+    in_task = False
+    depth = 0
+
+    for line in Path(filename).read_text().splitlines():
+        line = line.split("#", 1)[0].strip()  # noqa: PLW2901
+        if not line:
+            continue
+        if match := re.match(r"<task\s+(\S+)>", line):
+            in_task = match.group(1) == task_name
+            continue
+        if line == "</task>":
+            in_task = False
+            continue
+        if in_task and re.match(r"</\w+>", line):
+            depth -= 1
+            continue
+        if in_task and re.match(r"<\w+>", line):
+            depth += 1
+            continue
+
+        key, _, value = line.partition(" ")
+        value = value.strip()
+        if not in_task:
+            if key == "timeout":
+                timeout = float(value)
+        elif depth == 0:
+            if key == "timeout":
+                task_timeout = float(value)
+            elif key == "exec":
+                match = re.match(r"(\d+)\s*:\s*(.+)", value)
+                every, cmd = (
+                    (int(match.group(1)), match.group(2)) if match else (1, value)
+                )
+                steps.append(Step(every, interpolate_env(cmd)))
+
+    if not steps:
+        raise ValueError(f"no exec steps found for task {task_name} in {filename}")
+
+    return steps, task_timeout or timeout or 300.0
+
+
+def _raise_timeout(_signum, _frame):
+    raise TaskTimeoutError
+
+
+def run_python_step(step, timeout):
+    """Run ``main()`` of the step module in this process, limited to ``timeout``."""
+    old_handler = signal.signal(signal.SIGALRM, _raise_timeout)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        module = importlib.import_module(step.module_name)
+        module.main(step.args[1:])
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, old_handler)
+        # Release figures so they do not accumulate in the persistent process
+        if "matplotlib.pyplot" in sys.modules:
+            sys.modules["matplotlib.pyplot"].close("all")
+
+
+def run_subprocess_step(step, timeout):
+    """Run the step as a subprocess, limited to ``timeout``."""
+    try:
+        proc = subprocess.run(step.args, timeout=timeout, check=False)
+    except subprocess.TimeoutExpired:
+        raise TaskTimeoutError from None
+    if proc.returncode != 0:
+        print(f"Warning: {step.name} exited with status {proc.returncode}")
+
+
+def run_fetch_stage(steps):
+    """Concurrently prefetch the external sources of the Python ``steps``."""
+    fetchers = {}
+    for step in steps:
+        if step.module_name is None:
+            continue
+        try:
+            module = importlib.import_module(step.module_name)
+        except Exception:
+            # Import failures are reported when the step itself is run
+            continue
+        if not hasattr(module, "get_fetchers"):
+            continue
+        # A failure here (e.g. bad arguments or a corrupt feed state file) only
+        # skips the prefetch for this step, which then fetches its own sources.
+        try:
+            fetchers.update(module.get_fetchers(step.args[1:]))
+        except KeyboardInterrupt:
+            raise
+        except BaseException:
+            print(f"Warning: {step.name} get_fetchers failed, skipping its prefetch:")
+            traceback.print_exc(file=sys.stdout)
+
+    dt = arc_fetch.prefetch(fetchers)
+    print(f"  fetched {len(fetchers)} sources in {dt:.2f} secs")
+
+
+def run_step(step, timeout):
+    """Run one step, reporting (but not raising) any failure."""
+    time0 = time.time()
+    try:
+        if step.module_name is not None:
+            run_python_step(step, timeout)
+        else:
+            run_subprocess_step(step, timeout)
+    except TaskTimeoutError:
+        print(f"Warning: {step.name} timed out after {timeout:.0f} secs")
+    except SystemExit as err:
+        # The scripts use sys.exit(0) after printing a warning about bad input data
+        if err.code not in (None, 0):
+            print(f"Warning: {step.name} exited with status {err.code}")
+    except Exception:
+        print(f"Warning: {step.name} failed with exception:")
+        traceback.print_exc(file=sys.stdout)
+    finally:
+        sys.stdout.flush()
+    return time.time() - time0
+
+
+def main(sys_args=None):
+    opt = get_options(sys_args)
+    steps, timeout = read_task_config(opt.config, opt.task)
+
+    # Make the ARC scripts importable by module name
+    sys.path.insert(0, str(ARC_SHARE))
+
+    count = 0
+    while opt.max_cycles is None or count < opt.max_cycles:
+        cycle_start = time.time()
+        print(f"*** {time.strftime('%Y-%m-%d %H:%M:%S')} {opt.task} cycle {count}")
+        due_steps = [step for step in steps if count % step.every == 0]
+        run_fetch_stage(due_steps)
+        for step in due_steps:
+            dt = run_step(step, timeout)
+            print(f"  {step.name} completed in {dt:.2f} secs")
+        arc_fetch.clear_prefetched()
+        sys.stdout.flush()
+        count += 1
+
+        if opt.max_cycles is None or count < opt.max_cycles:
+            time.sleep(max(0.0, opt.interval - (time.time() - cycle_start)))
+
+
+if __name__ == "__main__":
+    main()
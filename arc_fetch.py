@@ -0,0 +1,405 @@
+# Licensed under a 3-clause BSD style license - see LICENSE.rst
+"""
+Fetch ARC input data from external web sources.
+
+HTTP(S) requests go through one shared ``requests.Session`` so connections to the same
+host (e.g. services.swpc.noaa.gov for the GOES X-ray and proton feeds) are kept alive
+and reused.  FTP URLs (the ACE EPAM list) are fetched with ``urllib``.
+
+The ``prefetch()`` function runs a set of fetches concurrently in a thread pool and
+holds the results.  A later ``fetch_url()`` or ``get_prefetched()`` call for the same
+key returns the prefetched result (once) instead of downloading again, so the existing
+parsers in the ``get_*.py`` scripts and ``make_timeline.py`` work unchanged whether or
+not a fetch stage was run first.  ``arc_daemon.py`` uses this to download all the
+sources of one cycle at the same time.
+
+``read_json_records()`` parses a JSON array of records incrementally so that the
+time-ordered SWPC feeds can be cut off at the last archived time without building
+Python objects for the whole file.
+
+``FeedState`` adds conditional GET (ETag / Last-Modified) and a content hash per URL so
+the fetch scripts can skip parsing and archiving a feed that has not changed since the
+last successful run.
+"""
+
+import codecs
+import concurrent.futures
+import functools
+import hashlib
+import itertools
+import json
+import re
+import threading
+import time
+import typing
+import urllib.request
+from pathlib import Path
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Maximum number of concurrent fetches and of pooled connections per host
+MAX_WORKERS = 8
+
+_session = None
+_session_lock = threading.Lock()
+_prefetched = {}
+_prefetched_lock = threading.Lock()
+_MISSING = object()
+
+
+class Payload(typing.NamedTuple):
+    """HTTP status, content and response headers of one fetch"""
+
+    status: int
+    content: bytes
+    headers: typing.Mapping
+
+
+# Chunk size (bytes) for incremental JSON parsing
+JSON_CHUNK_SIZE = 65536
+_WHITESPACE = re.compile(r"\s*")
+
+
+def get_session():
+    """Get the shared keep-alive ``requests.Session``."""
+    global _session  # noqa: PLW0603
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=MAX_WORKERS, pool_maxsize=MAX_WORKERS
+            )
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+    return _session
+
+
+def _fetch_url(url, timeout, headers=None):
+    if url.startswith("ftp://"):
+        with urllib.request.urlopen(url, timeout=timeout) as urlob:
+            return Payload(200, urlob.read(), {})
+
+    response = get_session().get(url, timeout=timeout, headers=headers)
+    response.raise_for_status()
+    return Payload(response.status_code, response.content, response.headers)
+
+
+def fetch_url(url, tries=3, delay=5.0, timeout=60.0):
+    """
+    Get the content of ``url``, or the prefetched content if available.
+
+    Parameters
+    ----------
+    url : str
+        URL (http, https or ftp)
+    tries : int
+        Number of attempts before giving up
+    delay : float
+        Seconds to wait between attempts
+    timeout : float
+        Timeout (secs) for connecting and for each read
+
+    Returns
+    -------
+    content : bytes
+        Content of ``url``
+    """
+    return get_prefetched(url, _fetch_content, url, tries, delay, timeout)
+
+
+def _fetch_content(url, tries, delay, timeout):
+    return _fetch_url_retry(url, tries, delay, timeout).content
+
+
+def _fetch_url_retry(url, tries, delay, timeout, headers=None):
+    for itry in range(tries):
+        try:
+            return _fetch_url(url, timeout, headers)
+        except Exception:
+            if itry == tries - 1:
+                raise
+            time.sleep(delay)
+
+
+def get_prefetched(key, func, *args, **kwargs):
+    """
+    Get the prefetched result for ``key``, or else call ``func(*args, **kwargs)``.
+
+    A prefetched result is returned only once.  If the prefetch raised an exception
+    then that exception is raised here.
+    """
+    with _prefetched_lock:
+        result = _prefetched.pop(key, _MISSING)
+    if result is _MISSING:
+        return func(*args, **kwargs)
+    if isinstance(result, Exception):
+        raise result
+    return result
+
+
+def prefetch(fetchers, max_workers=MAX_WORKERS):
+    """
+    Run ``fetchers`` concurrently and hold the results for ``get_prefetched()``.
+
+    Parameters
+    ----------
+    fetchers : dict
+        Key (normally the URL) and the function with no arguments that fetches it
+    max_workers : int
+        Maximum number of concurrent fetches
+
+    Returns
+    -------
+    dt : float
+        Wall-clock time (secs) for all fetches
+    """
+    time0 = time.time()
+    if not fetchers:
+        return 0.0
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {key: executor.submit(func) for key, func in fetchers.items()}
+
+    with _prefetched_lock:
+        for key, future in futures.items():
+            try:
+                _prefetched[key] = future.result()
+            except Exception as err:
+                _prefetched[key] = err
+
+    return time.time() - time0
+
+
+def url_fetchers(urls):
+    """Make a ``prefetch()`` fetchers dict for plain ``fetch_url()`` of ``urls``."""
+    return {url: functools.partial(fetch_url, url) for url in urls}
+
+
+def clear_prefetched():
+    """Drop any prefetched results that were not used."""
+    with _prefetched_lock:
+        _prefetched.clear()
+
+
+def iter_json_array(chunks):
+    """
+    Iterate over the elements of a JSON array supplied as chunks of UTF-8 bytes.
+
+    Elements are decoded one at a time as soon as they are complete, so the full text
+    is never decoded and the elements are never all in memory at once.  The elements
+    must be JSON objects or arrays (as for the SWPC feeds) so that an element at the end
+    of a chunk cannot be mistaken for a complete value.
+
+    Parameters
+    ----------
+    chunks : iterable of bytes
+        Successive pieces of the JSON text
+
+    Yields
+    ------
+    element : dict or list
+        Decoded array element
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder("utf-8")()
+    buf = ""
+    started = False
+    finished = False
+
+    for chunk in itertools.chain(chunks, [None]):
+        if chunk is None:
+            buf += text_decoder.decode(b"", final=True)
+        else:
+            buf += text_decoder.decode(chunk)
+        pos = 0
+        while not finished:
+            pos = _WHITESPACE.match(buf, pos).end()
+            if pos == len(buf):
+                break
+            if not started:
+                if buf[pos] != "[":
+                    raise ValueError("JSON text is not an array")
+                started = True
+                pos += 1
+                continue
+            if buf[pos] == "]":
+                finished = True
+                break
+            if buf[pos] == ",":
+                pos += 1
+                continue
+            try:
+                element, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if chunk is None:
+                    raise
+                break  # Incomplete element, get more text
+            yield element
+            pos = end
+        buf = buf[pos:]
+        if finished:
+            return
+
+    raise ValueError("JSON array is not terminated")
+
+
+def read_json_records(content, time_after=None, time_key="time_tag"):
+    """
+    Read time-tagged records from a JSON array, keeping only those after a time.
+
+    The text is parsed incrementally (see ``iter_json_array``) and each record is
+    dropped as soon as it is read if its ``time_key`` value is at or before
+    ``time_after``, so memory scales with the number of new records rather than with
+    the size of ``content``.
+
+    Parameters
+    ----------
+    content : bytes
+        JSON text of an array of records (dicts)
+    time_after : str or None
+        Keep records with ``record[time_key] > time_after``.  Time tags are compared as
+        strings so this must have the same ISO format as the records.  If None then all
+        records are kept.
+    time_key : str
+        Record key of the time tag
+
+    Returns
+    -------
+    records : list of dict
+        Records after ``time_after``
+    n_records : int
+        Total number of records in ``content``
+    first_time : str or None
+        Time tag of the first record in ``content`` (None if there are no records)
+    """
+    # Chunks are views of ``content`` so they are not copied
+    view = memoryview(content)
+    chunks = (
+        view[ii : ii + JSON_CHUNK_SIZE] for ii in range(0, len(view), JSON_CHUNK_SIZE)
+    )
+    records = []
+    n_records = 0
+    first_time = None
+    for record in iter_json_array(chunks):
+        if n_records == 0:
+            first_time = record[time_key]
+        n_records += 1
+        if time_after is None or record[time_key] > time_after:
+            records.append(record)
+
+    return records, n_records, first_time
+
+
+class FeedState:
+    """
+    Conditional GET headers, content hash and skip counts for feeds.
+
+    The state is kept in a JSON file (one per archive) as a dict keyed by URL.  Use
+    ``fetch()`` to get new content and ``save()`` once it has been successfully
+    processed, so a failed run does not mark the content as already seen::
+
+      feed_state = FeedState("GOES_X.feed_state.json")
+      content = feed_state.fetch(url)
+      if content is None:
+          ...  # unchanged since the last run, nothing to do
+      ...
+      feed_state.save()
+
+    Parameters
+    ----------
+    filename : str or Path
+        JSON state file
+    force : bool
+        Always return the content, even if unchanged (default=False)
+    """
+
+    def __init__(self, filename, force=False):
+        self.filename = Path(filename)
+        self.force = force
+        self.state = (
+            json.loads(self.filename.read_text()) if self.filename.exists() else {}
+        )
+        self.pending = {}
+
+    def _request_headers(self, url):
+        entry = self.state.get(url, {})
+        headers = {}
+        if not self.force:
+            if etag := entry.get("etag"):
+                headers["If-None-Match"] = etag
+            if last_modified := entry.get("last_modified"):
+                headers["If-Modified-Since"] = last_modified
+        return headers
+
+    def fetchers(self, urls):
+        """Make a ``prefetch()`` fetchers dict for conditional fetches of ``urls``."""
+        return {
+            (url, "conditional"): functools.partial(
+                _fetch_url_retry, url, 3, 5.0, 60.0, self._request_headers(url)
+            )
+            for url in urls
+        }
+
+    def fetch(self, url, tries=3, delay=5.0, timeout=60.0):
+        """
+        Get the content of ``url`` if it changed since the last saved state.
+
+        This sends the stored ETag / Last-Modified values as a conditional GET and
+        compares the SHA-256 hash of the content to the stored hash.
+
+        Returns
+        -------
+        content : bytes or None
+            Content of ``url``, or None if it is unchanged
+        """
+        payload = get_prefetched(
+            (url, "conditional"),
+            _fetch_url_retry,
+            url,
+            tries,
+            delay,
+            timeout,
+            self._request_headers(url),
+        )
+        entry = self.state.setdefault(url, {"n_fetch": 0, "n_skip": 0})
+        entry["n_fetch"] += 1
+
+        sha256 = None if payload.status == 304 else _sha256(payload.content)
+        if not self.force and (payload.status == 304 or sha256 == entry.get("sha256")):
+            entry["n_skip"] += 1
+            how = "not modified" if payload.status == 304 else "same content"
+            print(
+                f"Skipping unchanged {url} ({how}): "
+                f"{entry['n_skip']} of {entry['n_fetch']} fetches skipped"
+            )
+            self._write()
+            return None
+
+        self.pending[url] = {
+            "sha256": sha256,
+            "etag": payload.headers.get("ETag"),
+            "last_modified": payload.headers.get("Last-Modified"),
+        }
+        return payload.content
+
+    def save(self):
+        """Record the fetched content as processed and write the state file."""
+        for url, fingerprint in self.pending.items():
+            self.state[url].update(fingerprint)
+        self.pending = {}
+        self._write()
+
+    def _write(self):
+        tmp = self.filename.with_name(self.filename.name + ".tmp")
+        tmp.write_text(json.dumps(self.state, indent=2))
+        tmp.replace(self.filename)
+
+
+def get_feed_state(h5_file, force=False):
+    """Get the ``FeedState`` kept alongside archive ``h5_file``."""
+    return FeedState(Path(h5_file).with_suffix(".feed_state.json"), force=force)
+
+
+def _sha256(content):
+    return hashlib.sha256(content).hexdigest()
@@ -0,0 +1,674 @@
+# Licensed under a 3-clause BSD style license - see LICENSE.rst
+"""
+Access to the ARC HDF5 archives (``ACE.h5``, ``GOES_X.h5`` and ``hrc_shield.h5``).
+
+Each archive is appended every few minutes and is sorted by the ``time`` column (CXC
+seconds).  The functions here use that ordering to read only the rows needed for a
+time window or the archive tail instead of the full mission.
+
+An archive has one of two layouts:
+
+- Single table: all rows are in one ``/data`` table.  This is the original layout.
+- Partitioned: rows are in one table per calendar month or year in the
+  ``/partitions`` group (e.g. ``/partitions/p2024_11``), and the ``/catalog`` table
+  has the name, first and last time and number of rows of each partition.  Appends
+  go to the last (hot) partition and a new partition is started automatically when
+  the rows reach the next month or year.  Window reads only touch the partitions that
+  overlap the window.
+
+The readers and ``H5Appender`` work with either layout.  New archives are partitioned
+if ``H5Appender`` is given a ``partition`` period, and ``migrate_h5.py --partition``
+converts a single-table archive.
+"""
+
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+import tables
+from astropy.time import Time
+
+# Storage layout for new archive tables (see utils/bench_h5_storage.py).  Appends are a
+# few rows every few minutes and reads are of the last few days, so small chunks with a
+# fast codec beat the original zlib with the default ~6000-row chunks for both.  Use
+# migrate_h5.py to rewrite an existing archive into this layout.
+FILTERS = tables.Filters(complevel=5, complib="blosc:lz4", shuffle=True)
+CHUNKSHAPE = (2048,)
+
+# Maximum number of time values read at once when searching for a time
+MAX_SEARCH_ROWS = 65536
+
+# Partition period name and corresponding numpy datetime64 unit
+PARTITION_PERIODS = {"month": "M", "year": "Y"}
+CATALOG_DTYPE = np.dtype(
+    [("name", "S16"), ("tstart", "f8"), ("tstop", "f8"), ("nrows", "i8")]
+)
+
+
+def get_last_time(table, col_time="time"):
+    """
+    Get the time of the last row in ``table`` without reading the whole column.
+
+    Parameters
+    ----------
+    table : tables.Table
+        Archive table sorted by ``col_time``
+    col_time : str
+        Name of time column
+
+    Returns
+    -------
+    last_time : float or None
+        Time of the last row, or None if the table is empty
+    """
+    nrows = table.nrows
+    if nrows == 0:
+        return None
+    return float(table.read(nrows - 1, nrows, field=col_time)[0])
+
+
+def _bisect_time(table, tval, col_time, side, *, lo=0, hi=None):
+    """
+    Find insertion row of ``tval`` in the sorted ``col_time`` column of ``table``.
+
+    This reads one row per bisection step (so ~log2(nrows) chunk reads) instead of
+    the full column.  ``side`` has the same meaning as in ``np.searchsorted``.  The
+    search is limited to rows ``lo`` to ``hi``.
+    """
+    if hi is None:
+        hi = table.nrows
+    while hi - lo > MAX_SEARCH_ROWS:
+        mid = (lo + hi) // 2
+        val = table.read(mid, mid + 1, field=col_time)[0]
+        if val < tval or (side == "right" and val == tval):
+            lo = mid + 1
+        else:
+            hi = mid
+    times = table.read(lo, hi, field=col_time)
+    return lo + int(np.searchsorted(times, tval, side=side))
+
+
+def _find_time_row(table, tval, col_time, side):
+    """
+    Find insertion row of ``tval`` in ``table``, searching back from the last row.
+
+    Reads are nearly always of recent data, so this steps back from the end of the
+    table in steps that double from one chunk until it passes ``tval`` and then
+    bisects within that step.  Every row read decompresses a full chunk, so for a
+    window of a few days this reads a few chunks instead of ~log2(nrows).
+    """
+    hi = table.nrows
+    step = table.chunkshape[0]
+    while hi > 0:
+        lo = max(0, hi - step)
+        val = table.read(lo, lo + 1, field=col_time)[0]
+        if val < tval or (side == "right" and val == tval):
+            return _bisect_time(table, tval, col_time, side, lo=lo, hi=hi)
+        hi = lo
+        step *= 2
+    return 0
+
+
+def get_time_rows(table, tstart, tstop, col_time="time"):
+    """
+    Get the row range for ``tstart < time <= tstop`` in ``table``.
+
+    If ``col_time`` has a PyTables index then that is used, otherwise the row range
+    is found by searching the sorted time column back from the last row.
+
+    Parameters
+    ----------
+    table : tables.Table
+        Archive table sorted by ``col_time``
+    tstart : float
+        Start time (CXC secs, exclusive)
+    tstop : float
+        Stop time (CXC secs, inclusive)
+    col_time : str
+        Name of time column
+
+    Returns
+    -------
+    row0, row1 : int
+        Slice bounds of the rows within the time range
+    """
+    col = table.cols._f_col(col_time)
+    if col.is_indexed:
+        rows = table.get_where_list(
+            f"({col_time} > tstart) & ({col_time} <= tstop)",
+            condvars={col_time: col, "tstart": tstart, "tstop": tstop},
+            sort=True,
+        )
+        if len(rows) == 0:
+            return 0, 0
+        return int(rows[0]), int(rows[-1]) + 1
+
+    row0 = _find_time_row(table, tstart, col_time, side="right")
+    row1 = _find_time_row(table, tstop, col_time, side="right")
+    return row0, max(row0, row1)
+
+
+def is_partitioned(h5):
+    """True if open archive file ``h5`` has the partitioned layout."""
+    return "/catalog" in h5
+
+
+def get_tables(h5, tstart=None, tstop=None):
+    """
+    Get the tables of open archive file ``h5`` that may have rows within a time range.
+
+    For a single-table archive this is ``[h5.root.data]``.  For a partitioned archive
+    only the catalog is read to select the partitions that overlap
+    ``tstart < time <= tstop``.
+
+    Parameters
+    ----------
+    h5 : tables.File
+        Open archive file
+    tstart : float or None
+        Start time (CXC secs, exclusive), or None for no limit
+    tstop : float or None
+        Stop time (CXC secs, inclusive), or None for no limit
+
+    Returns
+    -------
+    tables : list of tables.Table
+        Tables in time order
+    """
+    if not is_partitioned(h5):
+        return [h5.root.data]
+
+    catalog = h5.root.catalog.read()
+    ok = catalog["nrows"] > 0
+    if tstart is not None:
+        ok &= catalog["tstop"] > tstart
+    if tstop is not None:
+        ok &= catalog["tstart"] <= tstop
+    return [h5.get_node("/partitions", name.decode()) for name in catalog["name"][ok]]
+
+
+def get_archive_last_time(h5, col_time="time"):
+    """
+    Get the time of the last row of open archive file ``h5`` (None if empty).
+
+    For a partitioned archive this comes from the catalog.
+    """
+    if is_partitioned(h5):
+        catalog = h5.root.catalog
+        return float(catalog.cols.tstop[-1]) if catalog.nrows > 0 else None
+    return get_last_time(h5.root.data, col_time)
+
+
+def get_archive_tail(h5_file, col_time="time"):
+    """
+    Get the table data type and the last time of an archive, opened read-only.
+
+    The fetch scripts use this to get the last stored time before fetching, so the
+    archive is opened for appending only once the new rows are ready.
+
+    Parameters
+    ----------
+    h5_file : str or Path
+        HDF5 archive file name
+    col_time : str
+        Name of time column
+
+    Returns
+    -------
+    dtype : np.dtype or None
+        Data type of the archive table, or None if there is no file or table yet
+    last_time : float or None
+        Time of the last row, or None if the archive is empty
+    """
+    if not Path(h5_file).exists():
+        return None, None
+    with tables.open_file(h5_file) as h5:
+        try:
+            tables_ = get_tables(h5)
+        except tables.NoSuchNodeError:
+            return None, None
+        dtype = tables_[-1].dtype if tables_ else None
+        return dtype, get_archive_last_time(h5, col_time)
+
+
+def read_time_window(h5_file, tstart, tstop, colnames, *, col_time="time", test=False):
+    """
+    Read ``colnames`` from an archive for rows with ``tstart < time <= tstop``.
+
+    Only the rows within the time range are read, in one pass for all columns, and
+    only from the partitions that overlap the range.
+
+    If ``test`` is True and the archive ends more than one hour before ``tstop`` then
+    the archive times are shifted forward so the last row is at ``tstop``.  This
+    allows testing with archive files that are not being updated.
+
+    Parameters
+    ----------
+    h5_file : str or Path
+        HDF5 archive file name
+    tstart : float
+        Start time (CXC secs, exclusive)
+    tstop : float
+        Stop time (CXC secs, inclusive)
+    colnames : list of str
+        Columns to read.  If ``col_time`` is included then it has the test offset
+        applied.
+    col_time : str
+        Name of time column
+    test : bool
+        Shift archive times to be current (for testing)
+
+    Returns
+    -------
+    vals : list of np.ndarray
+        Column values corresponding to ``colnames``
+    """
+    with tables.open_file(h5_file) as h5:
+        # If testing, it is common to have the test data file not be updated to the
+        # current time. In that case, just hack the times to seem current.
+        dt = 0.0
+        if test and (last_time := get_archive_last_time(h5, col_time)) is not None:
+            if (tstop - last_time) > 3600:
+                dt = tstop - last_time
+
+        dats = []
+        for table in get_tables(h5, tstart - dt, tstop - dt):
+            row0, row1 = get_time_rows(table, tstart - dt, tstop - dt, col_time)
+            dats.append(table.read(row0, row1))
+        if not dats:
+            dats.append(_get_empty_rows(h5))
+
+    vals = [_concatenate(dats, name) for name in colnames]
+    if dt != 0.0 and col_time in colnames:
+        vals[colnames.index(col_time)] += dt
+    return vals
+
+
+def read_tail(h5_file, n_rows, colnames):
+    """
+    Read ``colnames`` for the last ``n_rows`` rows of an archive.
+
+    Parameters
+    ----------
+    h5_file : str or Path
+        HDF5 archive file name
+    n_rows : int
+        Number of rows
+    colnames : list of str
+        Columns to read
+
+    Returns
+    -------
+    vals : list of np.ndarray
+        Column values corresponding to ``colnames``
+    """
+    dats = []
+    with tables.open_file(h5_file) as h5:
+        for table in reversed(get_tables(h5)):
+            n_read = min(n_rows, table.nrows)
+            dats.insert(0, table.read(table.nrows - n_read, table.nrows))
+            n_rows -= n_read
+            if n_rows == 0:
+                break
+        if not dats:
+            dats.append(_get_empty_rows(h5))
+
+    return [_concatenate(dats, name) for name in colnames]
+
+
+def get_tail_stamp(h5_file, col_time="time"):
+    """
+    Get the number of rows and the last time of an archive.
+
+    Any append to the archive changes these, so a product made from the archive is
+    up to date if the stamp is the same as when it was made.  Only the last row (or
+    the catalog of a partitioned archive) is read.
+
+    Returns
+    -------
+    stamp : dict
+        ``n_rows`` and ``last_time`` (CXC secs, or None if the archive is empty)
+    """
+    with tables.open_file(h5_file) as h5:
+        n_rows = int(sum(table.nrows for table in get_tables(h5)))
+        last_time = get_archive_last_time(h5, col_time)
+    return {"n_rows": n_rows, "last_time": last_time}
+
+
+class PlotState:
+    """
+    Archive stamps of the plots made from an archive.
+
+    The plot scripts use this to skip rendering a plot if the archive has not
+    changed since the plot was last made::
+
+      plot_state = PlotState("GOES_X.h5")
+      stamp = {**get_tail_stamp("GOES_X.h5"), "days": 3.0}
+      if plot_state.is_current("goes_x.png", stamp):
+          ...  # nothing to do
+      ...
+      plot_state.save("goes_x.png", stamp)
+
+    The state is kept in a JSON file alongside the archive as a dict of the stamp
+    (archive tail and any plot parameters) keyed by plot file name.
+
+    Parameters
+    ----------
+    h5_file : str or Path
+        Archive file name
+    """
+
+    def __init__(self, h5_file):
+        self.filename = Path(h5_file).with_suffix(".plot_state.json")
+        self.state = (
+            json.loads(self.filename.read_text()) if self.filename.exists() else {}
+        )
+
+    def is_current(self, out_file, stamp):
+        """True if ``out_file`` exists and was made from the archive with ``stamp``."""
+        out_file = Path(out_file)
+        return out_file.exists() and self.state.get(str(out_file.resolve())) == stamp
+
+    def save(self, out_file, stamp):
+        """Record that ``out_file`` was made from the archive with ``stamp``."""
+        self.state[str(Path(out_file).resolve())] = stamp
+        tmp = self.filename.with_name(self.filename.name + ".tmp")
+        tmp.write_text(json.dumps(self.state, indent=2))
+        tmp.replace(self.filename)
+
+
+def _get_empty_rows(h5):
+    """
+    Get zero rows with the data type of the archive tables in open file ``h5``.
+
+    This is used when a read selects no tables, e.g. a time window that overlaps no
+    partition, so the readers return empty columns as they do for a single table.
+    """
+    if is_partitioned(h5):
+        for table in h5.iter_nodes("/partitions", classname="Table"):
+            return table.read(0, 0)
+        raise ValueError(f"archive {h5.filename} has no partitions")
+    return h5.root.data.read(0, 0)
+
+
+def _concatenate(dats, name):
+    if len(dats) == 1:
+        return np.ascontiguousarray(dats[0][name])
+    return np.concatenate([dat[name] for dat in dats])
+
+
+def get_partition_names(times, period):
+    """
+    Get the partition name for each of ``times``.
+
+    Parameters
+    ----------
+    times : np.ndarray
+        Times (CXC secs)
+    period : str
+        Partition period ("month" or "year")
+
+    Returns
+    -------
+    names : np.ndarray
+        Partition names like "p2024_11" (month) or "p2024" (year)
+    """
+    unit = PARTITION_PERIODS[period]
+    dates = Time(times, format="cxcsec").utc.datetime64.astype(f"datetime64[{unit}]")
+    names = np.char.replace(dates.astype(str), "-", "_")
+    return np.char.add("p", names)
+
+
+def create_catalog(h5, title, period):
+    """
+    Create the ``/catalog`` table and ``/partitions`` group in open file ``h5``.
+
+    Parameters
+    ----------
+    h5 : tables.File
+        Open archive file
+    title : str
+        Archive title, used for the catalog and partition table titles
+    period : str
+        Partition period ("month" or "year")
+
+    Returns
+    -------
+    catalog : tables.Table
+        Empty catalog table
+    """
+    if period not in PARTITION_PERIODS:
+        raise ValueError(
+            f"partition period must be one of {list(PARTITION_PERIODS)}, not {period}"
+        )
+    h5.create_group(h5.root, "partitions", f"{title} partitions")
+    catalog = h5.create_table(
+        h5.root, "catalog", description=CATALOG_DTYPE, title=f"{title} catalog"
+    )
+    catalog.attrs.title = title
+    catalog.attrs.period = period
+    return catalog
+
+
+def append_partitioned(
+    h5, newdat, col_time="time", filters=FILTERS, chunkshape=CHUNKSHAPE
+):
+    """
+    Append rows to the partitioned archive in open file ``h5``.
+
+    The rows must be newer than the last row of the archive.  A new partition table
+    is created for rows that are past the last partition, and the catalog is updated.
+
+    Parameters
+    ----------
+    h5 : tables.File
+        Open archive file with a catalog
+    newdat : np.ndarray
+        Structured array of new rows
+    col_time : str
+        Name of time column
+    filters : tables.Filters
+        Compression filters for new partition tables
+    chunkshape : tuple
+        Chunkshape for new partition tables
+
+    Returns
+    -------
+    table : tables.Table or None
+        Last (hot) partition table
+    """
+    catalog = h5.root.catalog
+    tables_ = get_tables(h5)
+    table = tables_[-1] if tables_ else None
+    if len(newdat) == 0:
+        return table
+
+    times = newdat[col_time]
+    names = get_partition_names(times, catalog.attrs.period)
+    i_breaks = np.flatnonzero(names[1:] != names[:-1]) + 1
+    for i0, i1 in zip(
+        np.concatenate([[0], i_breaks]),
+        np.concatenate([i_breaks, [len(newdat)]]),
+        strict=True,
+    ):
+        name = str(names[i0])
+        rows = newdat[i0:i1]
+        if table is not None and table.name == name:
+            table.append(as_dtype(rows, table.dtype))
+            catalog.cols.tstop[-1] = times[i1 - 1]
+            catalog.cols.nrows[-1] = table.nrows
+        else:
+            dtype = rows.dtype if table is None else table.dtype
+            table = h5.create_table(
+                "/partitions",
+                name,
+                description=dtype,
+                title=f"{catalog.attrs.title} {name}",
+                filters=filters,
+                chunkshape=chunkshape,
+            )
+            table.append(as_dtype(rows, dtype))
+            catalog.append([(name, times[i0], times[i1 - 1], table.nrows)])
+        table.flush()
+    catalog.flush()
+
+    return table
+
+
+def as_dtype(dat, dtype):
+    """
+    Convert structured array ``dat`` to ``dtype`` by column name.
+
+    This allows appending rows with float64 columns to an archive that was migrated
+    to float32 columns.  ``migrate_h5.py`` only does that for columns that are listed
+    as exact in float32 by construction, so a warning is printed if any values are
+    not exactly representable in the archive column type.
+    """
+    if dat.dtype == dtype:
+        return dat
+
+    out = np.empty(len(dat), dtype=dtype)
+    for name in dtype.names:
+        out[name] = dat[name]
+        if dtype[name].kind == "f" and not np.array_equal(
+            out[name], dat[name], equal_nan=True
+        ):
+            print(f"Warning: {name} values rounded to archive type {dtype[name]}")
+    return out
+
+
+class H5Appender:
+    """
+    Append new rows to an archive using a single open of the HDF5 file.
+
+    This is used as a context manager by the ``get_*.py`` fetch scripts::
+
+      with H5Appender("GOES_X.h5", "GOES_X rates") as appender:
+          lasttime = appender.last_time
+          ...
+          appender.append(newdat)
+
+    On entry the file is opened and the time of the last stored row is read (one row,
+    not the full time column).  ``append()`` keeps only rows newer than that time and
+    creates the ``/data`` table (or the first partition) if needed.  On exit the number
+    of rows appended and the elapsed time are printed.
+
+    Parameters
+    ----------
+    h5_file : str or Path
+        HDF5 archive file name
+    title : str
+        Table title used if the ``/data`` table is created
+    col_time : str
+        Name of time column
+    create : bool
+        Create ``h5_file`` and its ``/data`` table if they do not exist
+        (default=True).  If False then see ``open()``.
+    partition : str or None
+        Partition period ("month" or "year") if a new archive is created.  The default
+        of None creates a single-table archive.  Existing archives keep their layout.
+    """
+
+    def __init__(self, h5_file, title, col_time="time", create=True, partition=None):
+        self.h5_file = h5_file
+        self.title = title
+        self.col_time = col_time
+        self.create = create
+        self.partition = partition
+        self.partitioned = False
+        self.h5 = None
+        self.table = None
+        self.last_time = None
+        self.n_appended = 0
+
+    def open(self):
+        """
+        Open the archive file and get the time of the last stored row.
+
+        If ``create`` is False then ``FileNotFoundError`` is raised for a missing file
+        and ``tables.NoSuchNodeError`` for a file without a ``/data`` table or catalog.
+        """
+        self.time0 = time.time()
+        if not self.create and not Path(self.h5_file).exists():
+            raise FileNotFoundError(f"No such file: {self.h5_file}")
+        self.h5 = tables.open_file(self.h5_file, mode="a", filters=FILTERS)
+        self.partitioned = is_partitioned(self.h5)
+        if self.partitioned:
+            tables_ = get_tables(self.h5)
+            self.table = tables_[-1] if tables_ else None
+            self.last_time = get_archive_last_time(self.h5, self.col_time)
+            return self
+
+        try:
+            self.table = self.h5.root.data
+        except tables.NoSuchNodeError:
+            if not self.create:
+                self.h5.close()
+                raise
+            self.table = None
+        else:
+            self.last_time = get_last_time(self.table, self.col_time)
+        return self
+
+    def close(self):
+        """Close the archive file and print the number of rows appended."""
+        self.h5.close()
+        dt = time.time() - self.time0
+        print(f"Appended {self.n_appended} rows to {self.h5_file} in {dt:.2f} secs")
+
+    def __enter__(self):
+        if self.h5 is None or not self.h5.isopen:
+            self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    @property
+    def dtype(self):
+        """Data type of the archive table, or None if there is no table yet"""
+        return None if self.table is None else self.table.dtype
+
+    def append(self, newdat):
+        """
+        Append rows of ``newdat`` that are newer than the last stored row.
+
+        Parameters
+        ----------
+        newdat : np.ndarray
+            Structured array of new rows
+
+        Returns
+        -------
+        n_appended : int
+            Number of rows appended
+        """
+        if self.last_time is not None:
+            newdat = newdat[newdat[self.col_time] > self.last_time]
+
+        if self.table is None and not self.partitioned and self.partition:
+            create_catalog(self.h5, self.title, self.partition)
+            self.partitioned = True
+
+        if self.partitioned:
+            self.table = append_partitioned(self.h5, newdat, self.col_time)
+        else:
+            if self.table is None:
+                self.table = self.h5.create_table(
+                    self.h5.root,
+                    "data",
+                    newdat,
+                    self.title,
+                    expectedrows=2e7,
+                    chunkshape=CHUNKSHAPE,
+                )
+            elif len(newdat) > 0:
+                self.table.append(as_dtype(newdat, self.table.dtype))
+            self.table.flush()
+
+        if len(newdat) > 0:
+            self.last_time = float(newdat[self.col_time][-1])
+        self.n_appended += len(newdat)
+        return len(newdat)
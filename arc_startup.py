@@ -0,0 +1,125 @@
+# Licensed under a 3-clause BSD style license - see LICENSE.rst
+"""
+Startup time profile for the ARC scripts.
+
+The scripts import their heavy dependencies (kadi, matplotlib, astropy tables,
+PyTables) in the functions that need them, so ``--help``, ``--test-get-web``, the
+``get_fetchers()`` stage of ``arc_daemon.py`` and early error exits do not pay for
+them.  Each script lists those modules in ``DEFERRED_IMPORTS``.
+
+``--profile-startup`` reports what a cold start of a script costs.  The script module
+and then each of its deferred modules are imported in a fresh interpreter with
+``python -X importtime``, which gives the time of each import including the
+initialization code run at import (e.g. the Django setup of ``kadi.events``).  A
+deferred module is only charged for what the earlier imports did not already load.
+"""
+
+import collections
+import subprocess
+import sys
+from pathlib import Path
+from typing import NamedTuple
+
+
+class ImportTime(NamedTuple):
+    """Import time (secs) of a module and the time of each package that it loaded"""
+
+    module: str
+    secs: float
+    packages: dict
+
+
+IMPORT_CODE = """
+failed = []
+for module in {modules!r}:
+    try:
+        __import__(module)
+    except ImportError:
+        failed.append(module)
+print(" ".join(failed))
+"""
+
+
+def get_import_times(modules, cwd=None):
+    """
+    Import ``modules`` in order in a new interpreter and get the time of each.
+
+    Parameters
+    ----------
+    modules : list of str
+        Module names
+    cwd : str or Path, optional
+        Working directory of the interpreter (first entry of ``sys.path``)
+
+    Returns
+    -------
+    import_times : list of ImportTime
+        Import time (secs) of each module and a dict of the time (secs) of each
+        top-level package that it loaded, sorted by decreasing time
+    failed : list of str
+        Modules that could not be imported
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", IMPORT_CODE.format(modules=modules)],
+        cwd=cwd,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    # Lines are "import time: self [us] | cumulative | imported package" in the order
+    # that each import finished, with nested imports indented by two spaces.  The
+    # top-level lines before the first module are the interpreter startup imports.
+    import_times = []
+    packages = collections.Counter()
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or line.endswith("| imported package"):
+            continue
+        self_us, cum_us, name = line.removeprefix("import time:").split("|")
+        name = name[1:]
+        packages[name.strip().split(".")[0]] += int(self_us) / 1e6
+        if not name.startswith(" "):
+            if name in modules:
+                import_times.append(
+                    ImportTime(name, int(cum_us) / 1e6, dict(packages.most_common()))
+                )
+            packages = collections.Counter()
+
+    failed = proc.stdout.split()
+    import_times = [
+        import_time for import_time in import_times if import_time.module not in failed
+    ]
+    return import_times, failed
+
+
+def print_startup_profile(script_file, deferred_imports, n_packages=5):
+    """
+    Print the cold import time of script ``script_file`` and its deferred imports.
+
+    Parameters
+    ----------
+    script_file : str
+        File name of the script (``__file__``)
+    deferred_imports : list of str
+        Modules the script imports only when they are needed
+    n_packages : int
+        Number of the slowest top-level packages to show for each import
+    """
+    script_file = Path(script_file).resolve()
+    modules = [script_file.stem, *deferred_imports]
+    import_times, failed = get_import_times(modules, cwd=script_file.parent)
+
+    print(f"Cold startup of {script_file.name} (python -X importtime)")
+    for import_time in import_times:
+        kind = "import" if import_time.module == script_file.stem else "deferred"
+        print(f"  {kind:8s} {import_time.module:30s} {import_time.secs:7.3f} s")
+        for package, secs in list(import_time.packages.items())[:n_packages]:
+            print(f"           {package:28s} {secs:7.3f} s")
+    imported = {import_time.module for import_time in import_times}
+    for module in modules:
+        if module in failed:
+            print(f"  {'deferred':8s} {module:30s} not importable")
+        elif module not in imported:
+            print(f"  {'deferred':8s} {module:30s} already imported")
+    total = sum(import_time.secs for import_time in import_times)
+    print(f"  {'total':39s} {total:7.3f} s")
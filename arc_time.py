@@ -0,0 +1,183 @@
+# Licensed under a 3-clause BSD style license - see LICENSE.rst
+"""
+Vectorized time conversions for the ARC scripts.
+
+The ``get_*`` conversion functions take CXC seconds, CXC date strings (like
+"2024:318:13:45:00.000") or a ``Time``, either scalar or array, and convert all the
+values in one call.  Date strings are parsed once: the CXC seconds of the last
+``DATE_CACHE_SIZE`` distinct strings are kept in an LRU cache, so the dates that
+``make_timeline.py`` sees every cycle (DSN comm passes, radzones, available comms) are
+not parsed again in a persistent process.
+"""
+
+import collections
+import datetime
+
+import erfa
+import numpy as np
+from astropy.time import Time
+
+# Number of date strings with cached CXC seconds
+DATE_CACHE_SIZE = 4096
+
+_date_secs_cache = collections.OrderedDict()
+
+
+def parse_time_tags(time_tags):
+    """
+    Parse SWPC JSON ``time_tag`` values like "2024-11-17T04:55:00Z" as UTC times.
+
+    Astropy does not use its fast C parser for ISO times with a trailing "Z", so that
+    is stripped first and the UTC scale is set explicitly.  This gives identical
+    times about 25 times faster for a 7-day file.
+
+    Parameters
+    ----------
+    time_tags : array-like of str
+        ISO times in UTC
+
+    Returns
+    -------
+    times : astropy.time.Time
+        Parsed times
+    """
+    time_tags = np.asarray(time_tags, dtype=str)
+    try:
+        return Time(np.char.rstrip(time_tags, "Z"), format="isot", scale="utc")
+    except ValueError:
+        return Time(time_tags)
+
+
+def get_time_tag(secs):
+    """
+    Format CXC seconds ``secs`` as an SWPC JSON ``time_tag`` like "2024-11-17T04:55:00Z".
+
+    Fractional seconds are truncated.
+    """
+    return Time(secs, format="cxcsec").utc.isot[:19] + "Z"
+
+
+def get_archive_time_cols(times):
+    """
+    Get the legacy calendar time columns of the ARC archives for ``times``.
+
+    The GOES X-ray and proton archives carry ``mjd``, ``secs``, ``year``, ``month``,
+    ``dom`` and ``hhmm`` columns from the original SWPC text file format.  This computes
+    all of them in array operations.  The calendar fields come from the same ERFA call
+    (at microsecond resolution) that ``Time.datetime`` uses, so the values are
+    identical to taking the attributes of each ``datetime`` object, without creating
+    one object per row.
+
+    Parameters
+    ----------
+    times : astropy.time.Time
+        Sample times (array)
+
+    Returns
+    -------
+    cols : dict
+        Dict of int arrays keyed by column name
+    """
+    mjd_float = times.mjd
+    mjd = mjd_float.astype(int)
+    secs = np.array(np.round((mjd_float - mjd) * 86400, decimals=0)).astype(int)
+
+    scale = times.scale.upper().encode("ascii")
+    year, month, dom, ihmsf = erfa.d2dtf(scale, 6, times.jd1, times.jd2)
+    hhmm = ihmsf["h"].astype(int) * 100 + ihmsf["m"]
+
+    return {
+        "mjd": mjd,
+        "secs": secs,
+        "year": year.astype(int),
+        "month": month.astype(int),
+        "dom": dom.astype(int),
+        "hhmm": hhmm,
+    }
+
+
+def _parse_dates(dates):
+    try:
+        return Time(dates, format="yday", scale="utc").cxcsec
+    except ValueError:
+        return Time(dates, scale="utc").cxcsec
+
+
+def get_secs(times):
+    """
+    Convert ``times`` to CXC seconds.
+
+    Parameters
+    ----------
+    times : float, str, array-like or astropy.time.Time
+        CXC seconds, date strings or times
+
+    Returns
+    -------
+    secs : float or np.ndarray
+        CXC seconds (float for scalar ``times``)
+    """
+    if isinstance(times, Time):
+        return times.cxcsec
+    vals = np.asarray(times)
+    if vals.dtype.kind in "iuf":
+        return vals.astype(float) if vals.ndim else float(vals)
+
+    # Look up each distinct date string in the cache and parse the others at once
+    dates, inverse = np.unique(vals.astype(str).ravel(), return_inverse=True)
+    secs = np.empty(len(dates))
+    missing = []
+    for idx, date in enumerate(dates.tolist()):
+        if date in _date_secs_cache:
+            _date_secs_cache.move_to_end(date)
+            secs[idx] = _date_secs_cache[date]
+        else:
+            missing.append(idx)
+    if missing:
+        secs[missing] = _parse_dates(dates[missing])
+        _date_secs_cache.update(
+            zip(dates[missing].tolist(), secs[missing].tolist(), strict=True)
+        )
+        while len(_date_secs_cache) > DATE_CACHE_SIZE:
+            _date_secs_cache.popitem(last=False)
+
+    secs = secs[inverse].reshape(vals.shape)
+    return secs if secs.ndim else float(secs)
+
+
+def get_plot_dates(times):
+    """
+    Convert ``times`` (see ``get_secs``) to matplotlib plot dates.
+    """
+    return Time(get_secs(times), format="cxcsec").plot_date
+
+
+def get_dates(times):
+    """
+    Convert ``times`` (see ``get_secs``) to CXC dates like "2024:318:13:45:00.000".
+    """
+    return Time(get_secs(times), format="cxcsec").utc.yday
+
+
+def get_zulu_dates(times):
+    """
+    Format ``times`` (see ``get_secs``) like "318/1345z" (day of year and UTC time).
+    """
+    dates = np.asarray(get_dates(times))
+    zulus = [f"{date[5:8]}/{date[9:11]}{date[12:14]}z" for date in dates.ravel()]
+    return zulus if dates.ndim else zulus[0]
+
+
+def get_local_dates(times, fmt="%Y %a %b %d %I:%M:%S %p %Z"):
+    """
+    Format ``times`` (see ``get_secs``) in the local time zone.
+
+    The default format is that of the ``CxoTime.get_conversions()`` "local" value,
+    e.g. "2024 Sun Nov 17 04:58:09 AM EST".
+    """
+    secs = get_secs(times)
+    datetimes = Time(secs, format="cxcsec").utc.to_datetime(
+        timezone=datetime.timezone.utc
+    )
+    dates = [dt.astimezone().strftime(fmt) for dt in np.ravel(datetimes)]
+    return dates if np.ndim(secs) else dates[0]
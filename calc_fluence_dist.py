@@ -1,12 +1,42 @@
+import hashlib
+import json
+import math
+from pathlib import Path
+
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 
 N_FUTURE = 48
 N_PAST = 6
 N_T = N_FUTURE + N_PAST
 N_SAMP = 6
 
+# Arrays saved in the fluence cache directory.  Bump CACHE_VERSION if the way they are
+# computed changes so existing caches are rebuilt.
+CACHE_NAMES = ("p_fits", "p3_samps", "fluences")
+CACHE_VERSION = 1
+
+# Sample spacing (secs) of the analog libraries built from ACE.h5
+LIBRARY_RESOLUTIONS = {"5m": 300.0, "1h": 3600.0}
+# Number of windows computed at once when building a library, which bounds memory
+LIBRARY_BLOCK_WINDOWS = 1000
+# Minimum fraction of good 5-min P3 values in a sample for it to be used
+MIN_GOOD_FRACTION = 0.5
+# Maximum gap (secs) of missing samples that is filled by linear interpolation.  This
+# allows 5-min windows with a few bad values but fills nothing at 1-hour resolution.
+MAX_FILL_SECS = 1800.0
+
+# Standard deviation (dex) of the random scale factor of each ensemble member
+ENSEMBLE_SCALE_SIGMA = 0.1
+
+# Window features available for the analog KD-tree search (see AnalogIndex)
+ANALOG_FEATURES = ("log_p3", "slope", "log_p3_mean")
+
+# Analog indexes kept between calls, keyed by library (see get_library_index)
+_analog_indexes = {}
+
 
-def get_fluences(filename="ACE_hourly_avg.npy"):
+def get_fluences(filename="ACE_hourly_avg.npy", cache_dir=None, use_cache=True):
     """
     Get P3 cumulative fluence values at 1 hour intervals.
 
@@ -14,6 +44,41 @@ def get_fluences(filename="ACE_hourly_avg.npy"):
     P3 values.  Compute a fluence prediction starting each 12 hours extending for 48
     hours.  Store each 48-point fluence prediction along with the index into the global
     ``BINS`` array corresponding to the starting P3 value.
+
+    The returned arrays are saved in ``cache_dir`` (default is ``filename`` with a
+    ``.fluence_cache`` suffix) and later calls load them from there memory-mapped
+    (read-only) instead of computing them again.  The cache is rebuilt if the
+    modification time and SHA-256 hash of ``filename`` show that it has changed.
+    """
+    if cache_dir is None:
+        cache_dir = Path(filename).with_suffix(".fluence_cache")
+    cache_dir = Path(cache_dir)
+
+    if use_cache and (arrays := load_cache(cache_dir, filename)) is not None:
+        return arrays
+
+    arrays = calc_fluences(filename)
+    if use_cache:
+        try:
+            save_cache(cache_dir, filename, arrays)
+        except OSError as err:
+            print(f"Warning: could not write fluence cache {cache_dir}: {err}")
+
+    return arrays
+
+
+def calc_fluences(filename):
+    """
+    Compute the P3 fits, samples and fluences for ``get_fluences``.
+
+    Returns
+    -------
+    p_fits : np.ndarray
+        Linear fit (slope, intercept) of log10(P3) over the N_PAST hours of each sample
+    p3_samps : np.ndarray
+        P3 values for the N_T hours of each sample
+    fluences : np.ndarray
+        Cumulative fluence for the N_FUTURE hours of each sample
     """
     dat = np.load(filename)
 
@@ -26,8 +91,8 @@ def get_fluences(filename="ACE_hourly_avg.npy"):
     hrs = (dat["fp_year"] - 1997.0) * 24 * 365.25
 
     i0s = np.arange(0, len(p3s) - N_T, N_SAMP)
-    p3_samps = np.vstack([p3s[i : i + N_T] for i in i0s])
-    d_hrs = np.array([hrs[i + N_T] - hrs[i] - N_T for i in i0s])
+    p3_samps = sliding_window_view(p3s, N_T)[i0s]
+    d_hrs = hrs[i0s + N_T] - hrs[i0s] - N_T
     ok = np.abs(d_hrs) < 0.15
     p3_samps = p3_samps[ok]
 
@@ -37,41 +102,694 @@ def get_fluences(filename="ACE_hourly_avg.npy"):
     return p_fits.T, p3_samps, fluences
 
 
-def get_fluence_percentiles(
+def _get_source_meta(filename, sha256=None):
+    stat = Path(filename).stat()
+    return {
+        "version": CACHE_VERSION,
+        "n_past": N_PAST,
+        "n_future": N_FUTURE,
+        "n_samp": N_SAMP,
+        "mtime": stat.st_mtime,
+        "size": stat.st_size,
+        "sha256": sha256 or hashlib.sha256(Path(filename).read_bytes()).hexdigest(),
+    }
+
+
+def load_cache(cache_dir, filename):
+    """
+    Load the cached ``get_fluences`` arrays memory-mapped if they are current.
+
+    The source ``filename`` is hashed only if its modification time or size differ
+    from the cache.  If the content is the same then the cache is used and its
+    modification time is updated.
+
+    Returns
+    -------
+    arrays : tuple of np.memmap or None
+        Cached arrays, or None if there is no current cache
+    """
+    meta_file = Path(cache_dir) / "meta.json"
+    if not meta_file.exists():
+        return None
+
+    meta = json.loads(meta_file.read_text())
+    stat = Path(filename).stat()
+    if (meta["mtime"], meta["size"]) != (stat.st_mtime, stat.st_size):
+        source_meta = _get_source_meta(filename)
+        if source_meta["sha256"] != meta["sha256"]:
+            return None
+        meta.update(mtime=source_meta["mtime"], size=source_meta["size"])
+        try:
+            _write_text(meta_file, json.dumps(meta, indent=2))
+        except OSError:
+            pass
+
+    if meta != _get_source_meta(filename, meta["sha256"]):
+        return None
+
+    return tuple(
+        np.load(Path(cache_dir) / f"{name}.npy", mmap_mode="r") for name in CACHE_NAMES
+    )
+
+
+def save_cache(cache_dir, filename, arrays):
+    """Save the ``get_fluences`` arrays for ``filename`` in ``cache_dir``."""
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    meta_file = cache_dir / "meta.json"
+
+    # Remove the metadata first so a partly written cache is never used
+    meta_file.unlink(missing_ok=True)
+    for name, array in zip(CACHE_NAMES, arrays, strict=True):
+        tmp = cache_dir / f"{name}.tmp.npy"
+        np.save(tmp, np.ascontiguousarray(array))
+        tmp.replace(cache_dir / f"{name}.npy")
+    _write_text(meta_file, json.dumps(_get_source_meta(filename), indent=2))
+
+
+def _write_text(filename, text):
+    tmp = filename.with_name(filename.name + ".tmp")
+    tmp.write_text(text)
+    tmp.replace(filename)
+
+
+def get_library_dir(h5_file, resolution="1h"):
+    """Get the default analog library directory for ``h5_file`` and ``resolution``."""
+    return Path(h5_file).with_suffix(f".fluence_library_{resolution}")
+
+
+def _get_library_shapes(meta):
+    """Row shape of each library array for the window sizes in ``meta``."""
+    return {
+        "tstart": (),
+        "p_fits": (2,),
+        "p3_samps": (meta["n_past"] + meta["n_future"],),
+        "fluences": (meta["n_future"],),
+    }
+
+
+def _read_library_meta(lib_dir):
+    meta_file = Path(lib_dir) / "meta.json"
+    return json.loads(meta_file.read_text()) if meta_file.exists() else None
+
+
+def _get_p3_series(h5_file, tstart, dt, n_samp):
+    """
+    Get P3 from ``h5_file`` averaged in ``n_samp`` bins of ``dt`` secs from ``tstart``.
+
+    Bins with fewer than ``MIN_GOOD_FRACTION`` of the expected 5-min values good
+    (P3 > 1) are missing.  Gaps of up to ``MAX_FILL_SECS`` between good bins are
+    filled by linear interpolation and any other missing bins are NaN.
+    """
+    import arc_h5
+
+    times, p3s = arc_h5.read_time_window(
+        h5_file, tstart - dt, tstart + n_samp * dt, ["time", "p3"]
+    )
+    idxs = np.floor((times - tstart) / dt).astype(int)
+    ok = (idxs >= 0) & (idxs < n_samp) & (p3s > 1)
+    sums = np.bincount(idxs[ok], weights=p3s[ok], minlength=n_samp)
+    counts = np.bincount(idxs[ok], minlength=n_samp)
+
+    min_count = max(1, MIN_GOOD_FRACTION * dt / 300.0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        series = sums / counts
+    bad = counts < min_count
+    series[bad] = np.nan
+
+    # Find runs of missing bins and fill the short ones that have good bins on both
+    # sides.
+    edges = np.diff(np.concatenate([[0], bad.astype(int), [0]]))
+    starts = np.flatnonzero(edges == 1)
+    lengths = np.flatnonzero(edges == -1) - starts
+    fill_run = (
+        (lengths <= MAX_FILL_SECS // dt) & (starts > 0) & (starts + lengths < n_samp)
+    )
+    fill = np.zeros(n_samp, dtype=bool)
+    fill[bad] = np.repeat(fill_run, lengths)
+    if np.any(fill):
+        idxs = np.arange(n_samp)
+        series[fill] = np.interp(idxs[fill], idxs[~bad], series[~bad])
+
+    return series
+
+
+def update_library(h5_file, lib_dir=None, resolution="1h", step_hours=N_SAMP):
+    """
+    Add the analog windows made possible by new data in the ACE ``h5_file`` archive.
+
+    This builds the same ``p_fits``, ``p3_samps`` and ``fluences`` arrays as
+    ``get_fluences`` directly from the 5-min P3 values in ``ACE.h5``, either as they
+    are ("5m") or averaged in 1-hour bins ("1h").  A window of ``N_PAST + N_FUTURE``
+    hours starts every ``step_hours``, and windows with any missing samples (after
+    filling short gaps, see ``_get_p3_series``) are skipped.
+
+    The arrays are stored as raw files in ``lib_dir`` (one row per window) along with
+    ``meta.json``, which has the number of windows and the start time of the next
+    window.  Each call only reads the archive from that time on and appends the new
+    complete windows, so after the first build this only processes the new data.
+    Windows are processed in blocks of ``LIBRARY_BLOCK_WINDOWS`` from zero-copy
+    sliding window views of the binned P3, so memory use does not depend on the
+    length of the archive.
+
+    Parameters
+    ----------
+    h5_file : str or Path
+        ACE archive file (``ACE.h5``)
+    lib_dir : str, Path or None
+        Library directory (default from ``get_library_dir``)
+    resolution : str
+        Sample resolution, "5m" or "1h"
+    step_hours : float
+        Hours between window starts
+
+    Returns
+    -------
+    n_added : int
+        Number of windows added
+    """
+    if lib_dir is None:
+        lib_dir = get_library_dir(h5_file, resolution)
+    lib_dir = Path(lib_dir)
+    dt = LIBRARY_RESOLUTIONS[resolution]
+    params = {
+        "version": CACHE_VERSION,
+        "resolution": resolution,
+        "dt": dt,
+        "n_past": round(N_PAST * 3600 / dt),
+        "n_future": round(N_FUTURE * 3600 / dt),
+        "step": round(step_hours * 3600 / dt),
+    }
+
+    meta = _read_library_meta(lib_dir)
+    if meta is None or {key: meta[key] for key in params} != params:
+        if meta is not None:
+            print(f"Rebuilding fluence library {lib_dir} for new parameters")
+        meta = {**params, "n_windows": 0, "next_start": None}
+        (lib_dir / "order.i8").unlink(missing_ok=True)
+    lib_dir.mkdir(parents=True, exist_ok=True)
+    _truncate_library(lib_dir, meta)
+
+    time_range = _get_archive_time_range(h5_file)
+    if time_range is None:
+        return 0
+    first_time, last_time = time_range
+    if meta["next_start"] is None:
+        meta["next_start"] = math.ceil(first_time / dt) * dt
+
+    n_t = meta["n_past"] + meta["n_future"]
+    n_added = 0
+    while True:
+        # Number of complete windows from next_start up to the end of the archive
+        t_avail = last_time - meta["next_start"] - (n_t + _get_n_pad(dt)) * dt
+        n_win = int(t_avail // (meta["step"] * dt)) + 1
+        if n_win <= 0:
+            break
+        n_win = min(n_win, LIBRARY_BLOCK_WINDOWS)
+        arrays = _get_library_windows(h5_file, meta, meta["next_start"], n_win)
+        _append_library(lib_dir, arrays)
+
+        n_added += len(arrays["tstart"])
+        meta["n_windows"] += len(arrays["tstart"])
+        meta["next_start"] += n_win * meta["step"] * dt
+        _write_text(lib_dir / "meta.json", json.dumps(meta, indent=2))
+
+    return n_added
+
+
+def _truncate_library(lib_dir, meta):
+    """Drop any rows written after the last metadata update (e.g. an interrupted run)."""
+    for name, shape in _get_library_shapes(meta).items():
+        with open(Path(lib_dir) / f"{name}.f8", "ab") as fh:
+            fh.truncate(meta["n_windows"] * math.prod(shape) * 8)
+
+
+def _append_library(lib_dir, arrays):
+    """Append the rows of each of the library ``arrays`` to its raw file."""
+    for name, array in arrays.items():
+        with open(Path(lib_dir) / f"{name}.f8", "ab") as fh:
+            np.ascontiguousarray(array, dtype=np.float64).tofile(fh)
+
+
+def _get_archive_time_range(h5_file):
+    """First and last time of the ACE ``h5_file`` archive, or None if it is empty."""
+    # PyTables is only needed to update the library, not to use it
+    import tables
+
+    import arc_h5
+
+    with tables.open_file(h5_file) as h5:
+        archive_tables = arc_h5.get_tables(h5)
+        if not archive_tables or archive_tables[0].nrows == 0:
+            return None
+        first_time = float(archive_tables[0].read(0, 1, field="time")[0])
+        return first_time, arc_h5.get_archive_last_time(h5)
+
+
+def _get_n_pad(dt):
+    """
+    Number of bins read on each side of a block of library windows.
+
+    This makes the gap filling at the block edges the same as for a build in one
+    block.
+    """
+    return int(MAX_FILL_SECS // dt) + 1
+
+
+def _get_library_windows(h5_file, meta, tstart, n_win):
+    """
+    Get the library arrays for ``n_win`` windows starting at ``tstart`` in ``h5_file``.
+
+    Windows with any missing samples are left out.
+
+    Returns
+    -------
+    arrays : dict
+        ``tstart``, ``p_fits``, ``p3_samps`` and ``fluences`` arrays (one row per
+        complete window)
+    """
+    dt = meta["dt"]
+    step = meta["step"]
+    n_t = meta["n_past"] + meta["n_future"]
+    n_pad = _get_n_pad(dt)
+    n_samp = (n_win - 1) * step + n_t
+    series = _get_p3_series(h5_file, tstart - n_pad * dt, dt, n_samp + 2 * n_pad)
+    windows = sliding_window_view(series[n_pad:-n_pad], n_t)[::step]
+    ok = np.all(np.isfinite(windows), axis=1)
+    p3_samps = windows[ok]
+
+    # Linear fit of log10(P3) for each window.  This is the closed form of the
+    # np.polyfit(x, y, 1) used in calc_fluences, but computed per row so a window
+    # gets the same fit whichever block it is computed in.
+    x_past = np.arange(meta["n_past"]) * dt / 3600
+    x_mean = np.mean(x_past)
+    x_resid = x_past - x_mean
+    y_past = np.log10(p3_samps[:, : meta["n_past"]])
+    y_mean = np.mean(y_past, axis=1)
+    slopes = np.sum((y_past - y_mean[:, None]) * x_resid, axis=1) / np.sum(x_resid**2)
+    p_fits = np.column_stack([slopes, y_mean - slopes * x_mean])
+
+    return {
+        "tstart": tstart + np.flatnonzero(ok) * step * dt,
+        "p_fits": p_fits,
+        "p3_samps": p3_samps,
+        "fluences": np.cumsum(p3_samps[:, meta["n_past"] :], axis=1) * dt,
+    }
+
+
+def load_library(lib_dir):
+    """
+    Load an analog library from ``update_library`` memory-mapped (read-only).
+
+    Returns
+    -------
+    p_fits, p3_samps, fluences : np.ndarray
+        Library arrays in the same form as from ``get_fluences``
+    """
+    meta = _read_library_meta(lib_dir)
+    if meta is None:
+        raise FileNotFoundError(f"no fluence library in {lib_dir}")
+
+    arrays = []
+    for name, shape in _get_library_shapes(meta).items():
+        if name == "tstart":
+            continue
+        full_shape = (meta["n_windows"], *shape)
+        if meta["n_windows"] == 0:
+            arrays.append(np.zeros(full_shape))
+        else:
+            arrays.append(
+                np.memmap(
+                    Path(lib_dir) / f"{name}.f8",
+                    dtype=np.float64,
+                    mode="r",
+                    shape=full_shape,
+                )
+            )
+    return tuple(arrays)
+
+
+class AnalogIndex:
+    """
+    Search index over the windows of a fluence analog library.
+
+    The index is built once for the library arrays and then finds the analogs for
+    any current P3 flux and slope without a pass over the whole library:
+
+    - ``select_bin_slope()`` gives exactly the analogs of the original selection in
+      ``get_fluence_percentiles``: all windows within a log10(P3) bin that is widened
+      until it has enough windows, then the ones nearest in slope.  The bin is found
+      by binary search in the presorted log10(P3) values.
+    - ``query()`` gives the ``k`` nearest windows in a feature space of log10(P3),
+      slope and optionally other features, using a KD-tree (requires scipy).
+
+    Parameters
+    ----------
+    p3_fits, p3_samps, fluences : np.ndarray
+        Library arrays from ``get_fluences`` or ``load_library``
+    features : tuple of str
+        Feature names for ``query()``: "log_p3" (last P3 before the forecast),
+        "slope" (of log10 P3 over the past hours) and "log_p3_mean" (mean log10 P3
+        over the past hours)
+    scales : dict or None
+        Distance scale of each feature for ``query()``.  Features not in ``scales``
+        are scaled by their standard deviation over the library.
+    order : np.ndarray or None
+        Library indices in stable sort order of log10(P3), e.g. as saved with the
+        library by ``get_library_order``.  This is computed if not supplied.
+
+    Building the index sorts the library, so it should be built once per library and
+    reused for each forecast (see ``get_library_index`` and ``get_fluences_index``).
+    """
+
+    def __init__(
+        self,
+        p3_fits,
+        p3_samps,
+        fluences,
+        features=("log_p3", "slope"),
+        scales=None,
+        *,
+        order=None,
+    ):
+        self.p3_fits = p3_fits
+        self.p3_samps = p3_samps
+        self.fluences = fluences
+        self.n_past = p3_samps.shape[1] - fluences.shape[1]
+
+        self.log_p3s = np.log10(p3_samps[:, self.n_past - 1])
+        if order is None:
+            order = np.argsort(self.log_p3s, kind="stable")
+        self.order = order
+        self.sorted_log_p3s = self.log_p3s[self.order]
+
+        self.features = tuple(features)
+        self.scales = dict(scales or {})
+        for name in self.features:
+            if name not in ANALOG_FEATURES:
+                raise ValueError(f"unknown analog feature {name!r}")
+        self._tree = None
+        self._scale_vals = None
+
+    def select_bin_slope(
+        self, p3_avg_now, p3_slope_now, min_flux_samples, max_slope_samples
+    ):
+        """
+        Select analogs by P3 flux bin and then by slope.
+
+        Returns
+        -------
+        idxs : np.ndarray
+            Library indices of the analogs in order of increasing slope difference
+        """
+        log_p3_now = np.log10(p3_avg_now)
+        bin_wid = 0.1
+        while True:
+            # Candidates from the sorted values with a small margin, then the exact
+            # bin test of the original selection so the result is identical.
+            margin = bin_wid + 1e-9
+            i0, i1 = np.searchsorted(
+                self.sorted_log_p3s, [log_p3_now - margin, log_p3_now + margin]
+            )
+            idxs = np.sort(self.order[i0:i1])
+            idxs = idxs[np.abs(self.log_p3s[idxs] - log_p3_now) < bin_wid]
+            if len(idxs) > min_flux_samples or bin_wid > 0.5:
+                break
+            bin_wid *= 1.4
+
+        i_near = np.argsort(np.abs(self.p3_fits[idxs, 0] - p3_slope_now))
+        return idxs[i_near[:max_slope_samples]]
+
+    def get_feature_values(self):
+        """Feature values of the library windows as an (n_windows, n_features) array"""
+        cols = []
+        for name in self.features:
+            if name == "log_p3":
+                cols.append(self.log_p3s)
+            elif name == "slope":
+                cols.append(self.p3_fits[:, 0])
+            elif name == "log_p3_mean":
+                log_p3s_past = np.log10(self.p3_samps[:, : self.n_past])
+                cols.append(np.mean(log_p3s_past, axis=1))
+        return np.column_stack(cols)
+
+    def _get_tree(self):
+        if self._tree is None:
+            from scipy.spatial import cKDTree
+
+            vals = self.get_feature_values()
+            self._scale_vals = np.array(
+                [
+                    self.scales.get(name, np.std(vals[:, ii]) or 1.0)
+                    for ii, name in enumerate(self.features)
+                ]
+            )
+            self._tree = cKDTree(vals / self._scale_vals)
+        return self._tree
+
+    def query(self, k, **values_now):
+        """
+        Find the ``k`` nearest analogs to the current feature values.
+
+        Parameters
+        ----------
+        k : int
+            Number of analogs
+        **values_now
+            Current value of each feature, e.g. ``log_p3=3.1, slope=0.02``
+
+        Returns
+        -------
+        idxs : np.ndarray
+            Library indices of the analogs in order of increasing distance
+        """
+        tree = self._get_tree()
+        point = np.array([values_now[name] for name in self.features])
+        k = min(k, tree.n)
+        _, idxs = tree.query(point / self._scale_vals, k=[*range(1, k + 1)])
+        return np.asarray(idxs, dtype=int)
+
+
+def get_library_order(lib_dir, log_p3s):
+    """
+    Get the stable sort order of library ``log_p3s``, saved in ``lib_dir``.
+
+    The order is kept in ``order.i8`` in the library directory.  When the library has
+    grown since the order was saved, only the new windows are sorted and merged into
+    it, which is linear in the library size instead of a full sort.
+
+    Parameters
+    ----------
+    lib_dir : str or Path
+        Library directory from ``update_library``
+    log_p3s : np.ndarray
+        log10(P3) of each library window (see ``AnalogIndex``)
+
+    Returns
+    -------
+    order : np.ndarray
+        Library indices in stable sort order of ``log_p3s``
+    """
+    order_file = Path(lib_dir) / "order.i8"
+    n_windows = len(log_p3s)
+    order = np.fromfile(order_file, dtype=np.int64) if order_file.exists() else None
+    if order is not None and len(order) == n_windows:
+        return order
+
+    if order is None or len(order) > n_windows:
+        order = np.argsort(log_p3s, kind="stable")
+    else:
+        # New windows have higher indices than all the saved ones, so inserting them
+        # after equal saved values gives the same order as a stable sort of all.
+        n_saved = len(order)
+        new_order = n_saved + np.argsort(log_p3s[n_saved:], kind="stable")
+        idxs = np.searchsorted(log_p3s[order], log_p3s[new_order], side="right")
+        order = np.insert(order, idxs, new_order)
+
+    tmp = order_file.with_name(order_file.name + ".tmp")
+    try:
+        order.astype(np.int64).tofile(tmp)
+        tmp.replace(order_file)
+    except OSError as err:
+        print(f"Warning: could not write analog order {order_file}: {err}")
+    return order
+
+
+def get_library_index(lib_dir, **kwargs):
+    """
+    Get the ``AnalogIndex`` of the library in ``lib_dir`` from ``update_library``.
+
+    The index is kept between calls in this process and rebuilt only when the library
+    has changed (e.g. new windows), and the sort order is saved with the library (see
+    ``get_library_order``).  Any ``kwargs`` (``features``, ``scales``) are passed to
+    ``AnalogIndex``.
+    """
+    meta = _read_library_meta(lib_dir)
+    if meta is None:
+        raise FileNotFoundError(f"no fluence library in {lib_dir}")
+    key = (
+        str(Path(lib_dir).resolve()),
+        json.dumps(meta, sort_keys=True),
+        repr(sorted(kwargs.items())),
+    )
+    if key not in _analog_indexes:
+        _drop_analog_indexes(key[0])
+        p3_fits, p3_samps, fluences = load_library(lib_dir)
+        order = None
+        if meta["n_windows"] > 0:
+            n_past = p3_samps.shape[1] - fluences.shape[1]
+            log_p3s = np.log10(p3_samps[:, n_past - 1])
+            order = get_library_order(lib_dir, log_p3s)
+        index = AnalogIndex(p3_fits, p3_samps, fluences, order=order, **kwargs)
+        _analog_indexes[key] = index
+    return _analog_indexes[key]
+
+
+def get_fluences_index(filename="ACE_hourly_avg.npy", cache_dir=None, **kwargs):
+    """
+    Get the ``AnalogIndex`` of the ``get_fluences`` library for ``filename``.
+
+    The index is kept between calls in this process while ``filename`` is unchanged.
+    Any ``kwargs`` (``features``, ``scales``) are passed to ``AnalogIndex``.
+    """
+    stat = Path(filename).stat()
+    key = (
+        str(Path(filename).resolve()),
+        (stat.st_mtime, stat.st_size),
+        repr(sorted(kwargs.items())),
+    )
+    if key not in _analog_indexes:
+        _drop_analog_indexes(key[0])
+        arrays = get_fluences(filename, cache_dir)
+        _analog_indexes[key] = AnalogIndex(*arrays, **kwargs)
+    return _analog_indexes[key]
+
+
+def _drop_analog_indexes(source):
+    """Drop the kept indexes of library ``source`` so old versions are not kept."""
+    for key in [key for key in _analog_indexes if key[0] == source]:
+        del _analog_indexes[key]
+
+
+def get_analog_fluences(
     p3_avg_now,
     p3_slope_now,
     p3_fits,
     p3_samps,
     fluences,
+    *,
     min_flux_samples,
     max_slope_samples,
+    index=None,
+    k_nearest=None,
 ):
     """
-    Compute the 10%, 50%, and 90% fluence time histories within each P3 bin.
-    """
-    p3s = p3_samps[:, N_PAST - 1]
+    Get the fluence time histories of the analogs for the current P3 flux and slope.
 
-    bin_wid = 0.1
-    while True:
-        ok = np.abs(np.log10(p3s) - np.log10(p3_avg_now)) < bin_wid
-        if np.sum(ok) > min_flux_samples or bin_wid > 0.5:
-            break
-        bin_wid *= 1.4
+    The sample resolution is taken from the array shapes, so this works for the
+    hourly library from ``get_fluences`` and the libraries from ``update_library``.
+
+    The analogs are selected with ``index`` (an ``AnalogIndex`` for the library).  If
+    it is not supplied then one is built here, which sorts the whole library, so pass
+    the index from ``get_library_index`` or ``get_fluences_index`` for repeated
+    forecasts.  By default this is the P3 bin then slope
+    selection.  If ``k_nearest`` is set then the ``k_nearest`` nearest analogs in
+    (log10 P3, slope) are used instead.
+
+    Returns
+    -------
+    hrs : np.ndarray
+        Hours from now of the fluence samples
+    fluences : np.ndarray
+        Fluence of each analog scaled to ``p3_avg_now``, shape (n_analogs, len(hrs))
+    """
+    if index is None:
+        index = AnalogIndex(p3_fits, p3_samps, fluences)
 
-    i_near = np.argsort(np.abs(p3_fits[ok, 0] - p3_slope_now))
-    i_near = i_near[:max_slope_samples]
+    if k_nearest is None:
+        idxs = index.select_bin_slope(
+            p3_avg_now, p3_slope_now, min_flux_samples, max_slope_samples
+        )
+    else:
+        idxs = index.query(k_nearest, log_p3=np.log10(p3_avg_now), slope=p3_slope_now)
 
-    p3_samps = p3_samps[ok][i_near]
-    fluences = fluences[ok][i_near]
-    p3s = p3s[ok][i_near]
+    n_future = fluences.shape[1]
+    fluences = fluences[idxs]
+    p3s = p3_samps[idxs, index.n_past - 1]
 
-    hrs = np.arange(1, 49)
+    hrs = np.arange(1, n_future + 1) * (N_FUTURE / n_future)
     fluences = fluences * p3_avg_now / p3s.reshape(-1, 1)
+
+    return hrs, fluences
+
+
+def get_fluence_percentiles(
+    p3_avg_now,
+    p3_slope_now,
+    p3_fits,
+    p3_samps,
+    fluences,
+    min_flux_samples,
+    max_slope_samples,
+    *,
+    index=None,
+    k_nearest=None,
+):
+    """
+    Compute the 10%, 50%, and 90% fluence time histories within each P3 bin.
+
+    See ``get_analog_fluences`` for the analog selection.
+    """
+    hrs, fluences = get_analog_fluences(
+        p3_avg_now,
+        p3_slope_now,
+        p3_fits,
+        p3_samps,
+        fluences,
+        min_flux_samples=min_flux_samples,
+        max_slope_samples=max_slope_samples,
+        index=index,
+        k_nearest=k_nearest,
+    )
     fl10, fl50, fl90 = np.percentile(fluences, [10, 50, 90], axis=0)
 
     return hrs, fl10, fl50, fl90
 
 
+def get_ensemble_fluences(
+    fluences, n_members, scale_sigma=ENSEMBLE_SCALE_SIGMA, seed=0
+):
+    """
+    Bootstrap an ensemble of fluence trajectories from a set of analogs.
+
+    Each member is an analog drawn at random (with replacement) from ``fluences`` and
+    multiplied by a log-normal factor with a standard deviation of ``scale_sigma`` dex.
+    The factor stands for the uncertainty in the current P3 average that the analogs
+    are scaled to, and it spreads the members so that the quantiles of a large
+    ensemble are smooth instead of stepping between the few analog curves.
+
+    Parameters
+    ----------
+    fluences : np.ndarray
+        Analog fluences from ``get_analog_fluences`` with shape (n_analogs, n_future)
+    n_members : int
+        Number of ensemble members
+    scale_sigma : float
+        Standard deviation (dex) of the scale factor of each member
+    seed : int or None
+        Random seed (default=0 so that repeated runs give the same forecast)
+
+    Returns
+    -------
+    members : np.ndarray
+        Member fluences with shape (n_members, n_future)
+    """
+    rng = np.random.default_rng(seed)
+    idxs = rng.integers(len(fluences), size=n_members)
+    scales = 10 ** rng.normal(scale=scale_sigma, size=(n_members, 1))
+    return fluences[idxs] * scales
+
+
 if __name__ == "__main__":
     p3_fits, p3_samps, fluences = get_fluences()
     print("p3_avg_now", end=" ")
@@ -11,24 +11,21 @@ https://gist.github.com/jeanconn/2a34a5219129ed090f8bfaee5582788d
 """
 
 import argparse
-import json
 import sys
-import time
-import urllib.error
-import urllib.parse
-import urllib.request
 
-import numpy as np
-import tables
-from astropy.table import Table, join
-from astropy.time import Time
+import arc_fetch
+import arc_startup
+import arc_time
+
+# Modules imported only once there is new data to archive (see --profile-startup)
+DEFERRED_IMPORTS = ["astropy.table", "arc_h5"]
 
 # URLs for 6 hour and 7 day JSON files
 URL_6H = "https://services.swpc.noaa.gov/json/goes/primary/xrays-6-hour.json"
 URL_7D = "https://services.swpc.noaa.gov/json/goes/primary/xrays-7-day.json"
 
 
-def get_options():
+def get_options(sys_args=None):
     parser = argparse.ArgumentParser(description="Get GOES_X data")
     parser.add_argument("--h5", default="GOES_X.h5", help="HDF5 file name")
     parser.add_argument(
@@ -36,29 +33,63 @@ def get_options():
         type=int,
         help="Select which satelite from the json file by int id",
     )
-    args = parser.parse_args()
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Process the feed even if it is unchanged since the last run",
+    )
+    parser.add_argument(
+        "--profile-startup",
+        action="store_true",
+        help="Report the cold import time of this script and its deferred modules",
+    )
+    args = parser.parse_args(sys_args)
     return args
 
 
-def get_json_data(url):
+def get_fetchers(sys_args=None):
+    """URL fetchers for the concurrent fetch stage of arc_daemon.py"""
+    args = get_options(sys_args)
+    return arc_fetch.get_feed_state(args.h5, args.force).fetchers([URL_6H])
+
+
+def get_json_content(url, feed_state=None):
     """
-    Fetch SWPC data file at url and return as astropy table
+    Fetch SWPC data file at url and return the JSON text
+
+    If ``feed_state`` is supplied then the URL is fetched with a conditional GET and
+    this exits if the content is unchanged since the last run.
     """
-    last_err = None
-    for _ in range(3):
-        try:
-            urlob = urllib.request.urlopen(url)
-            urldat = urlob.read().decode()
-            break
-        except Exception as err:
-            last_err = err
-            time.sleep(5)
-    else:
-        print(("Warning: failed to open URL {}: {}".format(url, last_err)))
+    try:
+        if feed_state is None:
+            content = arc_fetch.fetch_url(url)
+        else:
+            content = feed_state.fetch(url)
+    except Exception as err:
+        print(("Warning: failed to open URL {}: {}".format(url, err)))
+        sys.exit(0)
+
+    if content is None:
         sys.exit(0)
+    return content
+
+
+def read_json_data(content, lasttime=None):
+    """
+    Parse SWPC JSON text and return records after ``lasttime`` as astropy table
 
+    The records are parsed incrementally and those at or before ``lasttime`` (CXC
+    secs) are dropped before the table is made.  The table ``meta`` has the total
+    number of records in the file (``n_records``) and the time of the first record
+    (``first_time``, CXC secs or None) for detecting data gaps.
+    """
+    from astropy.table import Table
+
+    # Allow 1 sec margin since time tags are truncated to the second
+    time_after = None if lasttime is None else arc_time.get_time_tag(lasttime - 1)
     try:
-        dat = Table(json.loads(urldat))
+        records, n_records, first_tag = arc_fetch.read_json_records(content, time_after)
+        dat = Table(records)
     except Exception as err:
         print(
             "Malformed GOES_X data from SWPC; Table(json.loads(urldat)) did not succeed: {}".format(
@@ -66,9 +97,22 @@ def get_json_data(url):
             )
         )
         sys.exit(0)
+
+    dat.meta["n_records"] = n_records
+    dat.meta["first_time"] = (
+        None if first_tag is None else arc_time.parse_time_tags([first_tag]).cxcsec[0]
+    )
     return dat
 
 
+def get_json_data(url, feed_state=None, lasttime=None):
+    """
+    Fetch SWPC data file at url and return records after ``lasttime`` as astropy table
+    """
+    content = get_json_content(url, feed_state)
+    return read_json_data(content, lasttime)
+
+
 def process_xray_data(dat, satellite=None):
     """
     Take the astropy table of 'dat' and rearrange.
@@ -79,6 +123,7 @@ def process_xray_data(dat, satellite=None):
     If optional satellite arg is supplied, filter the source data to include only
     records that match that satellite.
     """
+    from astropy.table import join
 
     if len(dat) == 0:
         print("Warning: No data in fetched file")
@@ -101,21 +146,13 @@ def process_xray_data(dat, satellite=None):
     joindat = join(shortdat, longdat)
 
     # Add a time column with Chandra secs and remove original time_tags
-    times = Time(joindat["time_tag"])
+    times = arc_time.parse_time_tags(joindat["time_tag"])
     joindat["time"] = times.cxcsec
     joindat.remove_column("time_tag")
 
     # Add the other columns the old file format wanted
-    joindat["mjd"] = times.mjd.astype(int)
-    joindat["secs"] = np.array(
-        np.round((times.mjd - joindat["mjd"]) * 86400, decimals=0)
-    ).astype(int)
-    joindat["year"] = [t.year for t in times.datetime]
-    joindat["month"] = [t.month for t in times.datetime]
-    joindat["dom"] = [t.day for t in times.datetime]
-    joindat["hhmm"] = np.array(
-        [f"{t.hour}{t.minute:02}" for t in times.datetime]
-    ).astype(int)
+    for name, vals in arc_time.get_archive_time_cols(times).items():
+        joindat[name] = vals
 
     joindat["ratio"] = -100000.0
     ok = (joindat["long"] != 0) & (joindat["long"] != -100000.0)
@@ -136,49 +173,45 @@ def process_xray_data(dat, satellite=None):
     ].as_array()
 
 
-def main():
-    args = get_options()
+def main(sys_args=None):
+    args = get_options(sys_args)
+    if args.profile_startup:
+        arc_startup.print_startup_profile(__file__, DEFERRED_IMPORTS)
+        return
+    feed_state = arc_fetch.get_feed_state(args.h5, args.force)
 
-    # Read the data file just to get the last record
-    try:
-        with tables.open_file(
-            args.h5, mode="r", filters=tables.Filters(complevel=5, complib="zlib")
-        ) as h5:
-            table = h5.root.data
-            lasttime = table.col("time")[-1]
-    except (OSError, IOError, tables.NoSuchNodeError):
+    # Use the 6 hour file by default.  This exits if it is unchanged since last run.
+    content = get_json_content(URL_6H, feed_state)
+
+    import arc_h5
+
+    # Get the last stored record without holding the archive open during the fetches
+    _, lasttime = arc_h5.get_archive_tail(args.h5)
+    if lasttime is None:
         print("Warning: No previous GOES X data, using -1 as last time")
         lasttime = -1
 
-    # Use the 6 hour file by default
-    dat = get_json_data(URL_6H)
-    newdat = process_xray_data(dat, args.satellite)
+    dat = read_json_data(content, lasttime)
 
     # Use the 7-day file if there is a gap
-    if lasttime < newdat["time"][0]:
+    if dat.meta["first_time"] is not None and lasttime < dat.meta["first_time"]:
         print("Warning: Data gap or error in X-ray data.  Fetching 7-day JSON file")
-        dat = get_json_data(URL_7D)
-        newdat = process_xray_data(dat, args.satellite)
+        dat = get_json_data(URL_7D, lasttime=lasttime)
 
-    # Print a warning if there is still a gap
-    if lasttime < newdat["time"][0]:
-        print(f"Warning: Gap from {lasttime} to X-ray 7-day start {newdat['time'][0]}")
+        # Print a warning if there is still a gap
+        first_time = dat.meta["first_time"]
+        if first_time is not None and lasttime < first_time:
+            print(f"Warning: Gap from {lasttime} to X-ray 7-day start {first_time}")
 
     # Update the data table with the new records
-    with tables.open_file(
-        args.h5, mode="a", filters=tables.Filters(complevel=5, complib="zlib")
-    ) as h5:
-        try:
-            table = h5.root.data
-            lasttime = table.col("time")[-1]
-            ok = newdat["time"] > lasttime
-            newdat = newdat[ok]
-            h5.root.data.append(newdat)
-        except tables.NoSuchNodeError:
-            table = h5.create_table(
-                h5.root, "data", newdat, "GOES_X rates", expectedrows=2e7
-            )
-        h5.root.data.flush()
+    if dat.meta["n_records"] > 0 and len(dat) == 0:
+        print(f"No new GOES X data after {lasttime}")
+    else:
+        newdat = process_xray_data(dat, args.satellite)
+        with arc_h5.H5Appender(args.h5, "GOES_X rates") as appender:
+            appender.append(newdat)
+
+    feed_state.save()
 
 
 if __name__ == "__main__":
@@ -1,17 +1,17 @@
 #!/usr/bin/env python
 
 import argparse
-import collections
 import sys
-import time
 from pathlib import Path
 
 import numpy as np
-import requests
-import tables
-from astropy.table import Table
-from astropy.time import Time
-from Chandra.Time import DateTime
+
+import arc_fetch
+import arc_startup
+import arc_time
+
+# Modules imported only once there is new data to archive (see --profile-startup)
+DEFERRED_IMPORTS = ["tables", "astropy.table", "Chandra.Time", "arc_h5"]
 
 # URLs for 6 hour and 7 day JSON files
 URL_NOAA = "https://services.swpc.noaa.gov/json/goes/primary/"
@@ -21,8 +21,11 @@ URL_7D = f"{URL_NOAA}/differential-protons-7-day.json"
 # Bad or missing data value
 BAD_VALUE = -1.0e5
 
+# Number of recent 5-minute samples averaged for hrc_shield.dat, p4gm.dat and p41gm.dat
+N_RECENT = 3
+
 
-def get_options():
+def get_options(sys_args=None):
     parser = argparse.ArgumentParser(
         description="Archive GOES data and HRC shield rate proxy"
     )
@@ -30,33 +33,82 @@ def get_options():
         "--data-dir", type=str, default=".", help="Directory for output data files"
     )
     parser.add_argument("--h5", default="hrc_shield.h5", help="HDF5 file name")
-    args = parser.parse_args()
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Process the feed even if it is unchanged since the last run",
+    )
+    parser.add_argument(
+        "--profile-startup",
+        action="store_true",
+        help="Report the cold import time of this script and its deferred modules",
+    )
+    args = parser.parse_args(sys_args)
     return args
 
 
-def get_json_data(url):
+def get_fetchers(sys_args=None):
+    """URL fetchers for the concurrent fetch stage of arc_daemon.py"""
+    args = get_options(sys_args)
+    return arc_fetch.get_feed_state(args.h5, args.force).fetchers([URL_6H])
+
+
+def get_json_content(url, feed_state=None):
     """
-    Open the json file and return it as an astropy table
+    Fetch the json file and return the JSON text
+
+    If ``feed_state`` is supplied then the URL is fetched with a conditional GET and
+    this exits if the content is unchanged since the last run.
     """
 
-    last_err = None
-    for _ in range(3):
-        try:
-            json_file = requests.get(url)
-            data = json_file.json()
-            break
-        except Exception as err:
-            last_err = err
-            time.sleep(5)
-    else:
-        print(f"Warning: failed to open URL {url}: {last_err}")
+    try:
+        if feed_state is None:
+            content = arc_fetch.fetch_url(url)
+        else:
+            content = feed_state.fetch(url)
+    except Exception as err:
+        print(f"Warning: failed to open URL {url}: {err}")
+        sys.exit(0)
+
+    if content is None:
         sys.exit(0)
+    return content
 
-    dat = Table(data)
+
+def read_json_data(content, time_after=None):
+    """
+    Parse the JSON text and return records after ``time_after`` as an astropy table
+
+    The records are parsed incrementally and those at or before ``time_after`` (CXC
+    secs) are dropped before the table is made.  The table ``meta`` has the time of
+    the first record in the file (``first_time``, CXC secs or None).
+    """
+    from astropy.table import Table
+
+    # Allow 1 sec margin since time tags are truncated to the second
+    tag_after = None if time_after is None else arc_time.get_time_tag(time_after - 1)
+    try:
+        records, _, first_tag = arc_fetch.read_json_records(content, tag_after)
+    except Exception as err:
+        print(f"Warning: malformed GOES proton data: {err}")
+        sys.exit(0)
+
+    dat = Table(records)
+    dat.meta["first_time"] = (
+        None if first_tag is None else arc_time.parse_time_tags([first_tag]).cxcsec[0]
+    )
 
     return dat
 
 
+def get_json_data(url, feed_state=None, time_after=None):
+    """
+    Open the json file and return records after ``time_after`` as an astropy table
+    """
+    content = get_json_content(url, feed_state)
+    return read_json_data(content, time_after)
+
+
 def calc_hrc_shield(dat):
     # For GOES earlier than 16 use columns p5, p6, p7
     # hrc_shield = (6000 * dat['p5'] + 270000 * dat['p6']
@@ -80,40 +132,48 @@ def format_proton_data(dat, descrs):
     Including columns that the old h5 file format wanted.
     """
 
-    # Create a dictionary to capture the channel data for each time
-    out = collections.defaultdict(dict)
-    for row in dat:
-        out[row["time_tag"]][row["channel"].lower()] = row["flux"] * 1000
-
-    # Reshape that data into a table with the channels as columns
-    newdat = Table(list(out.values())).filled(BAD_VALUE)
-    newdat["time_tag"] = list(out.keys())  # Already in time order if dat rows in order
+    # Index of each record's time tag within the unique time tags, keeping the time
+    # tags in order of first appearance (already time order if dat rows in order).
+    time_tags, i_first, i_time = np.unique(
+        np.asarray(dat["time_tag"]), return_index=True, return_inverse=True
+    )
+    order = np.argsort(i_first, kind="stable")
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    time_tags = time_tags[order]
+    i_time = rank[i_time.ravel()]
+
+    # Scatter the flux of each record into a (time, channel) grid.  Values for any
+    # channel that is missing at a time stay as BAD_VALUE.
+    channels, i_chan = np.unique(
+        np.char.lower(np.asarray(dat["channel"], dtype=str)), return_inverse=True
+    )
+    flux = np.asarray(dat["flux"], dtype=float) * 1000
+    flux[np.isnan(flux)] = BAD_VALUE
+    vals = np.full((len(time_tags), len(channels)), BAD_VALUE)
+    vals[i_time, i_chan.ravel()] = flux
+
+    # Fill the output array with the supplied type directly.  Any columns not set
+    # below are BAD_VALUE, which gets any channels that were just missing altogether.
+    # Looks like p2 and p11 now.
+    arr = np.empty(len(time_tags), dtype=descrs)
+    for col in arr.dtype.names:
+        arr[col] = BAD_VALUE
+    for col, chan_vals in zip(channels, vals.T, strict=True):
+        if col in arr.dtype.names:
+            arr[col] = chan_vals
 
     # Assume the satellite is the same for all of the records of one dat/file
-    newdat["satellite"] = dat["satellite"][0]
+    if "satellite" in arr.dtype.names:
+        arr["satellite"] = dat["satellite"][0]
 
     # Add some time columns
-    times = Time(newdat["time_tag"])
-    newdat["time"] = times.cxcsec
-    newdat["mjd"] = times.mjd.astype(int)
-    newdat["secs"] = np.array(
-        np.round((times.mjd - newdat["mjd"]) * 86400, decimals=0)
-    ).astype(int)
-    newdat["year"] = [t.year for t in times.datetime]
-    newdat["month"] = [t.month for t in times.datetime]
-    newdat["dom"] = [t.day for t in times.datetime]
-    newdat["hhmm"] = np.array(
-        [f"{t.hour}{t.minute:02}" for t in times.datetime]
-    ).astype(int)
-
-    # Take the Table and make it into an ndarray with the supplied type
-    arr = np.ndarray(len(newdat), dtype=descrs)
-    for col in arr.dtype.names:
-        # This gets any channels that were just missing altogether.  Looks like p2 and p11 now
-        if col not in newdat.colnames:
-            arr[col] = BAD_VALUE
-        else:
-            arr[col] = newdat[col]
+    times = arc_time.parse_time_tags(time_tags)
+    cols = arc_time.get_archive_time_cols(times)
+    cols["time"] = times.cxcsec
+    for col, col_vals in cols.items():
+        if col in arr.dtype.names:
+            arr[col] = col_vals
 
     # Calculate the hrc shield values using the numpy array and save into the array
     hrc_shield = calc_hrc_shield(arr)
@@ -124,50 +184,56 @@ def format_proton_data(dat, descrs):
     return arr, hrc_bad
 
 
-def main():
-    args = get_options()
+def main(sys_args=None):
+    args = get_options(sys_args)
+    if args.profile_startup:
+        arc_startup.print_startup_profile(__file__, DEFERRED_IMPORTS)
+        return
+    feed_state = arc_fetch.get_feed_state(args.h5, args.force)
 
-    try:
-        with tables.open_file(
-            args.h5, mode="r", filters=tables.Filters(complevel=5, complib="zlib")
-        ) as h5:
-            table = h5.root.data
-            descrs = table.dtype
-            lasttime = table.col("time")[-1]
-    except (OSError, IOError, tables.NoSuchNodeError):
+    # Use the 6-hour file by default.  This exits if it is unchanged since last run.
+    content = get_json_content(URL_6H, feed_state)
+
+    from Chandra.Time import DateTime
+
+    import arc_h5
+
+    # Get the last stored record without holding the archive open during the fetches
+    descrs, lasttime = arc_h5.get_archive_tail(args.h5)
+    if descrs is None:
         print("Warning: No previous GOES shield data, exiting")
         sys.exit(0)
 
-    # Use the 6-hour file by default
-    dat = get_json_data(url=URL_6H)
-    newdat, hrc_bad = format_proton_data(dat, descrs=descrs)
+    # Parse only records after the last stored time, but keep the last N_RECENT
+    # samples already stored for the recent-average output files below.
+    time_after = None if lasttime is None else lasttime - N_RECENT * 300
+    dat = read_json_data(content, time_after)
 
     # Use the 7-day file if there is a gap
-    if lasttime < newdat["time"][0]:
+    first_time = dat.meta["first_time"]
+    if first_time is not None and lasttime is not None and lasttime < first_time:
         print(
             "Warning: Data gap or error in GOES proton data.  Fetching 7-day JSON file"
         )
-        dat = get_json_data(URL_7D)
-        newdat, hrc_bad = format_proton_data(dat, descrs=descrs)
-
-    with tables.open_file(
-        args.h5, mode="a", filters=tables.Filters(complevel=5, complib="zlib")
-    ) as h5:
-        try:
-            table = h5.root.data
-            ok = newdat["time"] > lasttime
-            h5.root.data.append(newdat[ok])
-        except tables.NoSuchNodeError:
-            table = h5.create_table(
-                h5.root, "data", newdat, "HRC Antico shield + GOES", expectedrows=2e7
-            )
-        h5.root.data.flush()
+        dat = get_json_data(URL_7D, time_after=time_after)
+
+    if len(dat) == 0:
+        print(f"Warning: No GOES proton data after {time_after}, exiting")
+        sys.exit(0)
+
+    newdat, hrc_bad = format_proton_data(dat, descrs=descrs)
+    with arc_h5.H5Appender(
+        args.h5, "HRC Antico shield + GOES", create=False
+    ) as appender:
+        appender.append(newdat)
+
+    feed_state.save()
 
     # Also write the mean of the last three values (15 minutes) to
     # hrc_shield.dat.  Only include good values.
-    times = DateTime(newdat["time"][-3:]).unix
-    hrc_shield = newdat["hrc_shield"][-3:]
-    ok = ~hrc_bad[-3:]
+    times = DateTime(newdat["time"][-N_RECENT:]).unix
+    hrc_shield = newdat["hrc_shield"][-N_RECENT:]
+    ok = ~hrc_bad[-N_RECENT:]
     if len(hrc_shield[ok]) > 0:
         Path(args.data_dir).mkdir(exist_ok=True)
         with open(Path(args.data_dir, "hrc_shield.dat"), "w") as f:
@@ -180,7 +246,7 @@ def main():
     for colname, scale, filename in zip(
         ("p4", "p7"), (3.3, 12.0), ("p4gm.dat", "p41gm.dat"), strict=False
     ):
-        proxy = newdat[colname][-3:] * scale
+        proxy = newdat[colname][-N_RECENT:] * scale
         ok = proxy > 0
         if len(proxy[ok]) > 0:
             with open(Path(args.data_dir, filename), "w") as f:
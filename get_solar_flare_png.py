@@ -9,10 +9,17 @@ from urllib.parse import urljoin
 import requests
 from ska_helpers import retry
 
+import arc_fetch
+
 URL = "https://www.solen.info/solar/index.html"
 IMAGE_SRC_PATTERN = r"<img src=\"(images/AR_CH_\d{8}\.png)\""
 
 
+def get_fetchers(_sys_args=None):
+    """URL fetchers for the concurrent fetch stage of arc_daemon.py"""
+    return arc_fetch.url_fetchers([URL])
+
+
 def get_options():
     parser = argparse.ArgumentParser(description="Get solar flare png")
     parser.add_argument(
@@ -60,11 +67,8 @@ def get_last_referenced_web_image(
     cache_dir = Path(cache_dir)
     cache_dir.mkdir(parents=True, exist_ok=True)
 
-    # Fetch the web page and get the html
-    response = requests.get(url)
-    # Check that the request was successful
-    response.raise_for_status()
-    html = response.text
+    # Fetch the web page and get the html. Retries are handled by the decorator.
+    html = arc_fetch.fetch_url(url, tries=1).decode(errors="replace")
 
     # get absolute url of the image that matches the supplied pattern
     pattern = re.compile(img_src_pattern)
@@ -88,12 +92,10 @@ def get_last_referenced_web_image(
         file.unlink()
 
     # Download the new image and save it to the cache directory
-    response = requests.get(img_url)
-    # Check that the request was successful
-    response.raise_for_status()
+    content = arc_fetch.fetch_url(img_url, tries=1)
 
     with open(cached_image_file, "wb") as f:
-        f.write(response.content)
+        f.write(content)
 
     # And return the cached image path
     return cached_image_file
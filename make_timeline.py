@@ -33,8 +33,9 @@ code, running both in "flight" mode::
 
   # Run PR branch version in "flight" mode (no --test), being explicit about data
   # directory. This version looks for data resources in fixed locations, not in
-  # `data-dir`, so starting with an empty directory is fine.
-  python make_timeline.py --data-dir=t_now/$COMMIT
+  # `data-dir`, so starting with an empty directory is fine.  The legacy layout of
+  # timeline_states.js is used so it can be compared to the flight output.
+  python make_timeline.py --data-dir=t_now/$COMMIT --legacy-states-json
 
   # Run flight version of make_timeline.py in a directory hidden from the git repo.
   cd t_now
@@ -70,9 +71,11 @@ Get the flight run date and convert that to a full date-format date (e.g. "317/1
 
   DATE_NOW=`python utils/get_date_now.py t_now/flight`
 
-Run the script with the test option::
+Run the script with the test option, using the legacy layout of timeline_states.js for
+comparison to the flight output::
 
-  python make_timeline.py --test --data-dir=t_now/$COMMIT --date-now=$DATE_NOW
+  python make_timeline.py --test --legacy-states-json \\
+    --data-dir=t_now/$COMMIT --date-now=$DATE_NOW
 
 To view the output, open the directory in a browser::
 
@@ -87,38 +90,99 @@ Compare the timeline_states.js files::
   diff t_now/{flight,$COMMIT}/timeline_states.yaml
 """
 
+from __future__ import annotations
+
 import argparse
+import collections
+import concurrent.futures
+import contextlib
 import functools
+import hashlib
 import io
 import json
+import math
 import os
 import re
 import sys
 import warnings
 from pathlib import Path
+from typing import TYPE_CHECKING, NamedTuple
 
 os.environ["MPLBACKEND"] = "Agg"
 
 import astropy.units as u
-import kadi.commands.states as kadi_states
-import matplotlib.cbook
-import matplotlib.patches
-import matplotlib.pyplot as plt
 import numpy as np
 import ska_numpy
-import tables
-import yaml
-from astropy.table import Table
 from cxotime import CxoTime, CxoTimeLike
-from kadi import events, occweb
-from ska_matplotlib import lineid_plot, plot_cxctime
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+import arc_fetch
+import arc_startup
+import arc_time
 import calc_fluence_dist as cfd
 
-warnings.filterwarnings("ignore", category=matplotlib.MatplotlibDeprecationWarning)
+if TYPE_CHECKING:
+    from astropy.table import Table
+
+# Heavy modules that are imported in the functions that use them, so that --help,
+# --test-get-web and early exits do not pay for them (see --profile-startup)
+DEFERRED_IMPORTS = [
+    "kadi.commands.states",
+    "kadi.events",
+    "kadi.occweb",
+    "astropy.table",
+    "yaml",
+    "matplotlib.figure",
+    "matplotlib.backends.backend_agg",
+    "ska_matplotlib",
+    "arc_h5",
+]
 
 P3_BAD = -100000
 AXES_LOC = [0.08, 0.15, 0.83, 0.6]
+
+# Attenuated fluence limits for the forecast exceedance probabilities
+FLUENCE_LIMITS = {"yellow": 1e9, "red": 2e9}
+# Line styles of the fluence quantile curves (other quantiles are dotted black)
+QUANTILE_LINES = {0.1: "-g", 0.5: "-b", 0.9: "-r"}
+
+# Number of ensemble members attenuated at once (bounds the memory of one pass)
+ENSEMBLE_CHUNK = 2000
+
+# What-if scenarios: state values applied from now on, plot line style and label
+WHATIF_SCENARIOS = {
+    "scs107": {
+        "values": {"simpos": -99616},
+        "line": "--m",
+        "label": "SCS-107 now",
+    },
+    "hetg": {
+        "values": {"hetg": "INSR", "letg": "RETR"},
+        "line": "--r",
+        "label": "HETG in now",
+    },
+    "hrc": {
+        "values": {"simpos": -50505},
+        "line": "--c",
+        "label": "HRC-I in now",
+    },
+}
+
+
+class FluenceForecast(NamedTuple):
+    """Fluence forecast from ``get_fluence_forecast`` or ``get_ensemble_forecast``"""
+
+    times: np.ndarray
+    quantiles: list
+    fluences: np.ndarray
+    limit_probs: dict
+    limit_times: dict
+
+
 SKA = Path(os.environ["SKA"])
 DATA_ARC3 = SKA / "data" / "arc3"
 COMMS_AVAIL_URL = (
@@ -161,9 +225,10 @@ def cxc2pd(times: CxoTimeLike) -> float | np.ndarray:
     Convert CXC time(s) to matplotlib plot date(s).
 
     This replaces the old ``ska_matplotlib.cxctime2plotdate`` function with a more
-    general version that accepts any CxoTimeLike object.
+    general version that accepts CXC seconds, date strings or ``CxoTime`` (scalar or
+    array), see ``arc_time.get_plot_dates``.
     """
-    return CxoTime(times).plot_date
+    return arc_time.get_plot_dates(times)
 
 
 def get_parser():
@@ -198,6 +263,65 @@ def get_parser():
         type=int,
         help="Minimum number of samples when filtering by flux (default=100)",
     )
+    parser.add_argument(
+        "--analog-source",
+        default="hourly-avg",
+        choices=["hourly-avg", "ace-h5"],
+        help=(
+            "Source of the P3 fluence analogs for the percentile curves: "
+            "ACE_hourly_avg.npy or a library built incrementally from ACE.h5 "
+            "(default=hourly-avg)"
+        ),
+    )
+    parser.add_argument(
+        "--analog-resolution",
+        default="1h",
+        choices=list(cfd.LIBRARY_RESOLUTIONS),
+        help="Sample resolution of the ACE.h5 analog library (default=1h)",
+    )
+    parser.add_argument(
+        "--k-nearest",
+        type=int,
+        help=(
+            "Use the k nearest analogs in (log10 P3, slope) instead of the flux bin "
+            "and slope selection"
+        ),
+    )
+    parser.add_argument(
+        "--fluence-quantiles",
+        default=[0.1, 0.5, 0.9],
+        type=float,
+        nargs="+",
+        help="Quantiles of the analog fluence forecast to plot (default=0.1 0.5 0.9)",
+    )
+    parser.add_argument(
+        "--ensemble",
+        type=int,
+        help=(
+            "Number of Monte Carlo ensemble members bootstrapped from the analogs "
+            "for the fluence quantiles and limit probabilities, computed serially "
+            "in this process (default=use the analogs directly)"
+        ),
+    )
+    parser.add_argument(
+        "--whatif",
+        nargs="+",
+        choices=list(WHATIF_SCENARIOS),
+        help="What-if state scenarios to predict and overlay on the fluence plot",
+    )
+    parser.add_argument(
+        "--whatif-workers",
+        type=int,
+        help="Number of processes for the what-if scenarios (default=one per scenario)",
+    )
+    parser.add_argument(
+        "--legacy-states-json",
+        action="store_true",
+        help=(
+            "Write timeline_states.js in the flight layout, with a dict of all values "
+            "for each time step and no fluence limit or what-if values"
+        ),
+    )
     parser.add_argument(
         "--test",
         action="store_true",
@@ -219,6 +343,11 @@ def get_parser():
             "data_dir. This is a one-time operation to get the data for testing."
         ),
     )
+    parser.add_argument(
+        "--profile-startup",
+        action="store_true",
+        help="Report the cold import time of this script and its deferred modules",
+    )
     parser.add_argument(
         "--date-now",
         type=str,
@@ -258,23 +387,28 @@ hrc_h5_file = functools.partial(arc_data_file, DATA_ARC3, "hrc_shield.h5")
 comms_avail_file = functools.partial(arc_data_file, DATA_ARC3, "comms_avail.html")
 
 
+def get_fetchers(_sys_args=None):
+    """Fetchers for the concurrent fetch stage of arc_daemon.py"""
+    from kadi import occweb
+
+    return {COMMS_AVAIL_URL: functools.partial(occweb.get_occweb_page, COMMS_AVAIL_URL)}
+
+
 def get_web_data(data_dir):
     """Get ACIS fluence, ACE rates, and DSN comms from CXC web pages
 
-    Output files are placed in ``data_dir``.
+    Output files are placed in ``data_dir``.  The pages are fetched concurrently.
     """
-    import urllib.request
-
     urls_file_funcs = [
         ("/acis/Fluence/current.dat", acis_fluence_file),
         ("/mta/RADIATION/ACE/ace.html", ace_rates_file),
         ("/mta/ASPECT/dsn_summary/dsn_summary.yaml", dsn_comms_file),
     ]
+    urls = ["https://cxc.cfa.harvard.edu" + url for url, _ in urls_file_funcs]
+    arc_fetch.prefetch(arc_fetch.url_fetchers(urls))
 
-    for url, file_path_func in urls_file_funcs:
-        urllib.request.urlretrieve(
-            "https://cxc.cfa.harvard.edu" + url, file_path_func(data_dir, test=True)
-        )
+    for url, (_, file_path_func) in zip(urls, urls_file_funcs, strict=True):
+        file_path_func(data_dir, test=True).write_bytes(arc_fetch.fetch_url(url))
 
 
 def get_fluence(filename):
@@ -315,8 +449,13 @@ def get_comms_avail(start: CxoTime, stop: CxoTime) -> Table | None:
     dat : Table | None
         Table of available DSN comms, or None if URL could not be read
     """
+    from astropy.table import Table
+    from kadi import occweb
+
     try:
-        text = occweb.get_occweb_page(COMMS_AVAIL_URL)
+        text = arc_fetch.get_prefetched(
+            COMMS_AVAIL_URL, occweb.get_occweb_page, COMMS_AVAIL_URL
+        )
         if os.environ.get("ARC_TEST_SCENARIO") == "avail-comms-read-fail":
             # Test failed read
             raise Exception
@@ -380,6 +519,8 @@ def get_radzones():
     """
     Constuct a list of complete radiation zones using kadi events
     """
+    from kadi import events
+
     radzones = events.rad_zones.filter(start=CxoTime() - 5 * u.day, stop=None)
     return [(x.start, x.stop) for x in radzones]
 
@@ -391,65 +532,146 @@ def get_comms(
     """
     Get the list of comm passes from the DSN summary file.
     """
+    import yaml
+
     dat = yaml.safe_load(open(dsn_comms_file(data_dir, test), "r"))
     return dat
 
 
+def get_radzone_secs(radzones):
+    """
+    Get the start and stop times of ``radzones`` as an (n, 2) array of CXC secs.
+
+    All the dates are converted in a single ``arc_time.get_secs`` call.
+    """
+    if len(radzones) == 0:
+        return np.zeros((0, 2))
+    return arc_time.get_secs(radzones).reshape(-1, 2)
+
+
+def get_radzone_reset_indices(times, radzones):
+    """
+    Get the index in ``times`` of the first sample in each of the ``radzones``.
+
+    This is where ``zero_fluence_at_radzone`` resets the fluence.  Radzones with no
+    sample (t0 < time <= t1) are skipped.  The ``radzones`` can be a list of (start,
+    stop) dates or the array of CXC secs from ``get_radzone_secs``.
+    """
+    if not isinstance(radzones, np.ndarray):
+        radzones = get_radzone_secs(radzones)
+
+    idxs = np.searchsorted(times, radzones[:, 0], side="right")
+    ok = idxs < len(times)
+    ok[ok] = times[idxs[ok]] <= radzones[ok, 1]
+    return idxs[ok]
+
+
 def zero_fluence_at_radzone(times, fluence, radzones):
     """
     Zero the fluence estimate at the start of each radzone.
 
     For the given ``fluence`` estimate which is sampled at ``times``, reset the fluence
-    to zero at the start of each of the ``radzones``.
+    to zero at the start of each of the ``radzones``.  The ``radzones`` can be a list
+    of (start, stop) dates or the array of CXC secs from ``get_radzone_secs``.
+
+    ``fluence`` can have shape (n_times,) or (n_curves, n_times) to reset several
+    fluence curves in one call.
 
     This works on ``fluence`` in place.
     """
-    for radzone in radzones:
-        t0, t1 = CxoTime(radzone).secs
-        ok = (times > t0) & (times <= t1)
-        if np.any(ok):
-            idx0 = np.flatnonzero(ok)[0]
-            fluence[idx0:] -= fluence[idx0]
+    idxs = get_radzone_reset_indices(times, radzones)
+    if len(idxs) == 0:
+        return
+
+    # Index of the last reset at or before each sample, then subtract the fluence at
+    # that reset from every sample after it in one operation.
+    reset_idxs = np.full(len(times), -1)
+    reset_idxs[idxs] = idxs
+    reset_idxs = np.maximum.accumulate(reset_idxs)
+    after = reset_idxs >= 0
+    fluence[..., after] -= fluence[..., reset_idxs[after]]
+
+
+def get_state_indices(states, times, right_closed=False):
+    """
+    Get the index of the state containing each of ``times``.
+
+    A sample is in a state if ``tstart < time < tstop`` (or ``tstart < time <= tstop``
+    if ``right_closed`` is True).  The states must be in time order and not overlap,
+    as for kadi states.
+
+    Parameters
+    ----------
+    states : Table
+        States with ``tstart`` and ``tstop`` columns
+    times : np.ndarray
+        Sample times (CXC secs)
+    right_closed : bool
+        Include a sample at ``tstop`` of a state in that state
+
+    Returns
+    -------
+    state_idx : np.ndarray
+        Index into ``states`` for each time, or -1 if the time is not in any state
+    """
+    tstarts = np.asarray(states["tstart"], dtype=float)
+    tstops = np.asarray(states["tstop"], dtype=float)
+    state_idx = np.searchsorted(tstarts, times, side="left") - 1
+    in_state = state_idx >= 0
+    tstops_idx = tstops[state_idx[in_state]]
+    in_state[in_state] = (
+        times[in_state] <= tstops_idx if right_closed else times[in_state] < tstops_idx
+    )
+    state_idx[~in_state] = -1
+    return state_idx
 
 
-def calc_fluence(times, fluence0, rates, states):
+def calc_fluence(times, fluence0, rates, states, state_idx=None):
     """
     Calculate the fluence based on the current fluence, rates, and grating states.
 
     For the given starting ``fluence0`` (taken from the current ACIS ops estimate) and
     predicted P3 ``rates`` and grating ``states``, return the integrated fluence.
+
+    The ``rates`` are attenuated according to the state at each of ``times``: zero
+    with the SIM out of the focal plane (simpos < 40000), divided by 5 with HETG in
+    and by 2 with LETG in.  ``rates`` can have shape (n_times,) or (n_curves,
+    n_times) to calculate several fluence curves at once.  The state index of each
+    sample from ``get_state_indices(states, times)`` can be supplied as
+    ``state_idx`` to avoid computing it again for each set of rates.
     """
-    for state in states:
-        ok = (state["tstart"] < times) & (times < state["tstop"])
-        if state["simpos"] < 40000:
-            rates[ok] = 0.0
-        if state["hetg"] == "INSR":
-            rates[ok] = rates[ok] / 5.0
-        if state["letg"] == "INSR":
-            rates[ok] = rates[ok] / 2.0
+    if state_idx is None:
+        state_idx = get_state_indices(states, times)
+
+    # Grating rate divisors and SIM-out flag for each state, with an extra last entry
+    # of no attenuation that state_idx = -1 (not in any state) selects.
+    hetg_divisor = np.append(np.where(states["hetg"] == "INSR", 5.0, 1.0), 1.0)
+    letg_divisor = np.append(np.where(states["letg"] == "INSR", 2.0, 1.0), 1.0)
+    sim_out = np.append(np.asarray(states["simpos"]) < 40000, False)
 
-    fluence = (fluence0 + np.cumsum(rates)) / 1e9
+    rates = np.asarray(rates) / hetg_divisor[state_idx] / letg_divisor[state_idx]
+    rates[..., sim_out[state_idx]] = 0.0
+
+    fluence = (fluence0 + np.cumsum(rates, axis=-1)) / 1e9
     return fluence
 
 
 def get_h5_data(h5_file, col_time, col_values, start, stop, test=False):
     """
     Get data from an HDF5 file and return the time and values within the time range.
-    """
-    tstart = CxoTime(start).secs
-    tstop = CxoTime(stop).secs
 
-    with tables.open_file(h5_file) as h5:
-        times = h5.root.data.col(col_time)
-        values = h5.root.data.col(col_values)
+    Only the archive rows within the time range are read, see
+    ``arc_h5.read_time_window``.
+    """
+    import arc_h5
 
-    # If testing, it is common to have the test data file not be updated to the current
-    # time. In that case, just hack the times to seem current.
-    if test and (dt := tstop - times[-1]) > 3600:
-        times += dt
+    tstart = arc_time.get_secs(start)
+    tstop = arc_time.get_secs(stop)
 
-    ok = (tstart < times) & (times <= tstop)
-    return times[ok], values[ok]
+    times, values = arc_h5.read_time_window(
+        h5_file, tstart, tstop, [col_time, col_values], col_time=col_time, test=test
+    )
+    return times, values
 
 
 def get_ace_p3(
@@ -588,7 +810,7 @@ def plot_multi_line(x, y, z, bins, colors, ax):
     lc = LineCollection(segments, cmap=cmap, norm=norm)
     lc.set_array(z)
     lc.set_linewidth(3)
-    ax.add_collection(lc)
+    return ax.add_collection(lc)
 
 
 def get_p3_slope(p3_times, p3_vals):
@@ -609,6 +831,317 @@ def get_p3_slope(p3_times, p3_vals):
     return slope
 
 
+class _DynamicAxes:
+    """
+    Stand-in for the timeline axes that updates the lines of the previous cycle.
+
+    The ``draw_*`` functions for the values that change every cycle are given this in
+    place of the axes between ``begin_cycle()`` and ``end_cycle()``.  Each ``plot()``
+    or ``add_collection()`` call is matched to the artist made by the same call (same
+    format and keyword arguments, counting repeats) in the previous cycle, and that
+    artist is updated in place.  Artists that were not used in a cycle are removed by
+    ``end_cycle()``.  Other attributes are those of the axes, so any other artist
+    (e.g. from ``fill_between()``) is drawn anew each cycle and removed by the next
+    ``begin_cycle()``.
+    """
+
+    def __init__(self, ax):
+        self.ax = ax
+        self.artists = {}
+        self.counts = collections.Counter()
+        self.before = set()
+        self.untracked = []
+
+    def __getattr__(self, name):
+        return getattr(self.ax, name)
+
+    def _get_key(self, kind, args, kwargs):
+        call = (kind, repr(args), repr(sorted(kwargs.items())))
+        self.counts[call] += 1
+        return (*call, self.counts[call])
+
+    def plot(self, x, y, *args, **kwargs):
+        key = self._get_key("plot", args, kwargs)
+        line = self.artists.get(key)
+        if line is None:
+            (line,) = self.ax.plot(x, y, *args, **kwargs)
+            self.artists[key] = line
+        else:
+            line.set_data(x, y)
+        return [line]
+
+    def add_collection(self, collection):
+        key = self._get_key("collection", (type(collection).__name__,), {})
+        old = self.artists.get(key)
+        if old is None:
+            self.artists[key] = self.ax.add_collection(collection)
+            return collection
+        old.set_segments(collection.get_segments())
+        old.set_cmap(collection.get_cmap())
+        old.set_norm(collection.norm)
+        old.set_array(collection.get_array())
+        return old
+
+    def begin_cycle(self):
+        for artist in self.untracked:
+            artist.remove()
+        self.before = set(self.ax.get_children())
+
+    def end_cycle(self):
+        for key in list(self.artists):
+            if key[3] > self.counts[key[:3]]:
+                self.artists.pop(key).remove()
+        self.counts.clear()
+        tracked = set(self.artists.values())
+        self.untracked = [
+            artist
+            for artist in self.ax.get_children()
+            if artist not in self.before and artist not in tracked
+        ]
+
+
+class TimelineRenderer:
+    """
+    Timeline plot figure that is kept and updated from one cycle to the next.
+
+    Most of the plot changes only when the loads, radzones or DSN schedule change: the
+    comm pass, radzone and available comms patches and the HRC/ACIS state line.  This
+    static layer is drawn over the plot time range plus ``STATIC_MARGIN`` on each side
+    and is rebuilt only when its inputs change or the plot range moves outside it.  The
+    fluence, NOW line, ACE / HRC / GOES data and limit lines are drawn on top of that
+    each cycle by updating the lines of the previous cycle with ``set_data`` (see
+    ``_DynamicAxes``).  The obsid and comm labels from ``lineid_plot`` are laid out
+    again each cycle.
+
+    The figure is not managed by pyplot, so in a persistent process (``arc_daemon.py``)
+    it is not closed between cycles.  Use ``get_renderer()`` to get the renderer for
+    the process.
+
+    Parameters
+    ----------
+    fluence_times : np.ndarray
+        Fluence prediction times of the first cycle (for the off-plot legend lines)
+    """
+
+    # Time the static layer extends past the plot time range on each side
+    STATIC_MARGIN = 1.0 * u.day
+
+    def __init__(self, fluence_times):
+        import matplotlib.figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+        warnings.filterwarnings(
+            "ignore", category=matplotlib.MatplotlibDeprecationWarning
+        )
+
+        self.fig = matplotlib.figure.Figure(figsize=(9, 5))
+        FigureCanvasAgg(self.fig)
+        self.fig.patch.set_alpha(0.0)
+        ax = self.fig.add_axes(AXES_LOC, facecolor="w")
+        ax.yaxis.tick_right()
+        ax.yaxis.set_label_position("right")
+        ax.yaxis.set_offset_position("right")
+        ax.patch.set_alpha(1.0)
+        ax.grid()
+        ax.set_ylabel("Attenuated fluence / 1e9")
+        self.ax = ax
+        self.dynamic_ax = _DynamicAxes(ax)
+
+        draw_dummy_lines_letg_hetg_legend(fluence_times, self.fig, ax)
+        _, _, y0, y1 = set_plot_x_y_axis_limits(
+            CxoTime(fluence_times[0]), CxoTime(fluence_times[-1]), ax
+        )
+        # Draw log scale y-axis on left
+        draw_log_scale_axes(self.fig, y0, y1)
+
+        self.static_key = None
+        self.static_range = (0.0, 0.0)
+        self.static_artists = []
+        self.label_artists = []
+
+    def _get_new_artists(self, before):
+        return [
+            artist
+            for artist in [*self.ax.get_children(), *self.fig.texts]
+            if artist not in before
+        ]
+
+    def _get_artists(self):
+        return {*self.ax.get_children(), *self.fig.texts}
+
+    def update_static_layer(self, start, stop, *, states, radzones, comms, comms_avail):
+        """
+        Rebuild the static layer if it is out of date.
+
+        The layer is out of date if its inputs changed or ``start`` to ``stop`` is
+        outside of it.
+
+        Returns
+        -------
+        rebuilt : bool
+            True if the static layer was rebuilt
+        """
+        key = get_static_key(states, radzones, comms, comms_avail)
+        tstart, tstop = self.static_range
+        if key == self.static_key and tstart <= start.secs and stop.secs <= tstop:
+            return False
+
+        for artist in self.static_artists:
+            artist.remove()
+
+        static_start = start - self.STATIC_MARGIN
+        static_stop = stop + self.STATIC_MARGIN
+        x0, x1 = static_start.plot_date, static_stop.plot_date
+        y0, y1 = self.ax.get_ylim()
+        before = self._get_artists()
+        draw_communication_passes(comms, self.ax, x0, x1, y0, y1)
+        draw_radiation_zones(static_start, static_stop, radzones, self.ax, y0, y1)
+        draw_comms_avail(comms_avail, self.ax)
+        draw_hrc_acis_states(static_start, static_stop, states, self.ax)
+        self.static_artists = self._get_new_artists(before)
+
+        self.static_key = key
+        self.static_range = (static_start.secs, static_stop.secs)
+        return True
+
+    def render(
+        self,
+        *,
+        args,
+        now,
+        start,
+        stop,
+        states,
+        state_idx,
+        radzones,
+        radzone_secs,
+        comms,
+        comms_avail,
+        fluence0,
+        fluence_times,
+        fluence,
+        analogs,
+        whatifs,
+        goes_x,
+        p3,
+        hrc,
+    ):
+        """
+        Draw the timeline plot for one cycle.
+
+        ``goes_x``, ``p3`` and ``hrc`` are (times, values) of the recent data.  The
+        other arguments are as in ``main()``.
+
+        Returns
+        -------
+        fluence_forecast : FluenceForecast or None
+            Fluence forecast from ``draw_fluence_percentiles``
+        next_comm : dict or None
+            Next comm pass
+        """
+        from ska_matplotlib import lineid_plot
+
+        ax = self.ax
+        dynamic_ax = self.dynamic_ax
+        x0, x1, y0, y1 = set_plot_x_y_axis_limits(start, stop, ax)
+
+        dynamic_ax.begin_cycle()
+        draw_ace_yellow_red_limits(fluence_times, dynamic_ax)
+        draw_fluence_and_grating_state_line(states, fluence_times, fluence, dynamic_ax)
+        fluence_forecast = draw_fluence_percentiles(
+            args,
+            fluence_times,
+            dynamic_ax,
+            states=states,
+            state_idx=state_idx,
+            radzones=radzone_secs,
+            fluence0=fluence0,
+            analogs=analogs,
+        )
+        draw_whatif_fluences(fluence_times, whatifs, dynamic_ax)
+        id_xs, id_labels, next_comm = get_comm_ids(now, comms)
+        draw_now_line(now, y0, y1, id_xs, id_labels, dynamic_ax)
+        add_labels_for_obsids(start, states, id_xs, id_labels)
+        draw_goes_x_data(*goes_x, dynamic_ax)
+        draw_ace_p3_and_limits(now, start, *p3, dynamic_ax)
+        draw_hrc_proxy(*hrc, dynamic_ax)
+        dynamic_ax.end_cycle()
+
+        self.update_static_layer(
+            start,
+            stop,
+            states=states,
+            radzones=radzones,
+            comms=comms,
+            comms_avail=comms_avail,
+        )
+
+        # Lay out the obsid and comm labels again.  lineid_plot assumes that the axes
+        # texts are its own labels (other labels are figure texts, see label_right).
+        for artist in self.label_artists:
+            artist.remove()
+        ax.set_position(AXES_LOC)
+        ax.legend(loc="upper center", labelspacing=0.15, fontsize=10)
+        before = self._get_artists()
+        lineid_plot.plot_line_ids(
+            cxc2pd([start.secs, stop.secs]),
+            [y1, y1],
+            id_xs,
+            id_labels,
+            ax=ax,
+            box_axes_space=0.14,
+            label1_size=10,
+        )
+        self.label_artists = self._get_new_artists(before)
+
+        return fluence_forecast, next_comm
+
+
+_renderer = None
+
+
+def get_renderer(fluence_times):
+    """Get the ``TimelineRenderer`` of this process (creating it the first time)"""
+    global _renderer  # noqa: PLW0603
+    if _renderer is None:
+        _renderer = TimelineRenderer(fluence_times)
+    return _renderer
+
+
+def get_static_key(states, radzones, comms, comms_avail):
+    """
+    Get a hash of the inputs of the static layer of the timeline plot.
+    """
+    # The first and last states are clipped to the plot time range, so use the state
+    # transition times
+    hasher = hashlib.sha256()
+    hasher.update(np.asarray(states["tstart"][1:]).tobytes())
+    hasher.update(np.asarray(states["simpos"]).tobytes())
+    hasher.update(repr(radzones).encode())
+    hasher.update(json.dumps(comms, sort_keys=True, default=str).encode())
+    if comms_avail is not None:
+        for name in ("avail_bot", "avail_eot"):
+            hasher.update(repr(list(comms_avail[name])).encode())
+    return hasher.hexdigest()
+
+
+def label_right(ax, y, text):
+    """
+    Add ``text`` just right of ``ax`` at ``y`` (data coordinates).
+
+    This is a figure text so that the axes texts are only the labels of
+    ``lineid_plot``, which fails if there are other axes texts.
+    """
+    import matplotlib.transforms
+
+    transform = matplotlib.transforms.blended_transform_factory(
+        ax.transAxes, ax.transData
+    )
+    ax.figure.text(
+        1.01, y, text, transform=transform, ha="left", va="center", size="small"
+    )
+
+
 def main(args_sys=None):
     """
     Generate the Replan Central timeline plot.
@@ -616,6 +1149,10 @@ def main(args_sys=None):
     parser = get_parser()
     args = parser.parse_args(args_sys)
 
+    if args.profile_startup:
+        arc_startup.print_startup_profile(__file__, DEFERRED_IMPORTS)
+        return
+
     if args.test_get_web:
         get_web_data(args.data_dir)
         sys.exit(0)
@@ -633,8 +1170,11 @@ def main(args_sys=None):
     comms_avail = get_comms_avail(now, stop)
     comms_avail_humans = get_comms_avail_for_humans(comms_avail)
 
+    import kadi.commands.states as kadi_states
+
     states = kadi_states.get_states(start=start, stop=stop, scenario="flight")
     radzones = get_radzones()
+    radzone_secs = get_radzone_secs(radzones)
     comms = get_comms()
 
     # Get the ACIS ops fluence estimate and current 2hr avg flux
@@ -658,59 +1198,44 @@ def main(args_sys=None):
     # Compute the predicted fluence based on the current 2hr average flux.
     fluence_times = np.arange(fluence_date.secs, stop.secs, args.dt)
     rates = np.ones_like(fluence_times) * max(avg_flux, 0.0) * args.dt
-    fluence = calc_fluence(fluence_times, fluence0, rates, states)
-    zero_fluence_at_radzone(fluence_times, fluence, radzones)
-
-    # Initialize the main plot figure
-    fig = plt.figure(1, figsize=(9, 5))
-    fig.patch.set_alpha(0.0)
-    ax = fig.add_axes(AXES_LOC, facecolor="w")
-    ax.yaxis.tick_right()
-    ax.yaxis.set_label_position("right")
-    ax.yaxis.set_offset_position("right")
-    ax.patch.set_alpha(1.0)
-
-    draw_ace_yellow_red_limits(fluence_times, ax)
-    draw_dummy_lines_letg_hetg_legend(fluence_times, fig, ax)
-    draw_fluence_and_grating_state_line(states, fluence_times, fluence, ax)
-    draw_fluence_percentiles(
-        args, states, radzones, fluence0, avg_flux, p3_times, p3_vals, fluence_times, ax
-    )
-    x0, x1, y0, y1 = set_plot_x_y_axis_limits(start, stop, ax)
-    id_xs, id_labels, next_comm = draw_communication_passes(
-        now, comms, ax, x0, x1, y0, y1
-    )
-    draw_radiation_zones(start, stop, radzones, ax, y0, y1)
-    draw_now_line(now, y0, y1, id_xs, id_labels, ax)
-    add_labels_for_obsids(start, states, id_xs, id_labels)
-
-    ax.grid()
-    ax.set_ylabel("Attenuated fluence / 1e9")
-    ax.legend(loc="upper center", labelspacing=0.15, fontsize=10)
-    # NOTE: this function call must be BEFORE any functions that add ax.text() labels to
-    # the plot. For some reason if there are ax.text() labels you get an exception:
-    #     box.xyann = (wlp[i], box.xyann[1])
-    #                          ^^^^^^^^^
-    # AttributeError: 'Text' object has no attribute 'xyann'
-    lineid_plot.plot_line_ids(
-        cxc2pd([start.secs, stop.secs]),
-        [y1, y1],
-        id_xs,
-        id_labels,
-        ax=ax,
-        box_axes_space=0.14,
-        label1_size=10,
+    state_idx = get_state_indices(states, fluence_times)
+    fluence = calc_fluence(fluence_times, fluence0, rates, states, state_idx)
+    zero_fluence_at_radzone(fluence_times, fluence, radzone_secs)
+
+    analogs = get_current_analogs(args, avg_flux, p3_times, p3_vals)
+    whatifs = get_whatif_predictions(
+        args,
+        states=states,
+        radzones=radzone_secs,
+        fluence0=fluence0,
+        fluence_times=fluence_times,
+        rates=rates,
+        analogs=analogs,
     )
 
-    draw_comms_avail(comms_avail, ax, x0, x1)
-    draw_goes_x_data(goes_x_times, goes_x_vals, ax)
-    draw_ace_p3_and_limits(now, start, p3_times, p3_vals, ax)
-    draw_hrc_proxy(hrc_times, hrc_vals, ax)
-    draw_hrc_acis_states(start, stop, states, ax, x0, x1)
-
-    # Draw log scale y-axis on left
-    draw_log_scale_axes(fig, y0, y1)
-
+    # Draw the plot with the figure kept from the last cycle in a persistent process
+    renderer = get_renderer(fluence_times)
+    fig, ax = renderer.fig, renderer.ax
+    fluence_forecast, next_comm = renderer.render(
+        args=args,
+        now=now,
+        start=start,
+        stop=stop,
+        states=states,
+        state_idx=state_idx,
+        radzones=radzones,
+        radzone_secs=radzone_secs,
+        comms=comms,
+        comms_avail=comms_avail,
+        fluence0=fluence0,
+        fluence_times=fluence_times,
+        fluence=fluence,
+        analogs=analogs,
+        whatifs=whatifs,
+        goes_x=(goes_x_times, goes_x_vals),
+        p3=(p3_times, p3_vals),
+        hrc=(hrc_times, hrc_vals),
+    )
     fig.savefig(os.path.join(args.data_dir, "timeline.png"))
 
     write_states_json(
@@ -729,6 +1254,9 @@ def main(args_sys=None):
         avg_flux,
         hrc_vals,
         hrc_times,
+        fluence_forecast=fluence_forecast,
+        whatifs=whatifs,
+        legacy=args.legacy_states_json,
     )
     write_comms_avail(
         comms_avail_humans, comms_avail_file(args.data_dir, test=args.test)
@@ -755,42 +1283,47 @@ def draw_log_scale_axes(fig, y0, y1):
     ax2.legend(loc="upper left", labelspacing=0.15, fontsize=10)
 
 
-def draw_hrc_acis_states(start, stop, states, ax, x0, x1):
+def draw_hrc_acis_states(start, stop, states, ax):
+    import kadi.commands.states as kadi_states
+
     times = np.arange(start.secs, stop.secs, 300)
-    state_vals = kadi_states.interpolate_states(states, times)
+    # The last state is clipped to the plot stop time but the static layer extends past
+    # it (see TimelineRenderer), so carry the last state forward to the end.
+    state_vals = kadi_states.interpolate_states(
+        states, np.minimum(times, states["tstop"][-1])
+    )
     y_si = -0.23
     x = cxc2pd(times)
     y = np.zeros_like(times) + y_si
     z = np.zeros_like(times, dtype=float)  # 0 => ACIS
     z[state_vals["simpos"] < 0] = 1.0  # HRC
     plot_multi_line(x, y, z, [0, 1], ["c", "r"], ax)
-    dx = (x1 - x0) * 0.01
-    ax.text(x1 + dx, y_si, "HRC/ACIS", ha="left", va="center", size="small")
+    label_right(ax, y_si, "HRC/ACIS")
 
 
-def draw_comms_avail(comms_avail: Table | None, ax, x0, x1):
+def draw_comms_avail(comms_avail: Table | None, ax):
     """Draw available comms as a gray strip below the ACE/HRC multi-line plot"""
-    if comms_avail is None:
-        # Could not read URL, just make an empty list and carry on.
-        comms_avail = []
-
     y_comm0 = -0.38
     dy_comm = 0.05
-    dx = (x1 - x0) * 0.01
-
-    # Draw comm passes
-    for comm in comms_avail:
-        pd0, pd1 = cxc2pd([comm["avail_bot"], comm["avail_eot"]])
-        patch = matplotlib.patches.Rectangle(
-            (pd0, y_comm0),
-            pd1 - pd0,
-            dy_comm,
-            alpha=0.5,
-            facecolor="k",
-            edgecolor="none",
-        )
-        ax.add_patch(patch)
-    ax.text(x1 + dx, y_comm0, "Avail comms", ha="left", va="center", size="small")
+
+    # Draw comm passes.  If the URL could not be read (None) just carry on.
+    if comms_avail is not None and len(comms_avail) > 0:
+        pd0s = cxc2pd(comms_avail["avail_bot"])
+        pd1s = cxc2pd(comms_avail["avail_eot"])
+        draw_intervals(pd0s, pd1s, y_comm0, dy_comm, ax, alpha=0.5, facecolor="k")
+    label_right(ax, y_comm0, "Avail comms")
+
+
+def draw_intervals(pd0s, pd1s, y0, dy, ax, **kwargs):
+    """
+    Draw time intervals as one collection of rectangles.
+
+    Each interval from ``pd0s`` to ``pd1s`` (plot dates) is a rectangle from ``y0`` to
+    ``y0 + dy``.  ``kwargs`` are the collection properties (e.g. ``facecolor``).
+    """
+    pd0s = np.asarray(pd0s, dtype=float)
+    xranges = np.column_stack([pd0s, np.asarray(pd1s, dtype=float) - pd0s])
+    return ax.broken_barh(xranges, (y0, dy), edgecolor="none", **kwargs)
 
 
 def draw_hrc_proxy(hrc_times, hrc_vals, ax):
@@ -820,12 +1353,12 @@ def draw_goes_x_data(goes_x_times, goes_x_vals, ax):
 
 
 def add_labels_for_obsids(start, states, id_xs, id_labels):
+    obsids = np.asarray(states["obsid"])
+    # Label the first state and each state with a new obsid
+    idxs = np.flatnonzero(obsids[1:] != obsids[:-1]) + 1
     id_xs.extend(cxc2pd([start.secs]))
-    id_labels.append(str(states[0]["obsid"]))
-    for s0, s1 in zip(states[:-1], states[1:], strict=False):
-        if s0["obsid"] != s1["obsid"]:
-            id_xs.append(cxc2pd([s1["tstart"]])[0])
-            id_labels.append(str(s1["obsid"]))
+    id_xs.extend(cxc2pd(np.asarray(states["tstart"])[idxs]))
+    id_labels.extend(str(obsid) for obsid in [obsids[0], *obsids[idxs]])
 
 
 def draw_now_line(now, y0, y1, id_xs, id_labels, ax):
@@ -835,90 +1368,456 @@ def draw_now_line(now, y0, y1, id_xs, id_labels, ax):
 
 
 def draw_radiation_zones(start, stop, radzones, ax, y0, y1):
-    for rad0, rad1 in radzones:
-        t0 = CxoTime(rad0)
-        t1 = CxoTime(rad1)
-        if t0 < stop and t1 > start:
-            t0 = max(t0, start)
-            t1 = min(t1, stop)
-            pd0, pd1 = t0.plot_date, t1.plot_date
-            p = matplotlib.patches.Rectangle(
-                (pd0, y0),
-                pd1 - pd0,
-                y1 - y0,
-                alpha=0.2,
-                facecolor="b",
-                edgecolor="none",
-            )
-            ax.add_patch(p)
-
-
-def draw_communication_passes(now, comms, ax, x0, x1, y0, y1):
-    id_xs = []
-    id_labels = []
-
-    # Draw comm passes
-    next_comm = None
-    for comm in comms:
-        pd0, pd1 = cxc2pd([comm["bot_date"]["value"], comm["eot_date"]["value"]])
-        if pd1 >= x0 and pd0 <= x1:
-            p = matplotlib.patches.Rectangle(
-                (pd0, y0),
-                pd1 - pd0,
-                y1 - y0,
-                alpha=0.2,
-                facecolor="r",
-                edgecolor="none",
-            )
-            ax.add_patch(p)
-        id_xs.append((pd0 + pd1) / 2)
-        id_labels.append(
-            "{}:{}".format(
-                comm["station"]["value"][4:6], comm["track_local"]["value"][:9]
-            )
-        )
-        if next_comm is None and CxoTime(comm["bot_date"]["value"]) > now:
-            next_comm = comm
+    if len(radzones) == 0:
+        return
+    pd0s = cxc2pd([rad0 for rad0, _ in radzones])
+    pd1s = cxc2pd([rad1 for _, rad1 in radzones])
+    ok = (pd0s < stop.plot_date) & (pd1s > start.plot_date)
+    pd0s = np.maximum(pd0s[ok], start.plot_date)
+    pd1s = np.minimum(pd1s[ok], stop.plot_date)
+    draw_intervals(pd0s, pd1s, y0, y1 - y0, ax, alpha=0.2, facecolor="b")
+
+
+def draw_communication_passes(comms, ax, x0, x1, y0, y1):
+    if len(comms) == 0:
+        return
+    pd0s = cxc2pd([comm["bot_date"]["value"] for comm in comms])
+    pd1s = cxc2pd([comm["eot_date"]["value"] for comm in comms])
+    ok = (pd1s >= x0) & (pd0s <= x1)
+    draw_intervals(pd0s[ok], pd1s[ok], y0, y1 - y0, ax, alpha=0.2, facecolor="r")
+
+
+def get_comm_ids(now, comms):
+    """Get the comm pass label positions and text, and the next comm pass after now"""
+    if len(comms) == 0:
+        return [], [], None
+    bot_secs = arc_time.get_secs([comm["bot_date"]["value"] for comm in comms])
+    eot_secs = arc_time.get_secs([comm["eot_date"]["value"] for comm in comms])
+    id_xs = ((cxc2pd(bot_secs) + cxc2pd(eot_secs)) / 2).tolist()
+    id_labels = [
+        "{}:{}".format(comm["station"]["value"][4:6], comm["track_local"]["value"][:9])
+        for comm in comms
+    ]
+    after = np.flatnonzero(bot_secs > now.secs)
+    next_comm = comms[after[0]] if len(after) > 0 else None
     return id_xs, id_labels, next_comm
 
 
-def draw_fluence_percentiles(
-    args, states, radzones, fluence0, avg_flux, p3_times, p3_vals, fluence_times, ax
+def get_fluence_analogs(args):
+    """
+    Get the ``cfd.AnalogIndex`` of the P3 fluence analog library.
+
+    With ``--analog-source=ace-h5`` the library built from ``ACE.h5`` is first updated
+    with any windows from newly archived data.  The index is kept between calls (e.g.
+    in ``arc_daemon.py``) and only rebuilt when the library changes.
+    """
+    if args.analog_source == "ace-h5":
+        h5_file = ace_h5_file(args.data_dir, test=args.test)
+        lib_dir = cfd.get_library_dir(h5_file, args.analog_resolution)
+        cfd.update_library(h5_file, lib_dir, args.analog_resolution)
+        return cfd.get_library_index(lib_dir)
+
+    return cfd.get_fluences_index(ace_hourly_avg_file(args.data_dir, test=args.test))
+
+
+def interpolate_curves(ys, xin, xout):
+    """
+    Linearly interpolate each row of ``ys`` sampled at ``xin`` onto ``xout``.
+
+    ``ys`` has shape (n_curves, len(xin)) and all rows are interpolated in one pass.
+    Values of ``xout`` outside the range of ``xin`` take the end values of each row.
+    """
+    idx = np.clip(np.searchsorted(xin, xout, side="right") - 1, 0, len(xin) - 2)
+    frac = np.clip((xout - xin[idx]) / (xin[idx + 1] - xin[idx]), 0.0, 1.0)
+    return ys[..., idx] * (1.0 - frac) + ys[..., idx + 1] * frac
+
+
+def attenuate_fluence_curves(
+    hrs, curves, fluence_times, *, fluence0, states, state_idx, radzones
 ):
-    """Plot 10, 50, 90 percentiles of fluence"""
+    """
+    Attenuate fluence curves for the grating states and reset them at radzones.
+
+    ``curves`` (shape (n_curves, len(hrs)), sampled at ``hrs`` hours from now) are
+    interpolated onto ``fluence_times`` and all processed in one 2D pass.  The result
+    has shape (n_curves, len(fluence_times) - 1) in units of 1e9, sampled at
+    ``fluence_times[:-1]``.
+    """
+    fluence_hours = (fluence_times - fluence_times[0]) / 3600.0
+    curves = interpolate_curves(curves, hrs, fluence_hours)
+
+    times = fluence_times[:-1]
+    rates = np.diff(curves, axis=1)
+    curves_atten = calc_fluence(times, fluence0, rates, states, state_idx[:-1])
+    zero_fluence_at_radzone(times, curves_atten, radzones)
+    return curves_atten
+
+
+def get_limit_crossings(times, fluences, radzones):
+    """
+    Get the probability and time of reaching each of the ``FLUENCE_LIMITS``.
+
+    Only the samples before the next radzone reset of the fluence are used, so a
+    crossing after the reset does not count.  A reset at the first sample (i.e. now in
+    a radzone) is not the next reset.
+
+    Parameters
+    ----------
+    times : np.ndarray
+        Sample times (CXC secs)
+    fluences : np.ndarray
+        Attenuated fluence curves (units of 1e9) with shape (n_curves, len(times))
+    radzones : np.ndarray
+        Radzone times from ``get_radzone_secs``
+
+    Returns
+    -------
+    limit_probs : dict
+        Fraction of the curves that reach each limit before the next radzone reset
+    limit_times : dict
+        Median time of the first crossing of each limit for the curves that reach it
+        (None if none do)
+    """
+    reset_idxs = get_radzone_reset_indices(times, radzones)
+    reset_idxs = reset_idxs[reset_idxs > 0]
+    n_before = np.min(reset_idxs) if len(reset_idxs) > 0 else len(times)
+
+    limit_probs = {}
+    limit_times = {}
+    for name, limit in FLUENCE_LIMITS.items():
+        over = fluences[:, :n_before] >= limit / 1e9
+        crossed = np.any(over, axis=1)
+        limit_probs[name] = np.mean(crossed) if len(crossed) else 0.0
+        limit_times[name] = (
+            np.median(times[np.argmax(over[crossed], axis=1)])
+            if np.any(crossed)
+            else None
+        )
+    return limit_probs, limit_times
+
+
+def get_fluence_forecast(
+    hrs,
+    analog_fluences,
+    quantiles,
+    *,
+    fluence_times,
+    fluence0,
+    states,
+    state_idx,
+    radzones,
+):
+    """
+    Get the attenuated fluence forecast from a set of P3 fluence analogs.
+
+    The ``quantiles`` of the analog fluences (from ``cfd.get_analog_fluences``) and
+    the analog fluences themselves are attenuated together in one 2D pass (see
+    ``attenuate_fluence_curves``).  The quantile curves are returned for plotting.  The
+    attenuated analogs give the probability of reaching each of the ``FLUENCE_LIMITS``
+    before the next radzone reset and the median time of the first crossing among the
+    analogs that reach it.
+
+    Parameters
+    ----------
+    hrs : np.ndarray
+        Hours from now of the analog fluence samples
+    analog_fluences : np.ndarray
+        Analog fluences with shape (n_analogs, len(hrs))
+    quantiles : list of float
+        Quantiles (0 to 1) of the fluence curves
+    fluence_times : np.ndarray
+        Forecast times (CXC secs)
+    fluence0 : float
+        Current attenuated fluence
+    states : Table
+        Kadi states
+    state_idx : np.ndarray
+        State index of each of ``fluence_times`` from ``get_state_indices``
+    radzones : np.ndarray
+        Radzone times from ``get_radzone_secs``
+
+    Returns
+    -------
+    forecast : FluenceForecast
+        ``fluences`` has shape (len(quantiles), len(times)) in units of 1e9.
+        ``limit_probs`` and ``limit_times`` are dicts keyed like ``FLUENCE_LIMITS``,
+        where a limit time is None if no analog reaches the limit.
+    """
+    quantile_fluences = np.quantile(analog_fluences, quantiles, axis=0)
+    curves_atten = attenuate_fluence_curves(
+        hrs,
+        np.concatenate([quantile_fluences, analog_fluences]),
+        fluence_times,
+        fluence0=fluence0,
+        states=states,
+        state_idx=state_idx,
+        radzones=radzones,
+    )
+
+    times = fluence_times[:-1]
+    n_quantiles = len(quantiles)
+    limit_probs, limit_times = get_limit_crossings(
+        times, curves_atten[n_quantiles:], radzones
+    )
+
+    return FluenceForecast(
+        times, list(quantiles), curves_atten[:n_quantiles], limit_probs, limit_times
+    )
+
+
+def get_ensemble_forecast(
+    hrs,
+    members,
+    quantiles,
+    *,
+    fluence_times,
+    fluence0,
+    states,
+    state_idx,
+    radzones,
+):
+    """
+    Get the attenuated fluence forecast from a Monte Carlo ensemble.
+
+    The ``members`` (from ``cfd.get_ensemble_fluences``) are attenuated in chunks of
+    ``ENSEMBLE_CHUNK`` (see ``attenuate_fluence_curves``) to bound the memory use.  The
+    chunks are run serially in this process: a process pool was slower because each
+    task pickled the states and the member curves.  Unlike ``get_fluence_forecast`` the
+    ``quantiles`` are taken over the attenuated members.  The parameters and returned
+    value are otherwise the same.
+    """
+    n_chunks = max(1, math.ceil(len(members) / ENSEMBLE_CHUNK))
+    members_atten = np.concatenate(
+        [
+            attenuate_fluence_curves(
+                hrs,
+                chunk,
+                fluence_times,
+                fluence0=fluence0,
+                states=states,
+                state_idx=state_idx,
+                radzones=radzones,
+            ).astype(np.float32)
+            for chunk in np.array_split(members, n_chunks)
+        ]
+    )
+
+    times = fluence_times[:-1]
+    limit_probs, limit_times = get_limit_crossings(times, members_atten, radzones)
+    quantile_fluences = np.quantile(members_atten, quantiles, axis=0)
+
+    return FluenceForecast(
+        times, list(quantiles), quantile_fluences, limit_probs, limit_times
+    )
+
+
+def get_current_analogs(args, avg_flux, p3_times, p3_vals):
+    """
+    Get the P3 fluence analogs for the current P3 average flux and slope.
+
+    Returns
+    -------
+    analogs : tuple or None
+        (hrs, analog_fluences) from ``cfd.get_analog_fluences``, or None if there is
+        not enough P3 data for a slope or the analogs could not be read
+    """
     try:
         if len(p3_times) < 4:
             raise ValueError("not enough P3 values")
         p3_slope = get_p3_slope(p3_times, p3_vals)
-        if p3_slope is not None and avg_flux > 0:
-            p3_fits, p3_samps, fluences = cfd.get_fluences(
-                ace_hourly_avg_file(args.data_dir, test=args.test),
-            )
-            hrs, fl10, fl50, fl90 = cfd.get_fluence_percentiles(
-                avg_flux,
-                p3_slope,
-                p3_fits,
-                p3_samps,
-                fluences,
-                args.min_flux_samples,
-                args.max_slope_samples,
+        if p3_slope is None or avg_flux <= 0:
+            return None
+        index = get_fluence_analogs(args)
+        return cfd.get_analog_fluences(
+            avg_flux,
+            p3_slope,
+            index.p3_fits,
+            index.p3_samps,
+            index.fluences,
+            min_flux_samples=args.min_flux_samples,
+            max_slope_samples=args.max_slope_samples,
+            index=index,
+            k_nearest=args.k_nearest,
+        )
+    except Exception as e:
+        print(("WARNING: p3 fluence not plotted, error : {}".format(e)))
+        return None
+
+
+def get_forecast(
+    args, analogs, *, fluence_times, fluence0, states, state_idx, radzones
+):
+    """
+    Get the fluence forecast from the ``analogs`` of ``get_current_analogs``.
+
+    This is the ensemble forecast if ``--ensemble`` is set, otherwise the forecast
+    directly from the analogs.
+    """
+    hrs, analog_fluences = analogs
+    forecast_kwargs = {
+        "fluence_times": fluence_times,
+        "fluence0": fluence0,
+        "states": states,
+        "state_idx": state_idx,
+        "radzones": radzones,
+    }
+    if args.ensemble:
+        members = cfd.get_ensemble_fluences(analog_fluences, args.ensemble)
+        return get_ensemble_forecast(
+            hrs, members, args.fluence_quantiles, **forecast_kwargs
+        )
+    return get_fluence_forecast(
+        hrs, analog_fluences, args.fluence_quantiles, **forecast_kwargs
+    )
+
+
+def draw_fluence_percentiles(
+    args, fluence_times, ax, *, states, state_idx, radzones, fluence0, analogs
+):
+    """
+    Plot the ``--fluence-quantiles`` fluence curves (10, 50, 90 percentiles by default)
+
+    ``analogs`` is from ``get_current_analogs``, ``state_idx`` is the state index of
+    each of ``fluence_times`` from ``get_state_indices`` and ``radzones`` is the
+    radzone times array from ``get_radzone_secs``.
+
+    Returns the ``FluenceForecast`` or None if it could not be computed.
+    """
+    if analogs is None:
+        return None
+
+    forecast = None
+    try:
+        forecast = get_forecast(
+            args,
+            analogs,
+            fluence_times=fluence_times,
+            fluence0=fluence0,
+            states=states,
+            state_idx=state_idx,
+            radzones=radzones,
+        )
+        for quantile, fl_y_atten in zip(
+            forecast.quantiles, forecast.fluences, strict=True
+        ):
+            ax.plot(
+                cxc2pd(forecast.times),
+                fl_y_atten,
+                QUANTILE_LINES.get(quantile, ":k"),
             )
-            fluence_hours = (fluence_times - fluence_times[0]) / 3600.0
-            for fl_y, linecolor in zip(
-                (fl10, fl50, fl90), ("-g", "-b", "-r"), strict=False
-            ):
-                fl_y = ska_numpy.interpolate(fl_y, hrs, fluence_hours)  # noqa: PLW2901
-                rates = np.diff(fl_y)
-                fl_y_atten = calc_fluence(fluence_times[:-1], fluence0, rates, states)
-                zero_fluence_at_radzone(fluence_times[:-1], fl_y_atten, radzones)
-                ax.plot(
-                    cxc2pd(fluence_times[0]) + fluence_hours[:-1] / 24.0,
-                    fl_y_atten,
-                    linecolor,
-                )
     except Exception as e:
         print(("WARNING: p3 fluence not plotted, error : {}".format(e)))
 
+    return forecast
+
+
+def get_scenario_states(states, scenario, tstart):
+    """
+    Get the states for what-if ``scenario`` starting at ``tstart``.
+
+    The state values of the scenario in ``WHATIF_SCENARIOS`` replace those of
+    ``states`` from ``tstart`` on.  The state in progress at ``tstart`` is split there.
+    """
+    states = states.copy()
+    tstarts = np.asarray(states["tstart"], dtype=float)
+    i0 = np.searchsorted(tstarts, tstart, side="left")
+    if i0 > 0 and states["tstop"][i0 - 1] > tstart:
+        states.insert_row(i0, states[i0 - 1])
+        states["tstop"][i0 - 1] = tstart
+        states["tstart"][i0] = tstart
+        if "datestart" in states.colnames:
+            date = arc_time.get_dates(tstart)
+            states["datestop"][i0 - 1] = date
+            states["datestart"][i0] = date
+
+    for name, val in WHATIF_SCENARIOS[scenario]["values"].items():
+        states[name][i0:] = val
+    return states
+
+
+def get_whatif_prediction(
+    scenario, *, args, states, radzones, fluence0, fluence_times, rates, analogs
+):
+    """
+    Get the fluence prediction and forecast for what-if ``scenario``.
+
+    Returns
+    -------
+    fluence : np.ndarray
+        Predicted fluence (units of 1e9) from the current 2hr average flux ``rates``
+    forecast : FluenceForecast or None
+        Forecast from the ``analogs`` (None if there are no analogs)
+    """
+    states = get_scenario_states(states, scenario, fluence_times[0])
+    state_idx = get_state_indices(states, fluence_times)
+    fluence = calc_fluence(fluence_times, fluence0, rates, states, state_idx)
+    zero_fluence_at_radzone(fluence_times, fluence, radzones)
+
+    forecast = None
+    if analogs is not None:
+        forecast = get_forecast(
+            args,
+            analogs,
+            fluence_times=fluence_times,
+            fluence0=fluence0,
+            states=states,
+            state_idx=state_idx,
+            radzones=radzones,
+        )
+    return fluence, forecast
+
+
+def get_whatif_predictions(args, **kwargs):
+    """
+    Get the predictions of ``get_whatif_prediction`` for each ``--whatif`` scenario.
+
+    The scenarios are run in a process pool (one process per scenario unless
+    ``--whatif-workers`` is set).  The states, radzones and analogs in ``kwargs`` are
+    loaded once and a copy is pickled into the task of each scenario.  A scenario that
+    fails (e.g. a worker crash) is left out with a warning so that the flight fluence
+    and outputs are still made.
+
+    Returns
+    -------
+    whatifs : dict
+        (fluence, forecast) keyed by scenario name
+    """
+    scenarios = args.whatif or []
+    n_workers = len(scenarios) if args.whatif_workers is None else args.whatif_workers
+    predict = functools.partial(get_whatif_prediction, args=args, **kwargs)
+    whatifs = {}
+    with contextlib.ExitStack() as stack:
+        if n_workers > 1 and len(scenarios) > 1:
+            executor = stack.enter_context(
+                concurrent.futures.ProcessPoolExecutor(min(n_workers, len(scenarios)))
+            )
+            calls = {
+                scenario: executor.submit(predict, scenario).result
+                for scenario in scenarios
+            }
+        else:
+            calls = {
+                scenario: functools.partial(predict, scenario) for scenario in scenarios
+            }
+        for scenario, call in calls.items():
+            try:
+                whatifs[scenario] = call()
+            except Exception as e:
+                print(f"WARNING: what-if {scenario} not predicted, error : {e}")
+    return whatifs
+
+
+def draw_whatif_fluences(fluence_times, whatifs, ax):
+    """Overlay the predicted fluence of each what-if scenario"""
+    for scenario, (fluence, _) in whatifs.items():
+        ax.plot(
+            cxc2pd(fluence_times),
+            fluence,
+            WHATIF_SCENARIOS[scenario]["line"],
+            lw=1.5,
+            label=WHATIF_SCENARIOS[scenario]["label"],
+        )
+
 
 def set_plot_x_y_axis_limits(start, stop, ax):
     x0, x1 = start.plot_date, stop.plot_date
@@ -934,19 +1833,19 @@ def draw_fluence_and_grating_state_line(states, fluence_times, fluence, ax):
 
     x = cxc2pd(fluence_times)
     y = fluence
-    z = np.zeros(len(fluence_times), dtype=int)
-
-    for state in states:
-        ok = (state["tstart"] < fluence_times) & (fluence_times <= state["tstop"])
-        if state["hetg"] == "INSR":
-            z[ok] = 1
-        elif state["letg"] == "INSR":
-            z[ok] = 2
+    # Grating state code for each state (0=none, 1=HETG, 2=LETG) and an extra last
+    # entry of 0 for samples not in any state (state index -1).
+    hetg = np.asarray(states["hetg"]) == "INSR"
+    letg = np.asarray(states["letg"]) == "INSR"
+    codes = np.append(np.where(hetg, 1, np.where(letg, 2, 0)), 0)
+    z = codes[get_state_indices(states, fluence_times, right_closed=True)]
 
     plot_multi_line(x, y, z, [0, 1, 2], ["k", "r", "c"], ax)
 
 
 def draw_dummy_lines_letg_hetg_legend(fluence_times, fig, ax):
+    from ska_matplotlib import plot_cxctime
+
     lx = [fluence_times[0], fluence_times[-1]]
     ly = [-1, -1]
     plot_cxctime(lx, ly, "-k", lw=3, label="None", fig=fig, ax=ax)
@@ -980,11 +1879,13 @@ def get_si(simpos):
     return si
 
 
-def date_to_zulu(date):
+def date_to_zulu(dates):
     """
-    Convert a date string to a Zulu time string.
+    Convert date(s) to Zulu time string(s) like "1345".
     """
-    return CxoTime(date).date[9:14].replace(":", "")
+    dates = np.asarray(arc_time.get_dates(dates))
+    zulus = [date[9:11] + date[12:14] for date in dates.ravel()]
+    return zulus if dates.ndim else zulus[0]
 
 
 def get_comms_avail_for_humans(comms_avail: Table | None) -> Table | None:
@@ -998,21 +1899,28 @@ def get_comms_avail_for_humans(comms_avail: Table | None) -> Table | None:
     318/2115-0000   2215 2345 DSS-26    GOLDSTONE  1715-1845 EST, Wed 13 Nov
     319/1100-1315   1200 1300 DSS-54    MADRID     0700-0800 EST, Thu 14 Nov
     """
+    from astropy.table import Table
+
     # Could not read comms avail URL so just pass back None. This is handled later.
     if comms_avail is None:
         return None
 
-    rows = []
-    for comm in comms_avail:
-        soa = CxoTime(comm["avail_soa"])
-        eoa = CxoTime(comm["avail_eoa"])
-        bot = CxoTime(comm["avail_bot"])
-        eot = CxoTime(comm["avail_eot"])
+    # Convert the times of all the comms at once
+    soa_dates = arc_time.get_dates(comms_avail["avail_soa"])
+    soa_zulus = date_to_zulu(comms_avail["avail_soa"])
+    eoa_zulus = date_to_zulu(comms_avail["avail_eoa"])
+    bot_zulus = date_to_zulu(comms_avail["avail_bot"])
+    eot_zulus = date_to_zulu(comms_avail["avail_eot"])
+    bot_locals = arc_time.get_local_dates(comms_avail["avail_bot"])
+    dur_secs = np.round(
+        arc_time.get_secs(comms_avail["avail_eot"])
+        - arc_time.get_secs(comms_avail["avail_bot"])
+    )
 
-        support_doy = soa.date[5:8]
-        support_startz = date_to_zulu(soa)
-        support_endz = date_to_zulu(eoa)
-        support_gmt = f"{support_doy}/{support_startz}-{support_endz}"
+    rows = []
+    for idx, comm in enumerate(comms_avail):
+        support_doy = soa_dates[idx][5:8]
+        support_gmt = f"{support_doy}/{soa_zulus[idx]}-{eoa_zulus[idx]}"
 
         station = comm["station"]
         station_num = int(station[-2:])
@@ -1029,7 +1937,7 @@ def get_comms_avail_for_humans(comms_avail: Table | None) -> Table | None:
             r"(?P<day>\d{2}) (?P<hour>\d{2}):(?P<minute>\d{2}):(?P<second>\d{2}) "
             r"(?P<period>AM|PM) (?P<tz>\w{3})"
         )
-        match = re.match(pattern, bot.get_conversions()["local"])
+        match = re.match(pattern, bot_locals[idx])
         bot_local = match.groupdict()
         track_bot = (
             f"{bot_local['day_name']} {bot_local['month']} {bot_local['day']} "
@@ -1037,16 +1945,14 @@ def get_comms_avail_for_humans(comms_avail: Table | None) -> Table | None:
             f"{bot_local['period']} {bot_local['tz']}"
         )
 
-        dur = eot - bot
-        dur_secs = np.round(dur.sec)
-        dur_hr = int(dur_secs // 3600)
-        dur_min = int((dur_secs - dur_hr * 3600) // 60)
+        dur_hr = int(dur_secs[idx] // 3600)
+        dur_min = int((dur_secs[idx] - dur_hr * 3600) // 60)
         dur_hr_min = f"{dur_hr}:{dur_min:02d}"
 
         row = (
             support_gmt,
-            date_to_zulu(comm["avail_bot"]),
-            date_to_zulu(comm["avail_eot"]),
+            bot_zulus[idx],
+            eot_zulus[idx],
             station,
             site,
             track_bot,
@@ -1107,6 +2013,10 @@ def write_states_json(
     p3_avg,
     hrcs,
     hrc_times,
+    *,
+    fluence_forecast=None,
+    whatifs=None,
+    legacy=False,
 ):
     """
     Write JSON states.
@@ -1115,7 +2025,25 @@ def write_states_json(
     javascript-driven annotated plot on Replan Central.  This creates a data structure
     with state values for each 10-minute time step along the X-axis of the plot.  All of
     the hard work (formatting etc) is done here so the javascript is very simple.
+
+    If ``fluence_forecast`` (from ``get_fluence_forecast``) is given then the
+    probability of reaching each fluence limit and the time until the crossing are
+    included as ``fluence_prob_<limit>`` and ``fluence_dt_<limit>``, e.g.
+    ``fluence_prob_yellow``.
+
+    The predictions of any what-if scenarios (from ``get_whatif_predictions``) are in
+    ``whatif``, keyed by scenario name, with the label, the maximum and final predicted
+    fluence and the same fluence limit values.
+
+    By default the time steps are written in a columnar layout: ``state_fields`` has
+    the formatted values of each distinct state and ``steps`` has arrays of the state
+    index, date, delta time, fluence, P3 and HRC for each step.  With ``legacy=True``
+    the output has the same keys as the flight layout for comparison to it:
+    ``states`` is a list with a dict of all the formatted values for each time step,
+    and the fluence limit and what-if values are left out.
     """
+    import kadi.commands.states as kadi_states
+
     formats = {
         "ra": "{:10.4f}",
         "dec": "{:10.4f}",
@@ -1125,7 +2053,7 @@ def write_states_json(
     }
     start = start - 1 * u.day
     tstop = (stop + 1 * u.day).secs
-    tstart = CxoTime(start.date[:8] + ":00:00:00").secs
+    tstart = arc_time.get_secs(start.date[:8] + ":00:00:00")
     times = np.arange(tstart, tstop, 600)
     pds = cxc2pd(times)  # Convert from CXC time to plotdate times
 
@@ -1139,8 +2067,6 @@ def write_states_json(
     fig_xy = disp_to_fig(disp_xy)
     data = {"ax_x": fig_xy[:, 0].tolist(), "ax_y": fig_xy[:, 1].tolist()}
 
-    outs = []
-    now_idx = 0
     now_secs = now.secs
     state_names = (
         "obsid",
@@ -1157,12 +2083,33 @@ def write_states_json(
     )
 
     # Get all the state values that occur within the range of the plot
-    disp_xy = data_to_disp([(pd, 0.0) for pd in pds])
+    disp_xy = data_to_disp(np.column_stack([pds, np.zeros_like(pds)]))
     ax_xy = disp_to_ax(disp_xy)
     ok = (ax_xy[:, 0] > 0.0) & (ax_xy[:, 0] < 1.0)
     times = times[ok]
     pds = pds[ok]
-    state_vals = kadi_states.interpolate_states(states, times)
+
+    # Index of the state at each time step.  States change rarely so each distinct
+    # state is formatted once and shared by all the time steps within it.
+    states = states.copy(copy_data=False)
+    states["state_idx"] = np.arange(len(states))
+    state_idxs = kadi_states.interpolate_states(states, times)["state_idx"]
+    uniq_idxs, inverse = np.unique(state_idxs, return_inverse=True)
+    state_fields = []
+    for state_val in states[uniq_idxs]:
+        fields = {}
+        for name in state_names:
+            val = state_val[name].tolist()
+            fval = formats.get(name, "{}").format(val)
+            fields[name] = fval.replace(" ", "&nbsp;")
+        fields["ccd_fep"] = "{}, {}".format(
+            state_val["ccd_count"], state_val["fep_count"]
+        )
+        fields["vid_clock"] = "{}, {}".format(
+            state_val["vid_board"], state_val["clocking"]
+        )
+        fields["si"] = get_si(state_val["simpos"])
+        state_fields.append(fields)
 
     # Set the current values
     p3_now = p3s[-1]
@@ -1173,40 +2120,70 @@ def write_states_json(
     p3s = ska_numpy.interpolate(p3s, p3_times, times)
     hrcs = ska_numpy.interpolate(hrcs, hrc_times, times)
 
-    # Iterate through each time step and create corresponding data structure
-    # with pre-formatted values for display in the output table.
+    # Before now the table shows the past P3 and HRC values with the current
+    # fluence, and after now the predicted fluence with the current P3 and HRC.
     NOT_AVAIL = "N/A"
-    for time, pd, state_val, fluence, p3, hrc in zip(  # noqa: B007
-        times, pds, state_vals, fluences, p3s, hrcs, strict=False
-    ):
-        out = {}
-        out["date"] = date_zulu(time)
-        for name in state_names:
-            val = state_val[name].tolist()
-            fval = formats.get(name, "{}").format(val)
-            out[name] = re.sub(" ", "&nbsp;", fval)
-        out["ccd_fep"] = "{}, {}".format(state_val["ccd_count"], state_val["fep_count"])
-        out["vid_clock"] = "{}, {}".format(
-            state_val["vid_board"], state_val["clocking"]
-        )
-        out["si"] = get_si(state_val["simpos"])
-        out["now_dt"] = get_fmt_dt(time, now_secs)
-        if time < now_secs:
-            now_idx += 1
-            out["fluence"] = "{:.2f}e9".format(fluence_now)
-            out["p3"] = "{:.0f}".format(p3) if p3 > 0 else NOT_AVAIL
-            out["hrc"] = "{:.0f}".format(hrc)
-        else:
-            out["fluence"] = "{:.2f}e9".format(fluence)
-            out["p3"] = "{:.0f}".format(p3_now) if p3_now > 0 else NOT_AVAIL
-            out["hrc"] = "{:.0f}".format(hrc_now)
-        outs.append(out)
-    data["states"] = outs
+    past = times < now_secs
+    now_idx = int(np.count_nonzero(past))
+    fluences = np.where(past, fluence_now, fluences)
+    p3s = np.where(past, p3s, p3_now)
+    hrcs = np.where(past, hrcs, hrc_now)
+
+    dates = date_zulus(times)
+    now_dts = get_fmt_dts(times, now_secs)
+    if legacy:
+        # Create the data structure for each time step with pre-formatted values for
+        # display in the output table.
+        data["states"] = [
+            {
+                "date": date,
+                **state_fields[state_i],
+                "now_dt": now_dt,
+                "fluence": "{:.2f}e9".format(fluence),
+                "p3": "{:.0f}".format(p3) if p3 > 0 else NOT_AVAIL,
+                "hrc": "{:.0f}".format(hrc),
+            }
+            for date, state_i, now_dt, fluence, p3, hrc in zip(
+                dates,
+                inverse,
+                now_dts,
+                fluences.tolist(),
+                p3s.tolist(),
+                hrcs.tolist(),
+                strict=True,
+            )
+        ]
+    else:
+        # Columnar layout: the formatted values of each distinct state once, and for
+        # each time step the index of its state, the date strings and the numeric
+        # values (p3 is null where not available).  See getState() in timeline.js.
+        data["state_fields"] = {
+            key: [fields[key] for fields in state_fields] for key in state_fields[0]
+        }
+        data["steps"] = {
+            "state": inverse,
+            "date": dates,
+            "now_dt": now_dts,
+            "fluence": np.round(fluences, 2),
+            "p3": [round(p3) if p3 > 0 else None for p3 in p3s.tolist()],
+            "hrc": np.round(hrcs).astype(int),
+        }
     data["now_idx"] = now_idx
     data["now_date"] = date_zulu(now)
     data["p3_avg_now"] = "{:.0f}".format(p3_avg) if p3_avg > 0 else NOT_AVAIL
     data["p3_now"] = "{:.0f}".format(p3_now) if p3_now > 0 else NOT_AVAIL
     data["hrc_now"] = "{:.0f}".format(hrc_now)
+    if not legacy:
+        data.update(get_limit_fields(fluence_forecast, now_secs))
+        if whatifs:
+            data["whatif"] = {}
+        for scenario, (whatif_fluences, whatif_forecast) in (whatifs or {}).items():
+            data["whatif"][scenario] = {
+                "label": WHATIF_SCENARIOS[scenario]["label"],
+                "fluence_max": "{:.2f}e9".format(np.max(whatif_fluences)),
+                "fluence_end": "{:.2f}e9".format(whatif_fluences[-1]),
+                **get_limit_fields(whatif_forecast, now_secs),
+            }
 
     track = next_comm["track_local"]["value"]
     data["track_time"] = "&nbsp;&nbsp;" + track[15:19] + track[:4] + " " + track[10:13]
@@ -1219,30 +2196,93 @@ def write_states_json(
     # Finally write this all out as a simple javascript program that defines a single
     # variable ``data``.
     with open(filename, "w") as f:
-        f.write("var data = {}".format(json.dumps(data)))
+        f.write(
+            "var data = {}".format(json.dumps(data) if legacy else dumps_json(data))
+        )
+
+
+def _json_default(obj):
+    if isinstance(obj, np.ndarray | np.generic):
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps_json(data):
+    """
+    Encode ``data``, which can include numpy arrays and scalars, as compact JSON.
+
+    This uses ``orjson`` if it is available.
+    """
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_SERIALIZE_NUMPY).decode()
+    return json.dumps(data, separators=(",", ":"), default=_json_default)
+
+
+def get_limit_fields(forecast, now_secs):
+    """
+    Format the fluence limit probability and time until crossing of ``forecast``.
+
+    Returns a dict with ``fluence_prob_<limit>`` and ``fluence_dt_<limit>`` for each of
+    ``FLUENCE_LIMITS``, which are "N/A" if ``forecast`` is None (or for the time, if
+    the limit is not reached).
+    """
+    fields = {}
+    for name in FLUENCE_LIMITS:
+        prob = dt = "N/A"
+        if forecast is not None:
+            prob = "{:.0f}%".format(forecast.limit_probs[name] * 100)
+            limit_time = forecast.limit_times[name]
+            if limit_time is not None:
+                dt = get_fmt_dt(limit_time, now_secs)
+        fields[f"fluence_prob_{name}"] = prob
+        fields[f"fluence_dt_{name}"] = dt
+    return fields
 
 
 def date_zulu(date):
     """Format the current time in like 186/2234Z"""
-    date = CxoTime(date).date
-    zulu = "{}/{}{}z".format(date[5:8], date[9:11], date[12:14])
-    return zulu
+    return arc_time.get_zulu_dates(date)
+
+
+def date_zulus(times):
+    """Format each of ``times`` like 186/2234Z (see ``date_zulu``)"""
+    return arc_time.get_zulu_dates(np.asarray(times))
 
 
 def get_fmt_dt(t1, t0):
     """
     Format delta time between ``t1`` and ``t0`` for the output table.
     """
-    t1 = CxoTime(t1).secs
-    t0 = CxoTime(t0).secs
-    dt = t1 - t0
-    adt = abs(int(round(dt)))
-    days = adt // 86400
-    hours = (adt - days * 86400) // 3600
-    mins = int(round((adt - days * 86400 - hours * 3600) / 60))
-    sign = "+" if dt >= 0 else "-"
-    days = str(days) + "d " if days > 0 else ""
-    return "NOW {} {}{}:{:02d}".format(sign, days, hours, mins)
+    t1 = arc_time.get_secs(t1)
+    t0 = arc_time.get_secs(t0)
+    return format_dts(np.array([t1 - t0]))[0]
+
+
+def get_fmt_dts(t1s, t0):
+    """
+    Format the delta time between each of ``t1s`` and ``t0`` (see ``get_fmt_dt``).
+    """
+    return format_dts(arc_time.get_secs(t1s) - arc_time.get_secs(t0))
+
+
+def format_dts(dts):
+    """
+    Format delta times ``dts`` (secs) like "NOW + 1d 2:05" for the output table.
+
+    The days, hours and minutes are computed for all the delta times at once.
+    """
+    adts = np.abs(np.round(dts)).astype(int)
+    days = adts // 86400
+    hours = (adts - days * 86400) // 3600
+    mins = np.round((adts - days * 86400 - hours * 3600) / 60).astype(int)
+    return [
+        "NOW {} {}{}:{:02d}".format(
+            "+" if dt >= 0 else "-", f"{day}d " if day > 0 else "", hour, minute
+        )
+        for dt, day, hour, minute in zip(
+            dts.tolist(), days.tolist(), hours.tolist(), mins.tolist(), strict=True
+        )
+    ]
 
 
 def log_scale(y):
@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+# Licensed under a 3-clause BSD style license - see LICENSE.rst
+"""
+Rewrite an ARC HDF5 archive into the current storage layout.
+
+The ``/data`` table of ``ACE.h5``, ``GOES_X.h5`` or ``hrc_shield.h5`` is copied with
+the compression filters and chunkshape of ``arc_h5.FILTERS`` and ``arc_h5.CHUNKSHAPE``
+(or as given on the command line).  With ``--partition`` the rows are split into one
+table per month or year with a catalog (see ``arc_h5``).
+Float64 columns are kept as float64 unless listed with ``--float32``.  Only list
+columns whose values are exactly representable as float32 by construction (not just in
+the stored history), since live values appended later are rounded to the column type.
+A listed column is stored as float32 only if every stored value is exact.  The new
+file is then read back and compared to the original column by column, and it replaces
+the original (which is kept as ``<h5_file>.bak``) only if all values are identical.
+
+Example::
+
+  migrate_h5.py --dry-run $SKA/data/arc3/ACE.h5
+  migrate_h5.py $SKA/data/arc3/ACE.h5
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+import numpy as np
+import tables
+
+import arc_h5
+
+# Number of rows read or written at once
+BLOCK_ROWS = 1_000_000
+
+
+def get_options(sys_args=None):
+    parser = argparse.ArgumentParser(
+        description="Rewrite an ARC HDF5 archive into the current storage layout"
+    )
+    parser.add_argument("h5_file", help="HDF5 archive file name")
+    parser.add_argument(
+        "--out",
+        help="Output file name (default=replace h5_file, keeping it as h5_file.bak)",
+    )
+    parser.add_argument(
+        "--complib",
+        default=arc_h5.FILTERS.complib,
+        help=f"Compression library (default={arc_h5.FILTERS.complib})",
+    )
+    parser.add_argument(
+        "--complevel",
+        type=int,
+        default=arc_h5.FILTERS.complevel,
+        help=f"Compression level (default={arc_h5.FILTERS.complevel})",
+    )
+    parser.add_argument(
+        "--chunkshape",
+        type=int,
+        default=arc_h5.CHUNKSHAPE[0],
+        help=f"Rows per chunk (default={arc_h5.CHUNKSHAPE[0]})",
+    )
+    parser.add_argument(
+        "--float32",
+        nargs="+",
+        default=[],
+        metavar="COL",
+        help="Float64 columns to store as float32 (only if exact by construction)",
+    )
+    parser.add_argument(
+        "--partition",
+        choices=list(arc_h5.PARTITION_PERIODS),
+        help="Write a partitioned archive with one table per month or year",
+    )
+    parser.add_argument("--col-time", default="time", help="Name of time column")
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Print the column types that would be used and exit",
+    )
+    args = parser.parse_args(sys_args)
+    return args
+
+
+def iter_blocks(table):
+    """Iterate over the rows of ``table`` in blocks of ``BLOCK_ROWS``."""
+    for row0 in range(0, table.nrows, BLOCK_ROWS):
+        yield table.read(row0, min(row0 + BLOCK_ROWS, table.nrows))
+
+
+def get_migrated_dtype(table, col_time="time", float32_cols=()):
+    """
+    Get the dtype for the migrated table.
+
+    Parameters
+    ----------
+    table : tables.Table
+        Archive table
+    col_time : str
+        Name of time column, which is always kept as float64
+    float32_cols : list of str
+        Float64 columns to store as float32 if all values are exactly representable
+
+    Returns
+    -------
+    dtype : np.dtype
+        Data type for the migrated table
+    """
+    dtype = table.dtype
+    names = [
+        name
+        for name in dtype.names
+        if name in float32_cols and name != col_time and dtype[name] == np.float64
+    ]
+    for block in iter_blocks(table):
+        names = [
+            name
+            for name in names
+            if np.array_equal(
+                block[name].astype(np.float32), block[name], equal_nan=True
+            )
+        ]
+    return np.dtype(
+        [(name, np.float32 if name in names else dtype[name]) for name in dtype.names]
+    )
+
+
+def copy_table(
+    table, h5_out, dtype, filters, chunkshape, *, partition=None, col_time="time"
+):
+    """
+    Copy archive ``table`` to open file ``h5_out`` with a new layout.
+
+    Returns
+    -------
+    tables_out : list of tables.Table
+        Output ``/data`` table, or partition tables if ``partition`` is set
+    """
+    if partition:
+        arc_h5.create_catalog(h5_out, table.title, partition)
+        for block in iter_blocks(table):
+            arc_h5.append_partitioned(
+                h5_out, arc_h5.as_dtype(block, dtype), col_time, filters, (chunkshape,)
+            )
+        tables_out = arc_h5.get_tables(h5_out)
+    else:
+        table_out = h5_out.create_table(
+            h5_out.root,
+            "data",
+            description=dtype,
+            title=table.title,
+            filters=filters,
+            expectedrows=max(table.nrows, 2e7),
+            chunkshape=(chunkshape,),
+        )
+        for block in iter_blocks(table):
+            table_out.append(arc_h5.as_dtype(block, dtype))
+        table_out.flush()
+        tables_out = [table_out]
+
+    for table_out in tables_out:
+        for name in table.attrs._f_list("user"):
+            table_out.attrs[name] = table.attrs[name]
+        for col in table.colindexes:
+            table_out.cols._f_col(col).create_csindex()
+
+    return tables_out
+
+
+def verify_tables(table, tables_out):
+    """
+    Compare the values of an archive table to the tables it was copied to.
+
+    Returns
+    -------
+    bad_names : list of str
+        Names of columns that differ (empty if the tables are identical)
+    """
+    if table.nrows != sum(table_out.nrows for table_out in tables_out):
+        return list(table.dtype.names)
+    for table_out in tables_out:
+        if table.dtype.names != table_out.dtype.names:
+            return sorted(set(table.dtype.names) ^ set(table_out.dtype.names))
+
+    bad_names = set()
+    offset = 0
+    for table_out in tables_out:
+        for row0 in range(0, table_out.nrows, BLOCK_ROWS):
+            row1 = min(row0 + BLOCK_ROWS, table_out.nrows)
+            block = table.read(offset + row0, offset + row1)
+            block_out = table_out.read(row0, row1)
+            for name in table.dtype.names:
+                if not np.array_equal(
+                    block[name],
+                    block_out[name].astype(block.dtype[name]),
+                    equal_nan=block.dtype[name].kind == "f",
+                ):
+                    bad_names.add(name)
+        offset += table_out.nrows
+    return sorted(bad_names)
+
+
+def main(sys_args=None):
+    args = get_options(sys_args)
+    h5_file = Path(args.h5_file)
+    out_file = Path(args.out) if args.out else h5_file.with_suffix(".migrate.h5")
+    filters = tables.Filters(
+        complevel=args.complevel, complib=args.complib, shuffle=True
+    )
+
+    with tables.open_file(h5_file, mode="r") as h5:
+        if arc_h5.is_partitioned(h5):
+            print(f"Error: {h5_file} is already partitioned")
+            sys.exit(1)
+        table = h5.root.data
+        dtype = get_migrated_dtype(table, args.col_time, args.float32)
+        print(f"{h5_file}: {table.nrows} rows, {table.chunkshape[0]} rows per chunk")
+        print(f"  {table.filters}")
+        for name in dtype.names:
+            if dtype[name] != table.dtype[name]:
+                print(f"  {name}: {table.dtype[name]} -> {dtype[name]}")
+            elif name in args.float32:
+                print(
+                    f"  {name}: kept as {dtype[name]}, values are not exact in float32"
+                )
+        if args.dry_run:
+            return
+
+        with tables.open_file(out_file, mode="w") as h5_out:
+            tables_out = copy_table(
+                table,
+                h5_out,
+                dtype,
+                filters,
+                args.chunkshape,
+                partition=args.partition,
+                col_time=args.col_time,
+            )
+            bad_names = verify_tables(table, tables_out)
+
+    if bad_names:
+        print(f"Error: values differ in {out_file} for columns {bad_names}")
+        sys.exit(1)
+
+    size, size_out = h5_file.stat().st_size, out_file.stat().st_size
+    print(f"Verified {out_file}: {size / 1e6:.1f} MB -> {size_out / 1e6:.1f} MB")
+
+    if not args.out:
+        h5_file.replace(h5_file.with_name(h5_file.name + ".bak"))
+        out_file.replace(h5_file)
+        print(f"Replaced {h5_file} (original is {h5_file.name}.bak)")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,48 +6,95 @@ Plot GOES X-ray data for use in Replan Central
 
 import argparse
 
-import matplotlib
-
-matplotlib.use("agg")
-import matplotlib.pyplot as plt
-import tables
-from Chandra.Time import DateTime
-from Ska.Matplotlib import plot_cxctime
-
-parser = argparse.ArgumentParser(description="Plot GOES X data for Replan Central")
-parser.add_argument("--out", type=str, default="goes_x.png", help="Plot file name")
-parser.add_argument("--h5", default="GOES_X.h5", help="HDF5 file name")
-args = parser.parse_args()
-
-with tables.open_file(args.h5, mode="r") as h5:
-    table = h5.root.data[:]
-    # Use just last 3 days if available
-    table = table[table["time"] >= (DateTime() - 3).secs]
-    h5.close()
-
-plt.figure(1, figsize=(6, 4))
-for col, wavelength, color in zip(
-    ["long", "short"], ["0.1-0.8nm", "0.05-0.4nm"], ["red", "blue"], strict=False
-):
-    vals = table[col]
-    vals = vals.clip(min=1e-10)
-    plot_cxctime(table["time"], vals, color=color, linewidth=0.5, label=f"{wavelength}")
-plt.ylim(1e-9, 1e-2)
-plt.yscale("log")
-plt.grid()
-plt.ylabel("Watts / m**2")
-plt.legend(loc="upper left")
-plt.title("GOES Xray Flux")
-plt.tight_layout()
-
-# Plot Flare Class labels in data coordinates
-plt.subplots_adjust(right=0.90)
-xlims = plt.xlim()
-plt.text(xlims[1] + 0.025, 2.5e-8, "A")
-plt.text(xlims[1] + 0.025, 2.5e-7, "B")
-plt.text(xlims[1] + 0.025, 2.5e-6, "C")
-plt.text(xlims[1] + 0.025, 2.5e-5, "M")
-plt.text(xlims[1] + 0.025, 2.5e-4, "X")
-plt.text(xlims[1] + 0.25, 1e-4, "Xray Flare Class", rotation=270)
-
-plt.savefig(args.out)
+import arc_h5
+import arc_startup
+
+# Modules imported only when plotting (see --profile-startup)
+DEFERRED_IMPORTS = ["matplotlib.pyplot", "Ska.Matplotlib"]
+
+
+def get_options(sys_args=None):
+    parser = argparse.ArgumentParser(description="Plot GOES X data for Replan Central")
+    parser.add_argument("--out", type=str, default="goes_x.png", help="Plot file name")
+    parser.add_argument("--h5", default="GOES_X.h5", help="HDF5 file name")
+    parser.add_argument(
+        "--days",
+        type=float,
+        default=3.0,
+        help="Days of data to plot, up to the last archive time (default=3)",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Make the plot even if the archive is unchanged since the last plot",
+    )
+    parser.add_argument(
+        "--profile-startup",
+        action="store_true",
+        help="Report the cold import time of this script and its deferred modules",
+    )
+    args = parser.parse_args(sys_args)
+    return args
+
+
+def main(sys_args=None):
+    args = get_options(sys_args)
+    if args.profile_startup:
+        arc_startup.print_startup_profile(__file__, DEFERRED_IMPORTS)
+        return
+
+    # Nothing to do if the archive is unchanged since the last plot
+    plot_state = arc_h5.PlotState(args.h5)
+    stamp = {**arc_h5.get_tail_stamp(args.h5), "days": args.days}
+    if not args.force and plot_state.is_current(args.out, stamp):
+        print(f"Skipping {args.out}: {args.h5} is unchanged since the last plot")
+        return
+    if stamp["last_time"] is None:
+        print(f"Warning: no data in {args.h5}")
+        return
+
+    import matplotlib
+
+    matplotlib.use("agg")
+    import matplotlib.pyplot as plt
+    from Ska.Matplotlib import plot_cxctime
+
+    # Use just the last --days of data if available
+    tstop = stamp["last_time"]
+    colnames = ["time", "long", "short"]
+    vals = arc_h5.read_time_window(args.h5, tstop - args.days * 86400, tstop, colnames)
+    table = dict(zip(colnames, vals, strict=True))
+
+    plt.figure(1, figsize=(6, 4))
+    for col, wavelength, color in zip(
+        ["long", "short"], ["0.1-0.8nm", "0.05-0.4nm"], ["red", "blue"], strict=False
+    ):
+        vals = table[col]
+        vals = vals.clip(min=1e-10)
+        plot_cxctime(
+            table["time"], vals, color=color, linewidth=0.5, label=f"{wavelength}"
+        )
+    plt.ylim(1e-9, 1e-2)
+    plt.yscale("log")
+    plt.grid()
+    plt.ylabel("Watts / m**2")
+    plt.legend(loc="upper left")
+    plt.title("GOES Xray Flux")
+    plt.tight_layout()
+
+    # Plot Flare Class labels in data coordinates
+    plt.subplots_adjust(right=0.90)
+    xlims = plt.xlim()
+    plt.text(xlims[1] + 0.025, 2.5e-8, "A")
+    plt.text(xlims[1] + 0.025, 2.5e-7, "B")
+    plt.text(xlims[1] + 0.025, 2.5e-6, "C")
+    plt.text(xlims[1] + 0.025, 2.5e-5, "M")
+    plt.text(xlims[1] + 0.025, 2.5e-4, "X")
+    plt.text(xlims[1] + 0.25, 1e-4, "Xray Flare Class", rotation=270)
+
+    plt.savefig(args.out)
+    plot_state.save(args.out, stamp)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,38 +1,85 @@
 #!/usr/bin/env python
 import argparse
 
-import matplotlib
-
-matplotlib.use("agg")
-import matplotlib.pyplot as plt
-import tables
-from Ska.Matplotlib import plot_cxctime
-
-parser = argparse.ArgumentParser(description="Plot HRC")
-parser.add_argument("--out", type=str, default="hrc_shield.png", help="Plot file name")
-parser.add_argument("--h5", default="hrc_shield.h5", help="HDF5 file name")
-args = parser.parse_args()
-
-h5 = tables.open_file(args.h5, mode="r")
-table = h5.root.data
-secs = table.col("time")[-864:]
-hrc_shield = table.col("hrc_shield")[-864:]
-h5.close()
-
-bad = hrc_shield < 0.1
-hrc_shield = hrc_shield[~bad]
-secs = secs[~bad]
-
-plt.figure(1, figsize=(6, 4))
-ticks, fig, ax = plot_cxctime(secs, hrc_shield)
-xlims = ax.get_xlim()
-dx = (xlims[1] - xlims[0]) / 20.0
-ax.set_xlim(xlims[0] - dx, xlims[1] + dx)
-ax.set_ylim(min(hrc_shield.min() * 0.5, 10.0), max(hrc_shield.max() * 2, 300.0))
-plt.plot([xlims[0] - dx, xlims[1] + dx], [235, 235], "--r")
-ax.set_yscale("log")
-plt.grid()
-plt.title("GOES proxy for HRC shield rate / 256")
-plt.ylabel("Cts / sample")
-plt.tight_layout()
-plt.savefig(args.out)
+import arc_h5
+import arc_startup
+
+# Modules imported only when plotting (see --profile-startup)
+DEFERRED_IMPORTS = ["matplotlib.pyplot", "Ska.Matplotlib"]
+
+
+def get_options(sys_args=None):
+    parser = argparse.ArgumentParser(description="Plot HRC")
+    parser.add_argument(
+        "--out", type=str, default="hrc_shield.png", help="Plot file name"
+    )
+    parser.add_argument("--h5", default="hrc_shield.h5", help="HDF5 file name")
+    parser.add_argument(
+        "--days",
+        type=float,
+        default=3.0,
+        help="Days of data to plot, up to the last archive time (default=3)",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Make the plot even if the archive is unchanged since the last plot",
+    )
+    parser.add_argument(
+        "--profile-startup",
+        action="store_true",
+        help="Report the cold import time of this script and its deferred modules",
+    )
+    args = parser.parse_args(sys_args)
+    return args
+
+
+def main(sys_args=None):
+    args = get_options(sys_args)
+    if args.profile_startup:
+        arc_startup.print_startup_profile(__file__, DEFERRED_IMPORTS)
+        return
+
+    # Nothing to do if the archive is unchanged since the last plot
+    plot_state = arc_h5.PlotState(args.h5)
+    stamp = {**arc_h5.get_tail_stamp(args.h5), "days": args.days}
+    if not args.force and plot_state.is_current(args.out, stamp):
+        print(f"Skipping {args.out}: {args.h5} is unchanged since the last plot")
+        return
+    if stamp["last_time"] is None:
+        print(f"Warning: no data in {args.h5}")
+        return
+
+    import matplotlib
+
+    matplotlib.use("agg")
+    import matplotlib.pyplot as plt
+    from Ska.Matplotlib import plot_cxctime
+
+    tstop = stamp["last_time"]
+    secs, hrc_shield = arc_h5.read_time_window(
+        args.h5, tstop - args.days * 86400, tstop, ["time", "hrc_shield"]
+    )
+
+    bad = hrc_shield < 0.1
+    hrc_shield = hrc_shield[~bad]
+    secs = secs[~bad]
+
+    plt.figure(1, figsize=(6, 4))
+    ticks, fig, ax = plot_cxctime(secs, hrc_shield)
+    xlims = ax.get_xlim()
+    dx = (xlims[1] - xlims[0]) / 20.0
+    ax.set_xlim(xlims[0] - dx, xlims[1] + dx)
+    ax.set_ylim(min(hrc_shield.min() * 0.5, 10.0), max(hrc_shield.max() * 2, 300.0))
+    plt.plot([xlims[0] - dx, xlims[1] + dx], [235, 235], "--r")
+    ax.set_yscale("log")
+    plt.grid()
+    plt.title("GOES proxy for HRC shield rate / 256")
+    plt.ylabel("Cts / sample")
+    plt.tight_layout()
+    plt.savefig(args.out)
+    plot_state.save(args.out, stamp)
+
+
+if __name__ == "__main__":
+    main()
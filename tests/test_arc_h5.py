@@ -0,0 +1,57 @@
+# Licensed under a 3-clause BSD style license - see LICENSE.rst
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+import arc_h5  # noqa: E402
+
+# 2024:001:00:00:00 to about 2024:091 at 1-hour spacing, so three month partitions
+TIMES = 820454469.184 + np.arange(0, 90 * 86400, 3600.0)
+
+
+@pytest.fixture(params=[None, "month"])
+def h5_file(request, tmp_path):
+    """Archive with the single-table layout or with month partitions"""
+    dat = np.zeros(len(TIMES), dtype=[("time", "f8"), ("p3", "f4")])
+    dat["time"] = TIMES
+    dat["p3"] = np.arange(len(TIMES))
+    h5_file = tmp_path / "ACE.h5"
+    with arc_h5.H5Appender(h5_file, "ACE", partition=request.param) as appender:
+        appender.append(dat)
+    return h5_file
+
+
+def test_read_time_window(h5_file):
+    tstart, tstop = TIMES[10], TIMES[1000]
+    times, p3s = arc_h5.read_time_window(h5_file, tstart, tstop, ["time", "p3"])
+    assert np.all(times == TIMES[11:1001])
+    assert np.all(p3s == np.arange(11, 1001))
+
+
+@pytest.mark.parametrize(
+    "tstart, tstop",
+    [
+        (TIMES[-1] + 86400, TIMES[-1] + 2 * 86400),  # after the last data (stale feed)
+        (TIMES[0] - 2 * 86400, TIMES[0] - 86400),  # before the first data
+        (TIMES[100] + 1, TIMES[100] + 2),  # between two rows
+    ],
+)
+def test_read_time_window_empty(h5_file, tstart, tstop):
+    times, p3s = arc_h5.read_time_window(h5_file, tstart, tstop, ["time", "p3"])
+    assert len(times) == 0
+    assert len(p3s) == 0
+    assert times.dtype == np.float64
+    assert p3s.dtype == np.float32
+
+
+def test_read_tail(h5_file):
+    times, p3s = arc_h5.read_tail(h5_file, 1000, ["time", "p3"])
+    assert np.all(times == TIMES[-1000:])
+    assert np.all(p3s == np.arange(len(TIMES))[-1000:])
+
+    times, p3s = arc_h5.read_tail(h5_file, 0, ["time", "p3"])
+    assert len(times) == 0
+    assert p3s.dtype == np.float32
@@ -0,0 +1,46 @@
+# Licensed under a 3-clause BSD style license - see LICENSE.rst
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+from astropy.table import Table
+
+cxotime = pytest.importorskip("cxotime")
+pytest.importorskip("kadi")
+pytest.importorskip("ska_matplotlib")
+pytest.importorskip("ska_numpy")
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+import make_timeline  # noqa: E402
+
+
+def get_states(start, stop):
+    """States like ``get_states()``, with the first and last clipped to the range"""
+    tstarts = start.secs + np.array([0.0, 6, 30, 50]) * 3600
+    tstops = np.append(tstarts[1:], stop.secs)
+    return Table(
+        {
+            "tstart": tstarts,
+            "tstop": tstops,
+            "simpos": [75624, -99616, 75624, -50505],
+        }
+    )
+
+
+def test_update_static_layer_states_clipped_at_stop():
+    start = cxotime.CxoTime("2024:300:00:00:00")
+    stop = start + 3 * make_timeline.u.day
+    fluence_times = np.arange(start.secs, stop.secs, 300.0)
+    renderer = make_timeline.TimelineRenderer(fluence_times)
+    states = get_states(start, stop)
+    kwargs = {"states": states, "radzones": [], "comms": [], "comms_avail": None}
+
+    assert renderer.update_static_layer(start, stop, **kwargs)
+    tstart, tstop = renderer.static_range
+    assert tstart < start.secs
+    assert tstop > stop.secs
+    assert len(renderer.static_artists) > 0
+
+    # Same inputs within the static range: layer is kept
+    assert not renderer.update_static_layer(start, stop, **kwargs)
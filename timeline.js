@@ -33,8 +33,35 @@ function setNAToRed(val) {
     return val
 }
 
+// Number of time steps in data, for the legacy layout (data.states) or the columnar
+// layout (data.steps and data.state_fields) of timeline_states.js.
+function getNumStates() {
+    if (data.states) {
+        return data.states.length;
+    }
+    return data.steps.date.length;
+}
+
+// Get the formatted table values for time step idx as in the legacy layout.
+function getState(idx) {
+    if (data.states) {
+        return data.states[idx];
+    }
+    var steps = data.steps;
+    var state = {};
+    for (var key in data.state_fields) {
+        state[key] = data.state_fields[key][steps.state[idx]];
+    }
+    state['date'] = steps.date[idx];
+    state['now_dt'] = steps.now_dt[idx];
+    state['fluence'] = steps.fluence[idx].toFixed(2) + 'e9';
+    state['p3'] = (steps.p3[idx] === null) ? 'N/A' : steps.p3[idx].toFixed(0);
+    state['hrc'] = steps.hrc[idx].toFixed(0);
+    return state;
+}
+
 function setStateTable(idx) {
-    var state = data.states[idx]
+    var state = getState(idx)
     var keys = ['date', 'now_dt', 'simpos', 'pitch', 'ra', 'dec', 'roll',
                 'pcad_mode', 'si_mode', 'power_cmd', 'ccd_fep', 'vid_clock',
                 'fluence', 'p3', 'hrc'];
@@ -77,7 +104,7 @@ function updateTable(xPos, yPos) {
     var ax_x = data.ax_x
     var ax_y = [1 - data.ax_y[1], 1 - data.ax_y[0]]
     if ((x > ax_x[0]) && (x < ax_x[1]) && (y > ax_y[0]) && (y < ax_y[1])) {
-        var idx = Math.floor((x - ax_x[0]) / (ax_x[1] - ax_x[0]) * data.states.length);
+        var idx = Math.floor((x - ax_x[0]) / (ax_x[1] - ax_x[0]) * getNumStates());
         setStateTable(idx);
         moveVerticalLine(xPos, ytop + ax_y[0] * acePred.height)
     }
@@ -109,4 +136,16 @@ function initTimeLineHandlers() {
     document.getElementById('tl_p3_now').innerHTML = setNAToRed(data['p3_now'])
     document.getElementById('tl_hrc_now').innerHTML = data['hrc_now']
 
+    // Probability of reaching each fluence limit before the next radzone and the
+    // time until the crossing.  These are not in older timeline_states.js files.
+    var limits = ['yellow', 'red'];
+    for (var i=0; i<limits.length; i++) {
+        var keys = ['fluence_prob_' + limits[i], 'fluence_dt_' + limits[i]];
+        for (var j=0; j<keys.length; j++) {
+            var elem = document.getElementById('tl_' + keys[j]);
+            if (elem && (keys[j] in data)) {
+                elem.innerHTML = data[keys[j]];
+            }
+        }
+    }
 }
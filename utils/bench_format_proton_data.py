@@ -0,0 +1,114 @@
+"""Benchmark get_hrc.format_proton_data against the previous row-loop version.
+
+This builds a synthetic 7-day SWPC differential-protons payload (5-minute samples for
+each channel), checks that both versions give identical output and prints the timing
+of each.  Run from the repo root::
+
+  python utils/bench_format_proton_data.py
+"""
+
+import collections
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+from astropy.table import Table
+from astropy.time import Time
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+import get_hrc  # noqa: E402
+
+CHANNELS = ["P1", "P2A", "P2B", "P3", "P4", "P5", "P6", "P7", "P8A", "P8B", "P9"]
+DESCRS = (
+    [(name, "i8") for name in ("year", "month", "dom", "hhmm", "mjd", "secs")]
+    + [(f"p{ii}", "f8") for ii in range(1, 12)]
+    + [("hrc_shield", "f8"), ("time", "f8"), ("satellite", "i8")]
+)
+
+
+def format_proton_data_loop(dat, descrs):
+    """Previous implementation of get_hrc.format_proton_data (before vectorizing)."""
+    out = collections.defaultdict(dict)
+    for row in dat:
+        out[row["time_tag"]][row["channel"].lower()] = row["flux"] * 1000
+
+    newdat = Table(list(out.values())).filled(get_hrc.BAD_VALUE)
+    newdat["time_tag"] = list(out.keys())
+    newdat["satellite"] = dat["satellite"][0]
+
+    times = Time(newdat["time_tag"])
+    newdat["time"] = times.cxcsec
+    newdat["mjd"] = times.mjd.astype(int)
+    newdat["secs"] = np.array(
+        np.round((times.mjd - newdat["mjd"]) * 86400, decimals=0)
+    ).astype(int)
+    newdat["year"] = [t.year for t in times.datetime]
+    newdat["month"] = [t.month for t in times.datetime]
+    newdat["dom"] = [t.day for t in times.datetime]
+    newdat["hhmm"] = np.array(
+        [f"{t.hour}{t.minute:02}" for t in times.datetime]
+    ).astype(int)
+
+    arr = np.ndarray(len(newdat), dtype=descrs)
+    for col in arr.dtype.names:
+        if col not in newdat.colnames:
+            arr[col] = get_hrc.BAD_VALUE
+        else:
+            arr[col] = newdat[col]
+
+    arr["hrc_shield"] = get_hrc.calc_hrc_shield(arr)
+    hrc_bad = (arr["p5"] < 0) | (arr["p6"] < 0) | (arr["p7"] < 0)
+    arr["hrc_shield"][hrc_bad] = get_hrc.BAD_VALUE
+
+    return arr, hrc_bad
+
+
+def get_payload(days=7):
+    """Make a synthetic SWPC differential-protons table spanning ``days``."""
+    rng = np.random.default_rng(0)
+    times = Time("2024-11-10T00:00:00") + np.arange(days * 288) * 300 / 86400
+    time_tags = [date[:19] + "Z" for date in times.isot]
+    rows = [
+        {
+            "time_tag": time_tag,
+            "satellite": 18,
+            "flux": float(rng.lognormal()),
+            "energy": "",
+            "channel": channel,
+        }
+        for time_tag in time_tags
+        for channel in CHANNELS
+        # A few channel samples are missing in the real files
+        if rng.uniform() > 0.001
+    ]
+    return Table(rows)
+
+
+def main():
+    dat = get_payload()
+    descrs = np.dtype(DESCRS)
+    print(f"Payload: {len(dat)} records")
+
+    results = {}
+    for name, func in (
+        ("loop", format_proton_data_loop),
+        ("vectorized", get_hrc.format_proton_data),
+    ):
+        time0 = time.perf_counter()
+        results[name] = func(dat, descrs)
+        dt = time.perf_counter() - time0
+        results[name + "_dt"] = dt
+        print(f"{name:>12s}: {dt * 1000:8.1f} ms")
+
+    arr_loop, bad_loop = results["loop"]
+    arr_vec, bad_vec = results["vectorized"]
+    np.testing.assert_array_equal(bad_vec, bad_loop, err_msg="hrc_bad")
+    for col in descrs.names:
+        np.testing.assert_array_equal(arr_vec[col], arr_loop[col], err_msg=col)
+    print("Outputs identical")
+    print(f"Speedup: {results['loop_dt'] / results['vectorized_dt']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""Benchmark HDF5 storage codecs and chunk layouts for the ARC archives.
+
+For each combination of compression filter and chunkshape this writes an archive
+(synthetic GOES X-ray-like rows by default, or the rows of an existing archive with
+``--h5``) and measures:
+
+- append: median time for one fetch-script cycle, i.e. open the file with
+  ``arc_h5.H5Appender``, append a few rows, flush and close
+- read: median time of ``arc_h5.read_time_window`` for the last ``--days`` days
+- size: final file size
+
+Run from the repo root, e.g.::
+
+  python utils/bench_h5_storage.py
+  python utils/bench_h5_storage.py --h5 $SKA/data/arc3/GOES_X.h5 --n-rows 2000000
+
+The layout chosen from these results is ``arc_h5.FILTERS`` / ``arc_h5.CHUNKSHAPE`` and
+``migrate_h5.py`` rewrites existing archives into it.
+"""
+
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import tables
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+import arc_h5  # noqa: E402
+
+FILTERS = {
+    "zlib5": tables.Filters(complevel=5, complib="zlib"),
+    "lz4-5": tables.Filters(complevel=5, complib="blosc:lz4", shuffle=True),
+    "zstd5": tables.Filters(complevel=5, complib="blosc:zstd", shuffle=True),
+}
+# Rows per chunk (None is the PyTables default for expectedrows=2e7)
+CHUNKSHAPES = [None, 512, 2048, 8192, 32768]
+
+GOES_X_DTYPE = np.dtype(
+    [(name, "i8") for name in ("year", "month", "dom", "hhmm", "mjd", "secs")]
+    + [("short", "f8"), ("long", "f8"), ("ratio", "f8"), ("time", "f8")]
+    + [("satellite", "i8")]
+)
+
+
+def get_options():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--h5", help="Use the last --n-rows rows of this archive")
+    parser.add_argument(
+        "--n-rows",
+        type=int,
+        default=1_000_000,
+        help="Number of archive rows (default=1e6, about 2 years of GOES 1-min data)",
+    )
+    parser.add_argument(
+        "--n-appends", type=int, default=50, help="Number of append cycles"
+    )
+    parser.add_argument(
+        "--append-rows", type=int, default=5, help="Rows per append cycle"
+    )
+    parser.add_argument(
+        "--days", type=float, default=3.0, help="Recent window read (days)"
+    )
+    return parser.parse_args()
+
+
+def get_synthetic_rows(n_rows, dt=60.0):
+    """Make ``n_rows`` of GOES X-ray-like data at ``dt`` sec spacing."""
+    rng = np.random.default_rng(0)
+    dat = np.zeros(n_rows, dtype=GOES_X_DTYPE)
+    dat["time"] = 8.5e8 + np.arange(n_rows) * dt
+    mjd = 50814.0 + dat["time"] / 86400
+    dat["mjd"] = mjd.astype(int)
+    dat["secs"] = np.round((mjd - dat["mjd"]) * 86400)
+    dat["year"] = 2024
+    dat["month"] = 1 + (dat["mjd"] % 12)
+    dat["dom"] = 1 + (dat["mjd"] % 28)
+    dat["hhmm"] = (dat["secs"] // 3600) * 100 + (dat["secs"] % 3600) // 60
+    dat["long"] = 10 ** (-7 + np.cumsum(rng.normal(scale=0.01, size=n_rows)) % 3)
+    dat["short"] = dat["long"] * rng.lognormal(mean=-3, sigma=0.3, size=n_rows)
+    dat["ratio"] = dat["short"] / dat["long"]
+    dat["satellite"] = 16
+    return dat
+
+
+def get_archive_rows(h5_file, n_rows):
+    with tables.open_file(h5_file) as h5:
+        table = h5.root.data
+        return table.read(max(0, table.nrows - n_rows))
+
+
+def bench_layout(dat, filters, chunkshape, opt, tmpdir):
+    """Write ``dat`` with one layout and return (chunkshape, append_dt, read_dt, size_mb)."""
+    h5_file = Path(tmpdir, "bench.h5")
+    h5_file.unlink(missing_ok=True)
+
+    n_tail = opt.n_appends * opt.append_rows
+    with tables.open_file(h5_file, mode="w") as h5:
+        h5.create_table(
+            h5.root,
+            "data",
+            dat[:-n_tail],
+            "bench",
+            filters=filters,
+            expectedrows=2e7,
+            chunkshape=None if chunkshape is None else (chunkshape,),
+        )
+        actual_chunkshape = h5.root.data.chunkshape[0]
+
+    dts_append = []
+    for i0 in range(len(dat) - n_tail, len(dat), opt.append_rows):
+        time0 = time.perf_counter()
+        with arc_h5.H5Appender(h5_file, "bench") as appender:
+            appender.append(dat[i0 : i0 + opt.append_rows])
+        dts_append.append(time.perf_counter() - time0)
+
+    tstop = dat["time"][-1]
+    tstart = tstop - opt.days * 86400
+    dts_read = []
+    for _ in range(5):
+        time0 = time.perf_counter()
+        arc_h5.read_time_window(h5_file, tstart, tstop, ["time", "long"])
+        dts_read.append(time.perf_counter() - time0)
+
+    size_mb = h5_file.stat().st_size / 1e6
+    return actual_chunkshape, np.median(dts_append), np.median(dts_read), size_mb
+
+
+def main():
+    opt = get_options()
+    if opt.h5:
+        dat = get_archive_rows(opt.h5, opt.n_rows)
+    else:
+        dat = get_synthetic_rows(opt.n_rows)
+    print(f"{len(dat)} rows of {dat.dtype.itemsize} bytes")
+
+    print(
+        f"{'filters':>8s} {'chunkshape':>10s} {'append_ms':>10s} "
+        f"{'read_ms':>8s} {'size_MB':>8s}"
+    )
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for name, filters in FILTERS.items():
+            for chunkshape in CHUNKSHAPES:
+                # Suppress the "Appended N rows" output of H5Appender
+                stdout = sys.stdout
+                sys.stdout = open(Path(tmpdir, "stdout.txt"), "w")
+                try:
+                    result = bench_layout(dat, filters, chunkshape, opt, tmpdir)
+                finally:
+                    sys.stdout.close()
+                    sys.stdout = stdout
+                actual_chunkshape, dt_append, dt_read, size_mb = result
+                label = f"{actual_chunkshape}" + ("*" if chunkshape is None else "")
+                print(
+                    f"{name:>8s} {label:>10s} {dt_append * 1000:10.2f} "
+                    f"{dt_read * 1000:8.2f} {size_mb:8.1f}"
+                )
+    print("* PyTables default chunkshape")
+
+
+if __name__ == "__main__":
+    main()
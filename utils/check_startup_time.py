@@ -0,0 +1,121 @@
+"""Check the cold startup time of the ARC scripts against a budget.
+
+Each script is imported in a fresh interpreter (the median of ``--n-runs``) and this
+fails if:
+
+- the wall-clock time of ``python -c "import <script>"`` is over the budget for the
+  script in ``STARTUP_BUDGETS`` (times ``--scale``), or
+- any module in the ``DEFERRED_IMPORTS`` of the script was imported, i.e. a heavy
+  import was moved back to module level.
+
+Use ``<script>.py --profile-startup`` to see where the time goes.  Run from the repo
+root (exit status 1 on failure)::
+
+  python utils/check_startup_time.py
+  python utils/check_startup_time.py --scale=2 make_timeline
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+REPO_DIR = Path(__file__).parent.parent
+
+# Cold startup budget (secs) of each script on the HEAD linux servers
+STARTUP_BUDGETS = {
+    "make_timeline": 1.0,
+    "get_ace": 0.5,
+    "get_goes_x": 0.8,
+    "get_hrc": 0.8,
+    "plot_goes_x": 0.8,
+    "plot_hrc": 0.8,
+}
+
+CHECK_CODE = """
+import json, sys
+import {module}
+deferred = getattr({module}, "DEFERRED_IMPORTS", [])
+print(json.dumps([name for name in deferred if name in sys.modules]))
+"""
+
+
+def get_options():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "scripts",
+        nargs="*",
+        default=list(STARTUP_BUDGETS),
+        help="Script module names (default=all)",
+    )
+    parser.add_argument(
+        "--n-runs", type=int, default=3, help="Number of cold starts per script"
+    )
+    parser.add_argument(
+        "--scale",
+        type=float,
+        default=1.0,
+        help="Scale factor for the budgets (e.g. for a slower machine)",
+    )
+    return parser.parse_args()
+
+
+def check_script(module, n_runs):
+    """
+    Import ``module`` in ``n_runs`` fresh interpreters.
+
+    Returns
+    -------
+    dt : float
+        Median wall-clock time (secs)
+    loaded : list of str
+        Deferred modules that were imported
+    """
+    dts = []
+    for _ in range(n_runs):
+        time0 = time.perf_counter()
+        proc = subprocess.run(
+            [sys.executable, "-c", CHECK_CODE.format(module=module)],
+            cwd=REPO_DIR,
+            capture_output=True,
+            text=True,
+            check=False,
+        )
+        dts.append(time.perf_counter() - time0)
+        if proc.returncode != 0:
+            raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+    return np.median(dts), json.loads(proc.stdout)
+
+
+def main():
+    opt = get_options()
+    failures = []
+    print(f"{'script':>14s} {'secs':>6s} {'budget':>6s}")
+    for module in opt.scripts:
+        budget = STARTUP_BUDGETS.get(module, 1.0) * opt.scale
+        try:
+            dt, loaded = check_script(module, opt.n_runs)
+        except RuntimeError as err:
+            print(f"{module:>14s} import failed: {err}")
+            failures.append(module)
+            continue
+        print(f"{module:>14s} {dt:6.2f} {budget:6.2f}")
+        if dt > budget:
+            failures.append(module)
+            print(f"  over budget, see {module}.py --profile-startup")
+        if loaded:
+            failures.append(module)
+            print(f"  deferred modules imported at startup: {loaded}")
+
+    if failures:
+        print(f"FAIL: {sorted(set(failures))}")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()